@@ -1,4 +1,6 @@
 import os
+import math
+import time
 import ujson
 import traceback
 import logging
@@ -6,7 +8,9 @@ import asyncio
 from typing import List, Dict, Any
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
-from sqlalchemy import select, delete, func, desc
+from sqlalchemy import select, delete, func, desc, inspect, text
+from sqlalchemy import Table, Column, Integer, DateTime, DDL, Connection, Inspector
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy import create_engine
 from sqlalchemy import Engine
 from sqlalchemy.orm import sessionmaker
@@ -19,10 +23,15 @@ from app import dto
 
 logger = logging.getLogger(__name__)
 
+# Weight of new sample in latency moving average
+LATENCY_WEIGHT = 0.2
+
 class DataBase(object):
     _server: str = ""
     _engine: Engine = None
     _session: sessionmaker[Session] = None
+    latency: float = 0 # requests saving and pings latency moving average, in seconds
+    pinging: float | None = None # monotonic start of running ping
 
     def __init__(self):
         config_file = '/app/configs/database.json'
@@ -75,14 +84,87 @@ class DataBase(object):
         if self._engine:
             logger.info( 'DB: validate database' )
             models.Base.metadata.create_all( bind=self._engine, checkfirst=True )
+            await self.migrateDB()
             logger.info( 'DB: validated database' )
 
 
+    # Add columns which appeared in models after tables creation, existing columns are left as they are
+    async def migrateDB(self) -> None:
+        inspector = inspect( self._engine )
+        with self._engine.begin() as connection:
+            # priority of waiting requests, stored requests get normal priority
+            self.addColumn(
+                connection,
+                inspector,
+                models.DownloadRequest.__table__,
+                Column( 'priority', Integer, nullable=False, server_default=text( '0' ) )
+            )
+            # start of download, history written before it is unknown
+            self.addColumn(
+                connection,
+                inspector,
+                models.DownloadHistory.__table__,
+                Column( 'started', DateTime, nullable=True )
+            )
+
+
+    def addColumn(
+        self,
+        connection: Connection,
+        inspector:  Inspector,
+        table:      Table,
+        column:     Column
+    ) -> None:
+        existing = [ _column[ 'name' ] for _column in inspector.get_columns( table.name ) ]
+        if column.name in existing:
+            return
+
+        dialect = self._engine.dialect
+        table_name = dialect.identifier_preparer.format_table( table )
+        column_spec = CreateColumn( column ).compile( dialect=dialect )
+        logger.info( f'DB: add column {table.name}.{column.name}' )
+        connection.execute( DDL( f'ALTER TABLE {table_name} ADD COLUMN {column_spec}' ) )
+
+
     async def UpdateConfig(self) -> None:
         self.__init__()
         if self._engine:
             await self.Stop()
             await self.Start()
+
+
+    # Current latency, running ping which takes longer than average counts as sample already
+    def Latency(self) -> float:
+        if self.pinging is not None:
+            return max( self.latency, time.monotonic() - self.pinging )
+        return self.latency
+
+
+    # Sample latency by round trip, so average follows database when no requests are saved
+    async def Ping(self) -> None:
+        if self.pinging is not None or not self._engine:
+            return
+
+        self.pinging = time.monotonic()
+        try:
+            await asyncio.to_thread( self.ping )
+        except:
+            traceback.print_exc()
+        finally:
+            self.addLatency( time.monotonic() - self.pinging )
+            self.pinging = None
+
+
+    def ping(self) -> None:
+        with self._engine.connect() as connection:
+            connection.execute( text( 'SELECT 1' ) )
+
+
+    def addLatency(
+        self,
+        sample: float
+    ) -> None:
+        self.latency += ( sample - self.latency ) * LATENCY_WEIGHT
         
     
     #
@@ -94,20 +176,68 @@ class DataBase(object):
     ) -> models.DownloadRequest:
         logger.info('SaveDownloadRequest')
         logger.info(request)
-        
+
+        started = time.monotonic()
+        try:
+            # blocking insert runs in thread, so event loop keeps serving
+            return await asyncio.to_thread( self.saveDownloadRequest, request )
+        except OperationalError as e:
+            traceback.print_exc()
+            await asyncio.sleep( 1 )
+            return await self.SaveDownloadRequest( request )
+        except Exception as e:
+            raise e
+        finally:
+            self.addLatency( time.monotonic() - started )
+
+
+    def saveDownloadRequest(
+        self,
+        request: dto.DownloadRequest
+    ) -> models.DownloadRequest:
         session = self._session()
         try:
             db_request = models.DownloadRequest.from_dto( request )
             session.add( db_request )
             session.commit()
-            session.close()
             return db_request
+        finally:
+            session.close()
+
+
+    async def SaveDownloadRequests(
+        self,
+        requests: List[ dto.DownloadRequest ]
+    ) -> List[ models.DownloadRequest ]:
+        logger.info('SaveDownloadRequests: ' + str( len( requests ) ) )
+
+        if len( requests ) == 0:
+            return []
+
+        started = time.monotonic()
+        try:
+            return await asyncio.to_thread( self.saveDownloadRequests, requests )
         except OperationalError as e:
             traceback.print_exc()
             await asyncio.sleep( 1 )
-            return await self.SaveDownloadRequest( request )
+            return await self.SaveDownloadRequests( requests )
         except Exception as e:
             raise e
+        finally:
+            self.addLatency( time.monotonic() - started )
+
+
+    def saveDownloadRequests(
+        self,
+        requests: List[ dto.DownloadRequest ]
+    ) -> List[ models.DownloadRequest ]:
+        session = self._session()
+        try:
+            # all rows in one transaction, ids are returned in same order
+            db_requests = [ models.DownloadRequest.from_dto( request ) for request in requests ]
+            session.add_all( db_requests )
+            session.commit()
+            return db_requests
         finally:
             session.close()
 
@@ -165,6 +295,35 @@ class DataBase(object):
             session.close()
 
 
+    async def DeleteDownloadRequests(
+        self,
+        task_ids: List[ int ]
+    ) -> None:
+        if len( task_ids ) == 0:
+            return
+
+        session = self._session()
+        try:
+            session.execute(
+                delete(
+                    models.DownloadRequest
+                )
+                .where(
+                    models.DownloadRequest.task_id.in_( task_ids )
+                )
+            )
+            session.commit()
+            session.close()
+        except OperationalError as e:
+            traceback.print_exc()
+            await asyncio.sleep( 1 )
+            return await self.DeleteDownloadRequests( task_ids )
+        except Exception as e:
+            raise e
+        finally:
+            session.close()
+
+
     async def GetAllDownloadRequests( self ) -> List[ models.DownloadRequest ]:
         session = self._session()
         try:
@@ -304,11 +463,12 @@ class DataBase(object):
 
     async def AddDownloadHistory(
         self,
-        result: dto.DownloadResult
+        result:  dto.DownloadResult,
+        started: datetime | None = None
     ) -> models.DownloadHistory:
         session = self._session()
         try:
-            history = models.DownloadHistory.from_dto( result )
+            history = models.DownloadHistory.from_dto( result, started )
             session.add( history )
             session.commit()
             session.close()
@@ -316,7 +476,7 @@ class DataBase(object):
         except OperationalError as e:
             await asyncio.sleep( 1 )
             traceback.print_exc()
-            return await self.AddDownloadHistory( result )
+            return await self.AddDownloadHistory( result, started )
         except Exception as e:
             raise e
         finally:
@@ -348,6 +508,64 @@ class DataBase(object):
             raise e
         finally:
             session.close()
+
+
+    # Get average, p99 and count of successful downloads durations per site for last days, in seconds
+    async def GetSitesDurations(
+        self,
+        days: int = 7
+    ) -> Dict[ str, Dict[ str, float ] ]:
+        try:
+            return await asyncio.to_thread( self.getSitesDurations, days )
+        except OperationalError as e:
+            await asyncio.sleep( 1 )
+            traceback.print_exc()
+            return await self.GetSitesDurations( days )
+
+
+    def getSitesDurations(
+        self,
+        days: int
+    ) -> Dict[ str, Dict[ str, float ] ]:
+        session = self._session()
+        try:
+            duration = func.timestampdiff( text( 'SECOND' ), models.DownloadHistory.started, models.DownloadHistory.ended )
+            conditions = [
+                models.DownloadHistory.started != None,
+                models.DownloadHistory.status == variables.DownloaderStatus.DONE,
+                models.DownloadHistory.ended >= datetime.now() - timedelta( days=days ),
+            ]
+            query = session.execute(
+                select(
+                    models.DownloadHistory.site,
+                    func.count(),
+                    func.avg( duration ),
+                )
+                .where( *conditions )
+                .group_by( models.DownloadHistory.site )
+            )
+            durations: Dict[ str, Dict[ str, float ] ] = {}
+            for site, count, average in query.all():
+                if count == 0:
+                    continue
+                # p99 is taken by database, only one row of site is returned
+                p99 = session.execute(
+                    select( duration )
+                    .where( *conditions, models.DownloadHistory.site == site )
+                    .order_by( desc( duration ) )
+                    .limit( 1 )
+                    .offset( count - math.ceil( count * 0.99 ) )
+                ).scalar_one_or_none()
+                durations[ site ] = {
+                    'avg':   float( average or 0 ),
+                    'p99':   float( p99 or 0 ),
+                    'count': count,
+                }
+            return durations
+        finally:
+            session.close()
+
+
     #
 
 
@@ -2,20 +2,62 @@ from __future__ import annotations
 import os
 import asyncio
 import traceback
+import math
+import time
 import logging
 import shutil
+import dataclasses
 from datetime import datetime, timedelta
-from multiprocessing import Process, Queue
-from typing import List, Dict, Any
+from multiprocessing import Queue
+from typing import List, Dict, Set, Any
 from app import dto, variables
 from app.objects import DB, RD, IC
 from app.configs import GC, DC, QC
 from app import variables
 from app.variables import QueueWaitingTask
-from app.classes.downloader import start_downloader
+from app.classes.downloader import sweep_temp_cache, temp_cache_key, has_resources
+from app.classes.result_cache import ResultCache
+from app.classes.downloader_pool import DownloaderPool, DownloaderProcess, DownloaderInline
+from app.classes.results_channel import ResultsChannel
 
 logger = logging.getLogger( __name__ )
 
+# Safety net wake up of idle tasks runner, in seconds
+IDLE_WAKEUP = 60
+
+# Time budget of one group scheduling pass before yielding to other groups, in seconds
+GROUP_PASS_BUDGET = 0.1
+
+# Interval of event loop lag measuring, in seconds
+LAG_INTERVAL = 0.5
+
+# Interval of database latency sampling, in seconds
+DB_PING_INTERVAL = 5
+
+# Days of downloads history used for sites durations
+DURATIONS_DAYS = 7
+
+# Download duration of site without history, in seconds
+DEFAULT_DURATION = 300
+
+# Maximum requests in one batch
+BATCH_LIMIT = 100
+
+# Seconds to wait result of task after its process ended
+EXIT_GRACE = 2
+
+# Finished tasks remembered to drop their results arriving late
+FINISHED_LIMIT = 1000
+
+# Seconds between checks of running tasks timeouts
+WATCHDOG_INTERVAL = 30
+
+# Seconds after hard timeout given to downloader to stop and report by itself
+WATCHDOG_GRACE = 120
+
+# Seconds between measures of downloaders memory and host pressure
+GOVERNOR_INTERVAL = 5
+
 class DownloadsQueue():
     # base
     stop_queue:      bool = False
@@ -27,15 +69,29 @@ class DownloadsQueue():
     sites_with_auth: List[ str ] = []
     groups:          List[ str ] = []
     site_to_groups:  variables.QueueSitesGroups
+    proxies:         variables.QueueProxyPool
 
     # stats
     stats:           variables.QueueStats
+    admission:       variables.QueueAdmission
+    governor:        variables.QueueGovernor
+    durations:       Dict[ str, Dict[ str, float ] ]
     waiting:         variables.QueueWaiting
     running:         variables.QueueRunning
+    finished:        Dict[ int, bool ]
+    subscribers:     variables.QueueSubscribers
+    cache:           ResultCache
 
     # catchers
+    pool:            DownloaderPool
     statuses:        Queue
     results:         Queue
+    channel:         ResultsChannel
+
+    # scheduler
+    wakeup:          asyncio.Event
+    group_wakeups:   Dict[ str, asyncio.Event ]
+    group_runners:   Dict[ str, asyncio.Task ]
 
     def __init__( self, **kwargs ) -> None:
         self.stop_queue      = False
@@ -45,11 +101,24 @@ class DownloadsQueue():
         self.sites_with_auth = []
         self.groups          = []
         self.site_to_groups  = variables.QueueSitesGroups()
+        self.proxies         = variables.QueueProxyPool()
         self.stats           = variables.QueueStats()
+        self.admission       = variables.QueueAdmission()
+        self.governor        = variables.QueueGovernor()
+        self.durations       = {}
         self.waiting         = variables.QueueWaiting()
         self.running         = variables.QueueRunning()
-        self.statuses        = Queue()
-        self.results         = Queue()
+        self.finished        = {}
+        self.subscribers     = variables.QueueSubscribers()
+        self.cache           = ResultCache()
+        self.pool            = DownloaderPool()
+        # queues are shared with pool workers, so they are created by context of pool
+        self.statuses        = self.pool.context.Queue()
+        self.results         = self.pool.context.Queue()
+        self.channel         = ResultsChannel( self.statuses, self.results )
+        self.wakeup          = asyncio.Event()
+        self.group_wakeups   = {}
+        self.group_runners   = {}
 
     def __repr__( self ) -> str:
         return '<DownloadsQueue>'
@@ -64,12 +133,21 @@ class DownloadsQueue():
         try:
             await self.StartResults()
 
+            await self.pool.Start( self.statuses, self.results, self.taskLost )
+
             await self.StartTasks()
 
+            await self.cache.Start()
+
             if GC.restore_tasks:
                 await self.restoreTasks()
 
+            await self.updateDurations()
+
             asyncio.create_task( self.flushRunner() )
+            asyncio.create_task( self.lagRunner() )
+            asyncio.create_task( self.watchdogRunner() )
+            asyncio.create_task( self.governorRunner() )
             await asyncio.sleep( 0 )
 
         except KeyboardInterrupt:
@@ -88,6 +166,7 @@ class DownloadsQueue():
     async def StartResults(self) -> None:
         self.stopped_results = False
         self.stop_queue_results = False
+        await self.channel.Start()
         asyncio.create_task( self.resultsRunner() )
         await asyncio.sleep( 0 )
     #
@@ -96,20 +175,25 @@ class DownloadsQueue():
         self.stop_queue = True
         self.stop_queue_tasks = True
         self.stop_queue_results = True
+        self.wakeTasks()
+        await self.channel.Stop()
         while not self.stopped_results and not self.stopped_tasks:
             await asyncio.sleep( 0.1 )
+        await self.pool.Stop()
         self.statuses.close()
         self.results.close()
 
 
     async def StopTasks( self ) -> None:
         self.stop_queue_tasks = True
+        self.wakeTasks()
         while not self.stopped_tasks:
             await asyncio.sleep( 0.1 )
 
 
     async def StopResults( self ) -> None:
         self.stop_queue_results = True
+        await self.channel.Stop()
         while not self.stopped_results:
             await asyncio.sleep( 0.1 )
 
@@ -119,6 +203,7 @@ class DownloadsQueue():
     async def Close( self ) -> None:
         while not self.stopped_results and not self.stopped_tasks:
             await asyncio.sleep( 0.1 )
+        await self.pool.Stop()
         self.statuses.close()
         self.results.close()
 
@@ -130,6 +215,13 @@ class DownloadsQueue():
     async def UpdateConfig( self ) -> None:
         await self.setupGroups()
         await self.setupSites()
+        await self.stats.Reschedule()
+        self.pool.Maintain()
+        self.wakeTasks()
+
+
+    async def ExportCache( self ) -> Dict[ str, int ]:
+        return await self.cache.Export()
 
 
     async def ExportQueue( self ) -> Dict[ str, Any ]:
@@ -137,6 +229,8 @@ class DownloadsQueue():
             "stats":   await self.stats.Export(),
             "running": await self.running.Export(),
             "waiting": await self.waiting.Export(),
+            "subscribers": await self.subscribers.Export(),
+            "governor": self.governor.__export__(),
         }
 
         return result
@@ -221,6 +315,53 @@ class DownloadsQueue():
         return response
     
 
+    async def GetPosition(
+        self,
+        request: dto.DownloadPositionRequest,
+    ) -> dto.DownloadPositionResponse:
+        response = dto.DownloadPositionResponse( task_id=request.task_id )
+
+        task_id = request.task_id
+        primary_id = await self.subscribers.GetPrimary( task_id )
+        if primary_id is not None:
+            task_id = primary_id
+
+        running_task = await self.running.GetTask( task_id )
+        if running_task:
+            duration = self.durations.get( running_task.site, {} ).get( 'avg', DEFAULT_DURATION )
+            elapsed = ( datetime.now() - running_task.started ).total_seconds()
+            response.status = 'running'
+            response.group = running_task.group
+            response.site = running_task.site
+            response.eta = max( int( duration - elapsed ), 0 )
+            return response
+
+        waiting_task = await self.waiting.GetTask( task_id )
+        if not waiting_task:
+            return response
+
+        group_config = QC.groups[ waiting_task.group ] if waiting_task.group in QC.groups else None
+        priority_aging = group_config.priority_aging if group_config else 0
+
+        position = await self.waiting.GetPosition( task_id, priority_aging )
+        if not position:
+            return response
+
+        response.status = 'waiting'
+        response.group = waiting_task.group
+        response.site = waiting_task.site
+        response.group_position = position[ 'group_position' ]
+        response.group_total = position[ 'group_total' ]
+        response.site_position = position[ 'site_position' ]
+        response.site_total = position[ 'site_total' ]
+
+        starts_in, eta = await self.estimateTask( waiting_task.site, waiting_task.group, response.site_position )
+        response.starts_in = starts_in
+        response.eta = eta
+
+        return response
+
+
     async def GetLog(
         self,
         request: dto.DownloadLogRequest,
@@ -246,56 +387,75 @@ class DownloadsQueue():
         logger.info( 'DQ: received request:' + str( request ) )
         response = dto.DownloadResponse()
 
-        site_name = request.site
+        group_name = await self.checkTask( request, is_restore )
+
+        # insert can not be cancelled in its thread, so stored request is always enqueued,
+        # even if client stopped waiting
+        request = await asyncio.shield( self.storeTask( group_name, request ) )
         
-        group_name = await self.site_to_groups.GetSiteGroup( site_name, request.format )
-        if not group_name:
-            raise Exception( f'Не найдена конфигурация группы для сайта {site_name}' )
+        response.status = True
+        response.message = str( request.task_id )
 
-        site_config = QC.sites[ site_name ] if site_name in QC.sites else None
-        if not site_config:
-            raise Exception( f'Не найдена конфигурация для сайта {site_name}' )
+        return response
 
-        if site_config.force_proxy and not request.proxy:
-            allowed_proxies = await QC.proxies.GetInstances( site_config.excluded_proxy )
-            if not request.proxy and len( allowed_proxies ) == 0:
-                raise Exception( 'Сайт недоступен без прокси' )
-        
-        if request.proxy == '':
-            request.proxy = None
-        
-        can_be_added = await self.stats.GroupCanAdd( group_name )
-        if not can_be_added and not is_restore:
-            raise variables.QueueCheckException( 'Максимум ожидающих загрузок для группы' )
 
-        can_be_added = await self.stats.SiteCanAdd( site_name )
-        if not can_be_added and not is_restore:
-            raise variables.QueueCheckException( 'Максимум ожидающих загрузок для сайта' )
+    async def AddTasks(
+        self,
+        batch: dto.DownloadBatchRequest
+    ) -> dto.DownloadBatchResponse:
+        logger.info( 'DQ: received batch of ' + str( len( batch.requests ) ) + ' requests' )
 
-        can_be_added = await self.stats.UserCanAdd( request.user_id, site_name, group_name )
-        if not can_be_added and not is_restore:
-            raise variables.QueueCheckException( 'Максимум ожидающих загрузок для сайта/группы' )
-        
-        waiting_duplicate = await self.waiting.CheckDuplicate( group_name, request )
-        if waiting_duplicate and not is_restore:
-            raise variables.QueueCheckException( 'Такая загрузка уже добавлена в очередь' )
+        if len( batch.requests ) > BATCH_LIMIT:
+            raise variables.QueueCheckException( f'Максимум {BATCH_LIMIT} загрузок в пакете' )
 
-        running_duplicate = await self.running.CheckDuplicate( request )
-        if running_duplicate and not is_restore:
-            raise variables.QueueCheckException( 'Такая загрузка уже загружается' )
+        response = dto.DownloadBatchResponse(
+            results = [ dto.DownloadResponse() for _ in batch.requests ]
+        )
 
-        if request.task_id is None: # Maybe restoring task
+        # checking all requests in one pass, waiting slots are reserved right away,
+        # so limits apply to the batch as a whole
+        accepted: List[ tuple[ int, str, dto.DownloadRequest ] ] = []
+        fingerprints: Set[ tuple ] = set()
+        for index, request in enumerate( batch.requests ):
             try:
-                stored_request = await asyncio.wait_for( DB.SaveDownloadRequest( request ), timeout=5.0 )
-                request = stored_request.to_dto()
-            except:
-                raise Exception( "База данных недоступна или перегружена" )
+                group_name = await self.checkTask( request )
+
+                fingerprint = request.__fingerprint__()
+                if fingerprint in fingerprints:
+                    raise variables.QueueCheckException( 'Такая загрузка уже есть в пакете' )
+
+                await self.stats.AddWaiting( request.user_id, request.site, group_name )
+                fingerprints.add( fingerprint )
+                accepted.append( ( index, group_name, request ) )
+            except variables.QueueAdmissionException as e:
+                response.results[ index ].message = str( e )
+                response.retry_after = e.retry_after
+            except Exception as e:
+                response.results[ index ].message = str( e )
+
+        if len( accepted ) == 0:
+            return response
 
-        await self.stats.AddWaiting( request.user_id, site_name, group_name )
-        await self.waiting.AddTask( group_name, request )
-        
-        response.status = True
-        response.message = str( request.task_id )
+        # one multi-row insert for all accepted requests, it is not timed out,
+        # because committed rows can not be taken back from thread
+        try:
+            stored_requests = await DB.SaveDownloadRequests( [ request for _, _, request in accepted if request.task_id is None ] )
+        except:
+            traceback.print_exc()
+            for index, group_name, request in accepted:
+                await self.stats.RemoveWaiting( request.user_id, request.site, group_name )
+                response.results[ index ].message = 'База данных недоступна или перегружена'
+            return response
+
+        stored = iter( stored_requests )
+        for index, group_name, request in accepted:
+            if request.task_id is None:
+                request = next( stored ).to_dto()
+            await self.enqueueTask( group_name, request, True )
+
+            response.results[ index ].status = True
+            response.results[ index ].message = str( request.task_id )
+            response.results[ index ].task_id = request.task_id
 
         return response
 
@@ -307,18 +467,42 @@ class DownloadsQueue():
         logger.info( 'DQ: cancel task:' + str( cancel_request.model_dump() ) )
 
         try:
-            request = await DB.GetDownloadRequest( cancel_request.task_id )
+            # subscriber just leaves download of its primary task
+            subscriber = await self.cancelSubscriber( cancel_request.task_id )
+            if subscriber != None:
+                await DB.DeleteDownloadRequest( cancel_request.task_id )
+                return dto.DownloadCancelResponse.model_validate( subscriber, from_attributes=True )
+
+            # other format leaves launch of its primary task
+            extra = await self.cancelExtra( cancel_request.task_id )
+            if extra != None:
+                await DB.DeleteDownloadRequest( cancel_request.task_id )
+                return dto.DownloadCancelResponse.model_validate( extra, from_attributes=True )
+
+            # running primary keeps downloading for its subscribers and other formats
+            running_task = await self.running.GetTask( cancel_request.task_id )
+            if running_task != None and await self.hasRecipients( running_task.task_id ):
+                await self.subscribers.Detach( running_task.task_id )
+                await DB.DeleteDownloadRequest( cancel_request.task_id )
+                return dto.DownloadCancelResponse.model_validate( running_task.request, from_attributes=True )
 
             waiting_task = await self.waiting.RemoveTask( cancel_request.task_id )
             if waiting_task != None:
                 await self.stats.RemoveWaiting( waiting_task.user_id, waiting_task.site, waiting_task.group )
+                await self.promoteSubscriber( waiting_task.group, waiting_task.task_id )
 
-            running_task = await self.running.RemoveTask( cancel_request.task_id )
-            if running_task != None:
-                await self.stats.RemoveRun( running_task.user_id, running_task.site, running_task.group, running_task.proxy )
+            running_task = await self.stopTask( cancel_request.task_id )
+
+            # task is not in memory, look at stored requests
+            request = None
+            if waiting_task == None and running_task == None:
+                request = await DB.GetDownloadRequest( cancel_request.task_id )
 
             await DB.DeleteDownloadRequest( cancel_request.task_id )
 
+            if waiting_task != None or running_task != None:
+                self.wakeTasks()
+
             if waiting_task != None:
                 return dto.DownloadCancelResponse.model_validate( waiting_task.request, from_attributes=True )
             if running_task != None:
@@ -331,6 +515,103 @@ class DownloadsQueue():
             return None
 
 
+    async def GetUserTasks(
+        self,
+        user_request: dto.DownloadUserRequest
+    ) -> dto.DownloadUserTasksResponse:
+        response = dto.DownloadUserTasksResponse()
+
+        running_tasks = await self.running.UserGetTasks( user_request.user_id )
+        for task in sorted( running_tasks, key=lambda task: task.started ):
+            response.tasks.append( dto.DownloadUserTask(
+                task_id = task.task_id,
+                status  = 'running',
+                site    = task.site,
+                group   = task.group,
+                url     = task.url,
+                message = task.status
+            ) )
+
+        waiting_tasks = await self.waiting.UserGetTasks( user_request.user_id )
+        for task in sorted( waiting_tasks, key=lambda task: task.order_key ):
+            response.tasks.append( dto.DownloadUserTask(
+                task_id = task.task_id,
+                status  = 'waiting',
+                site    = task.site,
+                group   = task.group,
+                url     = task.url
+            ) )
+
+        # subscriptions share state of primary task
+        subscriptions = await self.subscribers.UserGetRequests( user_request.user_id )
+        for request in sorted( subscriptions, key=lambda request: request.task_id ):
+            primary_id = await self.subscribers.GetPrimary( request.task_id )
+            primary = await self.running.GetTask( primary_id ) or await self.waiting.GetTask( primary_id )
+            if primary is None:
+                continue
+            response.tasks.append( dto.DownloadUserTask(
+                task_id = request.task_id,
+                status  = 'running' if isinstance( primary, variables.QueueRunningTask ) else 'waiting',
+                site    = primary.site,
+                group   = primary.group,
+                url     = request.url,
+                message = primary.status if isinstance( primary, variables.QueueRunningTask ) else ''
+            ) )
+
+        return response
+
+
+    async def CancelUserTasks(
+        self,
+        user_request: dto.DownloadUserRequest
+    ) -> dto.DownloadUserCancelResponse:
+        logger.info( 'DQ: cancel user tasks:' + str( user_request.model_dump() ) )
+        response = dto.DownloadUserCancelResponse()
+
+        requests: List[ dto.DownloadRequest ] = []
+
+        subscriptions = await self.subscribers.UserGetRequests( user_request.user_id )
+        for subscription in subscriptions:
+            subscriber = await self.cancelSubscriber( subscription.task_id ) or await self.cancelExtra( subscription.task_id )
+            if subscriber != None:
+                requests.append( subscriber )
+
+        waiting_tasks = await self.waiting.UserGetTasks( user_request.user_id )
+        for task in waiting_tasks:
+            await self.waiting.RemoveTask( task.task_id )
+            await self.stats.RemoveWaiting( task.user_id, task.site, task.group )
+            await self.promoteSubscriber( task.group, task.task_id )
+            requests.append( task.request )
+
+        # running primaries with subscribers are detached instead of termination
+        running_ids: List[ int ] = []
+        running_tasks = await self.running.UserGetTasks( user_request.user_id )
+        for task in running_tasks:
+            if await self.hasRecipients( task.task_id ):
+                await self.subscribers.Detach( task.task_id )
+                requests.append( task.request )
+            else:
+                running_ids.append( task.task_id )
+
+        running_tasks = await self.running.RemoveTasks( running_ids )
+        for task in running_tasks:
+            await self.stats.RemoveRun( task.user_id, task.site, task.group, task.proxy )
+            await self.proxies.RemoveRun( task.proxy )
+            await self.subscribers.RemovePrimary( task.task_id )
+            requests.append( task.request )
+
+        if len( requests ) == 0:
+            return response
+
+        await DB.DeleteDownloadRequests( [ request.task_id for request in requests ] )
+        self.wakeTasks()
+
+        for request in requests:
+            response.tasks.append( dto.DownloadCancelResponse.model_validate( request, from_attributes=True ) )
+
+        return response
+
+
     async def ClearFolder(
         self,
         clear_request: dto.DownloadClearRequest
@@ -351,6 +632,488 @@ class DownloadsQueue():
 
 
     ### PRIVATE METHODS
+
+    # Save new request and put it to queue, returns stored request
+    async def storeTask(
+        self,
+        group_name: str,
+        request:    dto.DownloadRequest
+    ) -> dto.DownloadRequest:
+        if request.task_id is None: # Maybe restoring task
+            try:
+                stored_request = await DB.SaveDownloadRequest( request )
+                request = stored_request.to_dto()
+            except:
+                raise Exception( "База данных недоступна или перегружена" )
+
+        await self.enqueueTask( group_name, request )
+        return request
+
+    # Put stored request to waiting queue, or subscribe it to running/waiting download of same content
+    async def enqueueTask(
+        self,
+        group_name: str,
+        request:    dto.DownloadRequest,
+        reserved:   bool = False
+    ) -> None:
+        # stored request is loaded from database without canonical url
+        self.canonicalizeRequest( request )
+
+        # same content was downloaded recently, downloader is not needed
+        cached_result = await self.cache.Get( request )
+        if cached_result is not None:
+            if reserved:
+                await self.stats.RemoveWaiting( request.user_id, request.site, group_name )
+            logger.info( f'DQ: task {request.task_id} result taken from cache' )
+            asyncio.create_task( self.cachedDone( request, cached_result ) )
+            return
+
+        primary_id = await self.subscribers.Find( request )
+        if primary_id is not None and await self.subscribers.Subscribe( primary_id, request ):
+            await self.userOnlyWaiting( group_name, request, reserved )
+            logger.info( f'DQ: task {request.task_id} subscribed to task {primary_id}' )
+            return
+
+        # other format of same source is waiting, both formats are fetched in one launch
+        source_id = await self.subscribers.FindSource( request )
+        if source_id is not None and await self.canJoinLaunch( source_id, group_name, request ):
+            await self.subscribers.AddExtra( source_id, request )
+            await self.subscribers.AddPrimary( request )
+            await self.userOnlyWaiting( group_name, request, reserved )
+            logger.info( f'DQ: task {request.task_id} joined launch of task {source_id}' )
+            return
+
+        if not reserved:
+            await self.stats.AddWaiting( request.user_id, request.site, group_name )
+        await self.waiting.AddTask( group_name, request )
+        await self.subscribers.AddPrimary( request )
+        await self.subscribers.AddSource( request )
+        self.wakeGroup( group_name )
+
+    # Subscribers and extra formats do not take group and site slots, only counted for their users
+    async def userOnlyWaiting(
+        self,
+        group_name: str,
+        request:    dto.DownloadRequest,
+        reserved:   bool = False
+    ) -> None:
+        if reserved:
+            await self.stats.GroupRemoveWaiting( group_name )
+            await self.stats.SiteRemoveWaiting( request.site )
+        else:
+            await self.stats.UserAddWaiting( request.user_id, request.site, group_name )
+
+    # Turn request counted only for its user into waiting task
+    async def activateTask(
+        self,
+        group_name: str,
+        request:    dto.DownloadRequest
+    ) -> None:
+        await self.stats.GroupAddWaiting( group_name )
+        await self.stats.SiteAddWaiting( request.site )
+        await self.waiting.AddTask( group_name, request )
+        await self.subscribers.AddSource( request )
+        self.wakeGroup( group_name )
+
+    # Get downloader name of site in group
+    def taskDownloader(
+        self,
+        site_name:  str,
+        group_name: str
+    ) -> str:
+        site_downloader = QC.sites[ site_name ].downloader if site_name in QC.sites else ''
+        group_downloader = QC.groups[ group_name ].downloader if group_name in QC.groups else ''
+        return site_downloader or group_downloader
+
+    # Check request format can be written by launch of waiting task
+    async def canJoinLaunch(
+        self,
+        primary_id: int,
+        group_name: str,
+        request:    dto.DownloadRequest
+    ) -> bool:
+        primary = await self.waiting.GetTask( primary_id )
+        if primary is None:
+            return False
+
+        downloader_name = self.taskDownloader( primary.site, primary.group )
+        if not downloader_name or downloader_name != self.taskDownloader( request.site, group_name ):
+            return False
+        if downloader_name not in DC.downloaders:
+            return False
+
+        # formats with own arguments are downloaded differently
+        format_args = DC.downloaders[ downloader_name ].format_args
+        return request.format not in format_args and primary.request.format not in format_args
+
+    # Put other formats back to queue when their launch did not deliver them
+    async def requeueExtras(
+        self,
+        primary_id: int
+    ) -> None:
+        for request in await self.subscribers.PopExtras( primary_id ):
+            group_name = await self.site_to_groups.GetSiteGroup( request.site, request.format )
+            if not group_name:
+                logger.info( f'DQ: task {request.task_id} can not be requeued, no group' )
+                continue
+            logger.info( f'DQ: task {request.task_id} requeued from launch of task {primary_id}' )
+            await self.activateTask( group_name, request )
+
+    # Finish task with cached result
+    async def cachedDone(
+        self,
+        request: dto.DownloadRequest,
+        result:  dto.DownloadResult
+    ) -> None:
+        try:
+            await DB.SaveDownloadResult( result )
+            await DB.DeleteDownloadRequest( request.task_id )
+            await DB.AddDownloadHistory( result )
+        except:
+            traceback.print_exc()
+
+        # site was not contacted, so its stats are left as they are
+        await self.sendFiles( result, False )
+
+    # Make first subscriber ( or first other format ) of cancelled waiting task new waiting task
+    async def promoteSubscriber(
+        self,
+        group_name: str,
+        task_id:    int
+    ) -> None:
+        await self.subscribers.RemoveSource( task_id )
+        extras = await self.subscribers.PopExtras( task_id )
+
+        request = await self.subscribers.Promote( task_id )
+        if request is None and len( extras ) > 0:
+            request = extras.pop( 0 )
+            group_name = await self.site_to_groups.GetSiteGroup( request.site, request.format ) or group_name
+        if request is None:
+            return
+
+        await self.activateTask( group_name, request )
+        for extra in extras:
+            await self.subscribers.AddExtra( request.task_id, extra )
+
+    # Remove subscriber from its primary task
+    async def cancelSubscriber(
+        self,
+        task_id: int
+    ) -> dto.DownloadRequest | None:
+        primary_id = await self.subscribers.GetPrimary( task_id )
+        request = await self.subscribers.Unsubscribe( task_id )
+        if request is None:
+            return None
+
+        group_name = await self.site_to_groups.GetSiteGroup( request.site, request.format )
+        if group_name:
+            await self.stats.UserRemoveWaiting( request.user_id, request.site, group_name )
+
+        # nobody waits for cancelled primary anymore
+        if await self.subscribers.IsDetached( primary_id ) and not await self.hasRecipients( primary_id ):
+            if await self.subscribers.IsExtra( primary_id ):
+                await self.cancelExtra( primary_id )
+            else:
+                await self.stopTask( primary_id )
+
+        return request
+
+    # Remove other format from its launch
+    async def cancelExtra(
+        self,
+        task_id: int
+    ) -> dto.DownloadRequest | None:
+        if not await self.subscribers.IsExtra( task_id ):
+            return None
+
+        request = await self.subscribers.GetRequest( task_id )
+        primary_id = await self.subscribers.GetPrimary( task_id )
+
+        # other format is still delivered to its subscribers
+        if await self.subscribers.HasSubscribers( task_id ):
+            await self.subscribers.Detach( task_id )
+            return request
+
+        await self.subscribers.RemoveExtra( task_id )
+        await self.subscribers.RemovePrimary( task_id )
+
+        group_name = await self.site_to_groups.GetSiteGroup( request.site, request.format )
+        if group_name:
+            await self.stats.UserRemoveWaiting( request.user_id, request.site, group_name )
+
+        # launch already writes this format
+        if await self.running.Exists( primary_id ):
+            await self.subscribers.Drop( task_id )
+
+        return request
+
+    # Check somebody except its own user waits for result of task
+    async def hasRecipients(
+        self,
+        task_id: int
+    ) -> bool:
+        return await self.subscribers.HasSubscribers( task_id ) or await self.subscribers.HasExtras( task_id )
+
+    # Terminate running task and release its slots
+    async def stopTask(
+        self,
+        task_id: int
+    ) -> variables.QueueRunningTask | None:
+        running_task = await self.running.RemoveTask( task_id )
+        if running_task != None:
+            await self.stats.RemoveRun( running_task.user_id, running_task.site, running_task.group, running_task.proxy )
+            await self.proxies.RemoveRun( running_task.proxy )
+            await self.subscribers.RemovePrimary( task_id )
+            await self.requeueExtras( task_id )
+            self.wakeTasks()
+        return running_task
+
+    # Copy result of primary task for subscriber, files are hardlinked into subscriber folders
+    async def subscriberResult(
+        self,
+        result:  dto.DownloadResult,
+        request: dto.DownloadRequest
+    ) -> dto.DownloadResult:
+        paths = [ result.cover, result.thumb ] + list( result.files )
+        paths = await asyncio.to_thread( self.linkFiles, result.task_id, request.task_id, paths )
+
+        return result.model_copy(
+            update = {
+                'task_id':    request.task_id,
+                'user_id':    request.user_id,
+                'web_id':     request.web_id,
+                'chat_id':    request.chat_id,
+                'message_id': request.message_id,
+                'cover':      paths[ 0 ],
+                'thumb':      paths[ 1 ],
+                'files':      paths[ 2: ],
+            }
+        )
+
+    # Link files of task folders into folders of other task
+    def linkFiles(
+        self,
+        src_task_id: int,
+        dst_task_id: int,
+        paths:       List[ str ]
+    ) -> List[ str ]:
+        linked: List[ str ] = []
+        for path in paths:
+            linked_path = path
+            for folder in [ DC.save_folder, DC.arch_folder ]:
+                src_folder = os.path.join( folder, str( src_task_id ) )
+                if not path or not str( path ).startswith( src_folder + os.sep ):
+                    continue
+                linked_path = os.path.join( folder, str( dst_task_id ), os.path.relpath( path, src_folder ) )
+                try:
+                    os.makedirs( os.path.dirname( linked_path ), exist_ok=True )
+                    if not os.path.exists( linked_path ):
+                        try:
+                            os.link( path, linked_path )
+                        except OSError:
+                            shutil.copy2( path, linked_path )
+                except:
+                    traceback.print_exc()
+                    linked_path = path
+                break
+            linked.append( linked_path )
+        return linked
+
+    # Set canonical site and url of request, so duplicates, coalescing and cache match same books,
+    # canonical url is only a key, downloader gets url of request as it was sent
+    def canonicalizeRequest(
+        self,
+        request: dto.DownloadRequest
+    ) -> None:
+        request.canonical_url = None
+
+        site_config = QC.sites[ request.site ] if request.site in QC.sites else None
+        if not site_config:
+            return
+
+        if site_config.url.site and site_config.url.site in QC.sites:
+            request.site = site_config.url.site
+            site_config = QC.sites[ request.site ]
+
+        url = site_config.url.Canonicalize( request.url )
+        if url != request.url.strip():
+            logger.info( 'DQ: canonical url ' + request.url + ' -> ' + url )
+            request.canonical_url = url
+
+    # Validate request against configs, limits and duplicates, returns group of request
+    async def checkTask(
+        self,
+        request: dto.DownloadRequest,
+        is_restore: bool = False
+    ) -> str:
+        self.canonicalizeRequest( request )
+
+        site_name = request.site
+        
+        group_name = await self.site_to_groups.GetSiteGroup( site_name, request.format )
+        if not group_name:
+            raise Exception( f'Не найдена конфигурация группы для сайта {site_name}' )
+
+        site_config = QC.sites[ site_name ] if site_name in QC.sites else None
+        if not site_config:
+            raise Exception( f'Не найдена конфигурация для сайта {site_name}' )
+
+        if site_config.force_proxy and not request.proxy:
+            allowed_proxies = await QC.proxies.GetInstances( site_config.excluded_proxy )
+            if not request.proxy and len( allowed_proxies ) == 0:
+                raise Exception( 'Сайт недоступен без прокси' )
+        
+        if request.proxy == '':
+            request.proxy = None
+        
+        if not is_restore:
+            retry_after = await self.admission.Check(
+                group_name,
+                await self.stats.GroupWaiting( group_name ),
+                DB.Latency(),
+                GC.admission
+            )
+            if retry_after is not None:
+                raise variables.QueueAdmissionException( f'Очередь перегружена, повторите через {retry_after} сек.', retry_after )
+
+        can_be_added = await self.stats.GroupCanAdd( group_name )
+        if not can_be_added and not is_restore:
+            raise variables.QueueCheckException( 'Максимум ожидающих загрузок для группы' )
+
+        can_be_added = await self.stats.SiteCanAdd( site_name )
+        if not can_be_added and not is_restore:
+            raise variables.QueueCheckException( 'Максимум ожидающих загрузок для сайта' )
+
+        can_be_added = await self.stats.UserCanAdd( request.user_id, site_name, group_name )
+        if not can_be_added and not is_restore:
+            raise variables.QueueCheckException( 'Максимум ожидающих загрузок для сайта/группы' )
+        
+        waiting_duplicate = await self.waiting.CheckDuplicate( group_name, request )
+        if waiting_duplicate and not is_restore:
+            raise variables.QueueCheckException( 'Такая загрузка уже добавлена в очередь' )
+
+        running_duplicate = await self.running.CheckDuplicate( request )
+        if running_duplicate and not is_restore:
+            raise variables.QueueCheckException( 'Такая загрузка уже загружается' )
+
+        subscribed_duplicate = await self.subscribers.CheckDuplicate( request )
+        if subscribed_duplicate and not is_restore:
+            raise variables.QueueCheckException( 'Такая загрузка уже добавлена в очередь' )
+
+        return group_name
+
+    # Estimate seconds to start and to finish of task at site position
+    async def estimateTask(
+        self,
+        site_name:     str,
+        group_name:    str,
+        site_position: int
+    ) -> tuple[ int, int ]:
+        duration = self.durations.get( site_name, {} ).get( 'avg', DEFAULT_DURATION )
+
+        site_config = QC.sites[ site_name ] if site_name in QC.sites else None
+        group_config = QC.groups[ group_name ] if group_name in QC.groups else None
+        proxies = max( len( await self.proxies.GetSiteProxies( site_name ) ), 1 )
+
+        # simultaneously running tasks of site
+        slots = 0
+        delay = 0
+        if site_config:
+            if site_config.max_one_time > 0:
+                slots = site_config.max_one_time
+            elif site_config.one_time > 0:
+                slots = site_config.one_time * proxies
+            delay = site_config.delay
+        if group_config and group_config.max_one_time > 0:
+            slots = min( slots, group_config.max_one_time ) if slots > 0 else group_config.max_one_time
+        if slots <= 0:
+            slots = site_position + 1
+
+        # tasks which have to finish before task can start
+        running = 0
+        if site_name in self.stats.sites:
+            running = await self.stats.sites[ site_name ].GetRunning()
+        busy = max( running + site_position + 1 - slots, 0 )
+
+        starts_in = math.ceil( busy / slots ) * duration
+        starts_in = max( starts_in, site_position * delay / proxies )
+
+        return int( starts_in ), int( starts_in + duration )
+
+    # Stall and hard timeouts of task, hard timeout follows p99 of site durations
+    def taskTimeouts(
+        self,
+        site_name:  str,
+        group_name: str
+    ) -> tuple[ int, int ]:
+        site_config = QC.sites[ site_name ] if site_name in QC.sites else None
+        group_config = QC.groups[ group_name ] if group_name in QC.groups else None
+
+        stall_timeout = GC.watchdog.stall_timeout
+        timeout = 0
+        for config in [ group_config, site_config ]:
+            if config and config.stall_timeout > 0:
+                stall_timeout = config.stall_timeout
+            if config and config.timeout > 0:
+                timeout = config.timeout
+        if timeout > 0:
+            return stall_timeout, timeout
+
+        durations = self.durations.get( site_name, {} )
+        if durations.get( 'count', 0 ) >= GC.watchdog.min_samples:
+            timeout = int( durations[ 'p99' ] * GC.watchdog.timeout_factor )
+            timeout = max( timeout, GC.watchdog.min_timeout )
+            if GC.watchdog.max_timeout > 0:
+                timeout = min( timeout, GC.watchdog.max_timeout )
+        else:
+            timeout = GC.watchdog.max_timeout
+
+        return stall_timeout, timeout
+
+    # Resources profile of group, None when group does not set anything
+    def taskResources(
+        self,
+        group_name: str
+    ) -> variables.QueueConfigResources | None:
+        group_config = QC.groups[ group_name ] if group_name in QC.groups else None
+        if not group_config or not has_resources( group_config.resources ):
+            return None
+        return dataclasses.replace( group_config.resources )
+
+    # Cpus of downloaders, which are not reserved for queue
+    def taskCpus( self ) -> List[ int ]:
+        if GC.executor.reserved_cpus <= 0:
+            return []
+        cpus = sorted( os.sched_getaffinity( 0 ) )
+        if len( cpus ) <= GC.executor.reserved_cpus:
+            return []
+        return cpus[ GC.executor.reserved_cpus: ]
+
+    # Reload sites downloads durations from history
+    async def updateDurations( self ) -> None:
+        try:
+            self.durations = await DB.GetSitesDurations( DURATIONS_DAYS )
+        except:
+            traceback.print_exc()
+
+    # Wake up tasks runner and all groups to check waiting tasks
+    def wakeTasks( self ) -> None:
+        self.wakeup.set()
+        self.wakeGroups()
+
+    # Wake up all groups runners
+    def wakeGroups( self ) -> None:
+        for wakeup in self.group_wakeups.values():
+            wakeup.set()
+
+    # Wake up group runner to check its waiting tasks
+    def wakeGroup(
+        self,
+        group_name: str
+    ) -> None:
+        ok: bool = group_name in self.group_wakeups
+        if ok:
+            self.group_wakeups[ group_name ].set()
     
     async def restoreTasks( self ) -> None:
         logger.info( 'DQ: restoreTasks started' )
@@ -397,6 +1160,15 @@ class DownloadsQueue():
                                     os.unlink( element )
 
     
+    # Remove old and least recently used shared temp folders
+    async def clearTempCache( self ) -> None:
+        if not DC.temp_cache.enabled:
+            return
+        try:
+            await asyncio.to_thread( sweep_temp_cache, DC.temp_folder, DC.temp_cache.max_size, DC.temp_cache.max_age )
+        except:
+            traceback.print_exc()
+
     #
 
     async def flushRunner( self ) -> None:
@@ -407,7 +1179,12 @@ class DownloadsQueue():
                 self.tasks_pause = True
                 await self.stats.Flush()
                 await self.clearSpecialFolders()
+                await self.cache.Flush()
+                await self.clearTempCache()
+                await self.updateDurations()
+                self.pool.Maintain()
                 self.tasks_pause = False
+                self.wakeTasks()
             except:
                 traceback.print_exc()
             if self.stop_queue:
@@ -415,31 +1192,77 @@ class DownloadsQueue():
         logger.info( 'DQ: flushRunner started' )
 
 
-    async def resultsRunner( self ) -> None:
-        logger.info( 'DQ: resultsRunner started' )
-        while True:
-            await asyncio.sleep(1)
+    # Measure event loop lag and database latency for admission control
+    async def lagRunner( self ) -> None:
+        logger.info( 'DQ: lagRunner started' )
+        pinged = time.monotonic()
+        while not self.stop_queue:
+            started = time.monotonic()
+            await asyncio.sleep( LAG_INTERVAL )
+            await self.admission.UpdateLoopLag( time.monotonic() - started - LAG_INTERVAL )
+            # ping runs aside, slow database must not look like event loop lag
+            if time.monotonic() - pinged >= DB_PING_INTERVAL:
+                pinged = time.monotonic()
+                asyncio.create_task( DB.Ping() )
+        logger.info( 'DQ: lagRunner stopped' )
+
+
+    # Stop running tasks which downloader did not stop after hard timeout
+    async def watchdogRunner( self ) -> None:
+        logger.info( 'DQ: watchdogRunner started' )
+        while not self.stop_queue:
+            await asyncio.sleep( WATCHDOG_INTERVAL )
             try:
-                while not self.results.empty():
-                    json_result = self.results.get()
-
-                    await self.taskDone( dto.DownloadResult( **json_result ) )
-
-                    if self.stop_queue_results:
-                        break
-
-                while not self.statuses.empty():
-                    json_status = self.statuses.get()
-
-                    await self.taskStatus( dto.DownloadStatus( **json_status ) )
+                now = datetime.now()
+                for running_task in list( self.running.tasks.values() ):
+                    if running_task.timeout <= 0:
+                        continue
+                    if ( now - running_task.started ).total_seconds() < running_task.timeout + WATCHDOG_GRACE:
+                        continue
+                    logger.warning( f'DQ: task {running_task.task_id} exceeded timeout {running_task.timeout}' )
+                    # failure is reported aside and process is terminated, then killed in background,
+                    # so hung downloader does not hold checks of other tasks
+                    asyncio.create_task( self.taskFailed( running_task, f'Превышено время загрузки: {running_task.timeout} сек.', True ) )
+            except:
+                traceback.print_exc()
+        logger.info( 'DQ: watchdogRunner stopped' )
 
-                    if self.stop_queue_results:
-                        break
 
+    # Measure running downloaders and host, held starts are retried after measure
+    async def governorRunner( self ) -> None:
+        logger.info( 'DQ: governorRunner started' )
+        while not self.stop_queue:
+            try:
+                pids = []
+                for running_task in list( self.running.tasks.values() ):
+                    pid = running_task.proc.Pid() if running_task.proc else None
+                    if pid:
+                        pids.append( pid )
+                await self.governor.Measure( pids )
+                if await self.governor.PopHeld():
+                    self.wakeTasks()
             except:
                 traceback.print_exc()
+            await asyncio.sleep( GOVERNOR_INTERVAL )
+        logger.info( 'DQ: governorRunner stopped' )
+
+
+    # Handle results and statuses as soon as workers send them
+    async def resultsRunner( self ) -> None:
+        logger.info( 'DQ: resultsRunner started' )
+        while True:
+            item = await self.channel.Get()
             if self.stop_queue_results:
                 break
+            try:
+                if isinstance( item, dto.DownloadResult ):
+                    await self.taskDone( item )
+                elif isinstance( item, dto.DownloadStatus ):
+                    await self.taskStatus( item )
+            except:
+                traceback.print_exc()
+            finally:
+                self.channel.Done( item )
         self.stopped_results = True
         logger.info('DQ: resultsRunner stopped')
 
@@ -447,86 +1270,256 @@ class DownloadsQueue():
     async def tasksRunner( self ) -> None:
         logger.info('DQ: tasksRunner started')
         while True:
-            await asyncio.sleep(1)
             try:
-                if self.tasks_pause:
-                    await asyncio.sleep(1)
-                    continue
-                for group_name in self.groups:
-                    try:
-                        wg_exists = await self.waiting.GroupExists( group_name )
-                        if wg_exists:
-
-                            # preventive skip empty group
-                            tasks = await self.waiting.GroupGetTasks( group_name )
-                            if len(tasks) == 0:
-                                continue
-
-                            # preventive skip group
-                            if not await self.stats.GroupCanStart( group_name ):
-                                # logger.info( f'DQ: group {group_name} can\'t run' )
-                                continue
-
-                            # go over waiting tasks
-                            for task in tasks:
-
-                                site_name = task.request.site
-
-                                if site_name in QC.sites:
-                                    
-                                    site_config = QC.sites[ site_name ]
-                                
-                                    allowed_proxies = []
-
-                                    if task.request.proxy:
-                                        allowed_proxies = [ task.request.proxy ]
-
-                                    else:
-                                        if site_config.use_proxy or site_config.force_proxy:
-                                            allowed_proxies = await QC.proxies.GetInstances( site_config.excluded_proxy )
-                                            if not site_config.force_proxy:
-                                                allowed_proxies.append( '' )
-                                        else:
-                                            allowed_proxies = ['']
-
-
-                                    selected_proxy = None
-                                    for proxy in allowed_proxies:
-                                        # check group
-                                        if not await self.stats.GroupCanStart( group_name, proxy ):
-                                            continue
-
-                                        # check site
-                                        if not await self.stats.SiteCanStart( site_name, proxy ):
-                                            continue
-
-                                        # check user
-                                        user_id = task.request.user_id
-                                        if not await self.stats.UserCanStart( user_id, site_name, group_name, proxy ):
-                                            continue
-                                        
-                                        selected_proxy = proxy
-                                        break
-
-
-                                    if selected_proxy != None:
-                                        task_id = task.task_id
-                                        if await self.taskRun( task, selected_proxy ):
-                                            await self.waiting.RemoveTask( task_id )
-
-                    except:
-                        traceback.print_exc()
+                await self.setupGroupRunners()
+
+                # sleep until config changes or nearest delay expires
+                timeout = await self.stats.GetCooldown()
+                if timeout is None or timeout > IDLE_WAKEUP:
+                    timeout = IDLE_WAKEUP
+                try:
+                    await asyncio.wait_for( self.wakeup.wait(), timeout )
+                    self.wakeup.clear()
+                except asyncio.TimeoutError:
+                    self.wakeGroups()
+
             except:
                 traceback.print_exc()
 
             if self.stop_queue_tasks:
                 break
 
+        await self.stopGroupRunners()
+
         self.stopped_tasks = True
         logger.info('DQ: tasksRunner stopped')
 
+
+    async def setupGroupRunners( self ) -> None:
+        for group_name in self.groups:
+            if group_name in self.group_runners and not self.group_runners[ group_name ].done():
+                continue
+            self.group_wakeups[ group_name ] = asyncio.Event()
+            self.group_wakeups[ group_name ].set()
+            self.group_runners[ group_name ] = asyncio.create_task( self.groupRunner( group_name ) )
+
+        # let abandoned groups runners exit
+        for group_name in list( self.group_runners.keys() ):
+            if group_name not in self.groups:
+                self.wakeGroup( group_name )
+
+
+    async def stopGroupRunners( self ) -> None:
+        self.wakeGroups()
+        runners = list( self.group_runners.values() )
+        if len( runners ) > 0:
+            await asyncio.gather( *runners, return_exceptions=True )
+
+
+    # Independent scheduler of one group, so busy group does not delay others
+    async def groupRunner(
+        self,
+        group_name: str
+    ) -> None:
+        logger.info( f'DQ: groupRunner {group_name} started' )
+        wakeup = self.group_wakeups[ group_name ]
+        while True:
+            await wakeup.wait()
+            wakeup.clear()
+
+            if self.stop_queue_tasks or group_name not in self.groups:
+                break
+
+            if self.tasks_pause:
+                continue
+
+            try:
+                await self.groupRun( group_name )
+            except:
+                traceback.print_exc()
+
+        if self.group_runners.get( group_name, None ) is asyncio.current_task():
+            del self.group_runners[ group_name ]
+            del self.group_wakeups[ group_name ]
+        logger.info( f'DQ: groupRunner {group_name} stopped' )
+
+    async def groupRun(
+        self,
+        group_name: str
+    ) -> None:
+        # preventive skip empty group
+        if not await self.waiting.GroupHasTasks( group_name ):
+            return
+
+        # preventive skip group
+        if not await self.stats.GroupCanStart( group_name, None ):
+            return
+
+        # host is busy
+        if not await self.governorCanStart():
+            return
+
+        group_config = QC.groups[ group_name ] if group_name in QC.groups else None
+        fair_share = group_config.fair_share if group_config else False
+        fair_aging = group_config.fair_aging if group_config else 0
+        priority_aging = group_config.priority_aging if group_config else 0
+
+        # collect first tasks of users queues from sites which can start
+        sites_proxies: Dict[ str, List[ str ] ] = {}
+        candidates: List[ QueueWaitingTask ] = []
+
+        for site_name in await self.waiting.GroupGetSites( group_name ):
+
+            if site_name not in QC.sites:
+                continue
+
+            # preventive skip whole site
+            if not await self.stats.SiteCanStart( site_name, None ):
+                continue
+
+            site_proxies = await self.proxies.GetSiteProxies( site_name )
+
+            # skip site/proxy pairs until cooldown expires
+            sites_proxies[ site_name ] = await self.stats.SiteCooledProxies( site_name, site_proxies )
+
+            candidates.extend( await self.waiting.GroupGetSiteHeads( group_name, site_name, priority_aging ) )
+
+        # higher priority lanes first, then fair share or adding order
+        candidates = await self.waiting.GroupOrder( group_name, candidates, fair_share, fair_aging, priority_aging )
+
+        served_users = set()
+        saturated_sites = set()
+        pass_started = time.monotonic()
+
+        await self.groupPass( group_name, candidates, sites_proxies, fair_share, served_users, saturated_sites, pass_started )
+
+        # deficit round robin: every user visited by round gets quantum, served users pay it back
+        if fair_share and len( served_users ) > 0:
+            await self.waiting.GroupCredit( group_name, served_users )
+
+    # Start candidates of group until group, host or pass budget is exhausted
+    async def groupPass(
+        self,
+        group_name:      str,
+        candidates:      List[ QueueWaitingTask ],
+        sites_proxies:   Dict[ str, List[ str ] ],
+        fair_share:      bool,
+        served_users:    Set[ int ],
+        saturated_sites: Set[ str ],
+        pass_started:    float
+    ) -> None:
+        for index, task in enumerate( candidates ):
+
+            # task could be cancelled while other groups were running
+            if not await self.waiting.Exists( task.task_id ):
+                continue
+
+            if task.site in saturated_sites:
+                continue
+
+            # one task per user on pass, next pass reorders users
+            if fair_share and task.user_id in served_users:
+                continue
+
+            allowed_proxies = [ task.request.proxy ] if task.request.proxy else sites_proxies[ task.site ]
+            if len( allowed_proxies ) == 0:
+                continue
+
+            selected_proxy = await self.taskSelectProxy( task, group_name, allowed_proxies )
+
+            if selected_proxy != None:
+                if not await self.governorCanStart():
+                    return
+
+                task_id = task.task_id
+                if await self.taskRun( task, selected_proxy ):
+                    await self.waiting.RemoveTask( task_id )
+                    # next tasks of user queue become first
+                    self.wakeGroup( group_name )
+
+                    if fair_share:
+                        await self.waiting.GroupCharge( group_name, task.user_id )
+                        served_users.add( task.user_id )
+
+                    if not await self.stats.GroupCanStart( group_name, None ):
+                        # round ends, users which could start if group had free slots are visited too
+                        if fair_share:
+                            await self.waiting.GroupCredit(
+                                group_name,
+                                await self.groupRunnableUsers( group_name, candidates[ index + 1: ], sites_proxies, served_users, saturated_sites )
+                            )
+                        return
+
+                    if not await self.stats.SiteCanStart( task.site, None ):
+                        saturated_sites.add( task.site )
+
+                    # let other groups run between processes starts
+                    await asyncio.sleep( 0 )
+
+            # pass is too long, continue on next wake up
+            if time.monotonic() - pass_started > GROUP_PASS_BUDGET:
+                self.wakeGroup( group_name )
+                return
+
+    # Users with first task which could start, if group had free slots
+    async def groupRunnableUsers(
+        self,
+        group_name:      str,
+        tasks:           List[ QueueWaitingTask ],
+        sites_proxies:   Dict[ str, List[ str ] ],
+        served_users:    Set[ int ],
+        saturated_sites: Set[ str ]
+    ) -> Set[ int ]:
+        users = set()
+        for task in tasks:
+            if task.user_id in served_users or task.user_id in users or task.site in saturated_sites:
+                continue
+            if not task.request.proxy and len( sites_proxies.get( task.site, [] ) ) == 0:
+                continue
+            if not await self.stats.UserCanStart( task.user_id, task.site, group_name, None ):
+                continue
+            users.add( task.user_id )
+        return users
+
     ###
 
+    # Check host limits of governor for next start
+    async def governorCanStart( self ) -> bool:
+        return await self.governor.CanStart( len( self.running.tasks ), GC.governor, GC.executor.reserved_cpus )
+
+    async def taskSelectProxy(
+        self,
+        task:            QueueWaitingTask,
+        group_name:      str,
+        allowed_proxies: List[ str ]
+    ) -> str | None:
+        site_name = task.request.site
+        user_id = task.request.user_id
+
+        # least loaded proxies first
+        allowed_proxies = await self.proxies.Order(
+            allowed_proxies,
+            await self.stats.SiteRunningByProxy( site_name ),
+            await self.stats.GroupRunningByProxy( group_name )
+        )
+
+        for proxy in allowed_proxies:
+            # check group
+            if not await self.stats.GroupCanStart( group_name, proxy ):
+                continue
+
+            # check site
+            if not await self.stats.SiteCanStart( site_name, proxy ):
+                continue
+
+            # check user
+            if not await self.stats.UserCanStart( user_id, site_name, group_name, proxy ):
+                continue
+
+            return proxy
+
+        return None
+
     async def taskRun(
         self,
         waiting_task: QueueWaitingTask,
@@ -555,6 +1548,9 @@ class DownloadsQueue():
                         if not flaresolverr:
                             flaresolverr = GC.flaresolverr
 
+                    stall_timeout, timeout = self.taskTimeouts( site_name, group_name )
+                    running_task.timeout = timeout
+
                     context = variables.DownloaderContext(
                         save_folder  = DC.save_folder,
                         exec_folder  = DC.exec_folder,
@@ -564,25 +1560,47 @@ class DownloadsQueue():
                         file_limit   = DC.file_limit,
                         downloader   = downloader,
                         page_delay   = page_delay,
+                        stall_timeout = stall_timeout,
+                        timeout      = timeout,
+                        resources    = self.taskResources( group_name ),
+                        cpus         = self.taskCpus(),
                         pattern      = pattern,
                         proxy        = proxy,
-                        flaresolverr = flaresolverr
+                        flaresolverr = flaresolverr,
+                        temp_cache   = DC.temp_cache.enabled,
+                        temp_cache_key = temp_cache_key( waiting_task.request ) if DC.temp_cache.enabled else '',
+                        extra        = await self.subscribers.GetExtras( task_id )
                     )
 
-                    running_task.proc = Process(
-                        target = start_downloader,
-                        name   = f"Downloader #{waiting_task.task_id} [{waiting_task.request.url}]",
-                        kwargs = {
-                            'request':  waiting_task.request,
-                            'context':  context,
-                            'statuses': self.statuses,
-                            'results':  self.results,
-                        },
-                        daemon = True
-                    )
-                    running_task.proc.start()
+                    if self.pool.Enabled():
+                        running_task.proc = self.pool.Run( waiting_task.request, context )
+                        # keep spare workers for next tasks
+                        self.pool.Maintain()
+                    elif GC.executor.mode == 'inline':
+                        running_task.proc = DownloaderInline(
+                            request  = waiting_task.request,
+                            context  = context,
+                            statuses = self.statuses,
+                            results  = self.results
+                        )
+                        running_task.proc.start()
+                    else:
+                        running_task.proc = DownloaderProcess(
+                            name     = f"Downloader #{waiting_task.task_id} [{waiting_task.request.url}]",
+                            request  = waiting_task.request,
+                            context  = context,
+                            statuses = self.statuses,
+                            results  = self.results
+                        )
+                        running_task.proc.start( self.taskLost )
+
+                    # launch is started, other formats can not join it anymore
+                    await self.subscribers.RemoveSource( task_id )
 
                     await self.stats.AddRun( user_id, site_name, group_name, proxy )
+                    await self.proxies.AddRun( proxy )
+                    await self.admission.AddStart( group_name )
+                    await self.governor.AddStart()
                     await self.stats.RemoveWaiting( user_id, site_name, group_name )
 
                     logger.info( f'DQ: started task {task_id}: ' + str(running_task.proc) )
@@ -591,6 +1609,58 @@ class DownloadsQueue():
         except:
             traceback.print_exc()
             return False
+
+    # Process of task ended, called from supervisor
+    def taskLost(
+        self,
+        task_id: int
+    ) -> None:
+        asyncio.create_task( self.taskExited( task_id ) )
+
+    # Free slots of task which process ended without result
+    async def taskExited(
+        self,
+        task_id: int
+    ) -> None:
+        # result is sent before process exits and could be still in channel
+        await asyncio.sleep( EXIT_GRACE )
+        if self.channel.HasResult( task_id ):
+            return
+
+        running_task = await self.running.GetTask( task_id )
+        if not running_task:
+            return
+
+        logger.warning( f'DQ: process of task {task_id} ended without result' )
+        await self.taskFailed( running_task, 'Процесс загрузки неожиданно завершился' )
+
+    # Finish running task with error result made by queue, process is stopped when terminate is set
+    async def taskFailed(
+        self,
+        running_task: variables.QueueRunningTask,
+        text:         str,
+        terminate:    bool = False
+    ) -> None:
+        request = running_task.request
+        await self.taskDone(
+            dto.DownloadResult(
+                task_id    = request.task_id,
+                user_id    = request.user_id,
+                web_id     = request.web_id,
+                chat_id    = request.chat_id,
+                message_id = request.message_id,
+                site       = request.site,
+                proxy      = running_task.proxy,
+                url        = request.url,
+                format     = request.format,
+                start      = request.start,
+                end        = request.end,
+                status     = variables.DownloaderStatus.ERROR,
+                text       = text,
+                files      = [],
+            ),
+            terminate
+        )
     
     #
 
@@ -603,20 +1673,75 @@ class DownloadsQueue():
         
         await self.running.UpdateStatus( status.task_id, status.text )
 
-        await IC.Send(status)
+        # launch status is shared by subscribers and other formats ( with their subscribers )
+        recipients: List[ dto.DownloadRequest ] = []
+        recipients += await self.subscribers.GetSubscribers( status.task_id )
+        for extra in await self.subscribers.GetExtras( status.task_id ):
+            if not await self.subscribers.IsDetached( extra.task_id ):
+                recipients.append( extra )
+            recipients += await self.subscribers.GetSubscribers( extra.task_id )
+
+        statuses: List[ dto.DownloadStatus ] = []
+        if not await self.subscribers.IsDetached( status.task_id ):
+            statuses.append( status )
+        for request in recipients:
+            statuses.append( status.model_copy(
+                update = {
+                    'task_id':    request.task_id,
+                    'user_id':    request.user_id,
+                    'web_id':     request.web_id,
+                    'chat_id':    request.chat_id,
+                    'message_id': request.message_id,
+                }
+            ) )
+
+        await asyncio.gather( *[ IC.Send( _status ) for _status in statuses ] )
 
     #
 
     async def taskDone(
         self,
-        result: dto.DownloadResult
+        result:    dto.DownloadResult,
+        terminate: bool = False
     ) -> None:
         logger.info('DQ: taskDone')
 
         task_id = result.task_id
 
+        # task was already finished by queue ( process exited, timeout ), its real result came late
+        if task_id in self.finished:
+            logger.warning( f'DQ: late result of finished task {task_id} dropped' )
+            if result.files:
+                await self.ClearFolder( dto.DownloadClearRequest( task_id=task_id ) )
+            return
+        self.taskFinished( task_id )
+
+        # other format was cancelled after its launch started
+        if await self.subscribers.IsDropped( task_id ):
+            await self.ClearFolder( dto.DownloadClearRequest( task_id=task_id ) )
+            return
+
         task = await self.running.GetTask( task_id )
         logger.info( str( task ) )
+
+        request = None
+        started = None
+        if task:
+            request = task.request
+            started = task.started
+
+        # other format written by launch of another task
+        if await self.subscribers.IsExtra( task_id ):
+            primary_task = await self.running.GetTask( await self.subscribers.GetPrimary( task_id ) )
+            if primary_task:
+                started = primary_task.started
+            request = await self.subscribers.RemoveExtra( task_id )
+            group_name = await self.site_to_groups.GetSiteGroup( request.site, request.format )
+            if group_name:
+                await self.stats.UserRemoveWaiting( request.user_id, request.site, group_name )
+
+        detached = await self.subscribers.IsDetached( task_id )
+        subscribers = await self.subscribers.RemovePrimary( task_id )
         
         if task:
             user_id = task.user_id
@@ -624,19 +1749,54 @@ class DownloadsQueue():
             group_name = task.group
 
             if await self.running.Exists( task_id ):
-                await self.running.RemoveTask( task_id )
+                await self.running.RemoveTask( task_id, terminate )
 
             await self.stats.RemoveRun( user_id, site_name, group_name, result.proxy )
+            await self.proxies.RemoveRun( result.proxy )
+            await self.requeueExtras( task_id )
+            self.wakeTasks()
+
+        if request:
+            await self.cache.Put( request, result )
 
-        await DB.SaveDownloadResult( result )
+        # same result for every subscriber, files are linked before primary result is sent and cleared
+        for subscriber in subscribers:
+            subscriber_result = await self.subscriberResult( result, subscriber )
+            group_name = await self.site_to_groups.GetSiteGroup( subscriber.site, subscriber.format )
+            if group_name:
+                await self.stats.UserRemoveWaiting( subscriber.user_id, subscriber.site, group_name )
+            await DB.SaveDownloadResult( subscriber_result )
+            asyncio.create_task( self.sendFiles( subscriber_result ) )
+        await DB.DeleteDownloadRequests( [ subscriber.task_id for subscriber in subscribers ] )
+
+        if not detached:
+            await DB.SaveDownloadResult( result )
         await DB.DeleteDownloadRequest( task_id )
-        await DB.AddDownloadHistory( result )
+        await DB.AddDownloadHistory( result, started )
+
+        # primary was cancelled by its user, nobody else needs its files
+        if detached:
+            await self.ClearFolder( dto.DownloadClearRequest( task_id=task_id ) )
+            return
 
         asyncio.create_task( self.sendFiles( result ) )
         await asyncio.sleep( 0 )
 
+    # Remember finished task, oldest are forgotten over limit
+    def taskFinished(
+        self,
+        task_id: int
+    ) -> None:
+        self.finished[ task_id ] = True
+        while len( self.finished ) > FINISHED_LIMIT:
+            del self.finished[ next( iter( self.finished ) ) ]
 
-    async def sendFiles(self, result: dto.DownloadResult) -> None:
+
+    async def sendFiles(
+        self,
+        result:    dto.DownloadResult,
+        site_stat: bool = True
+    ) -> None:
 
         if result.text == '':
             result.text = 'нет описания'
@@ -647,6 +1807,9 @@ class DownloadsQueue():
             await DB.DeleteDownloadResult( result.task_id )
             logger.info( 'deleted result, task #' + str( result.task_id ) )
 
+        if not site_stat:
+            return
+
         try:
             await DB.UpdateSiteStat( result )
         except:
@@ -698,6 +1861,12 @@ class DownloadsQueue():
 
             await self.stats.SiteInit( site_name )
             await self.site_to_groups.SiteInit( site_name, site_config.allowed_groups )
+            await self.proxies.SiteInit(
+                site_name,
+                await QC.proxies.GetInstances( site_config.excluded_proxy ),
+                site_config.use_proxy,
+                site_config.force_proxy
+            )
 
             if 'auth' in site_config.parameters:
                 sites_with_auth.append( site_name )
@@ -721,4 +1890,5 @@ class DownloadsQueue():
         for site_name in stg_active_sites:
             if site_name not in sites_active:
                 if await self.stats.SiteNotBusy( site_name ):
-                    await self.site_to_groups.SiteDestroy( site_name )
\ No newline at end of file
+                    await self.site_to_groups.SiteDestroy( site_name )
+                    await self.proxies.SiteDestroy( site_name )
\ No newline at end of file
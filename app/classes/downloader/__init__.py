@@ -7,6 +7,7 @@ import asyncio
 import logging
 import traceback
 from multiprocessing import Queue
+from multiprocessing.connection import Connection
 from app import dto
 from app import variables
 
@@ -14,6 +15,9 @@ from .tools import DownloaderTools
 from .step_download import DownloaderStepDownload
 from .step_process import DownloaderStepProcess
 from .interconnect import DownloaderInterconnect
+from .step_split import DownloaderStepSplit
+from .temp_cache import DownloaderTempCache, sweep_temp_cache, temp_cache_key
+from .resources import apply_resources, apply_cpus, has_resources
 
 logger = logging.getLogger('downloader-process')
 
@@ -23,6 +27,11 @@ def start_downloader(
         statuses: Queue,
         results:  Queue
     ):
+    set_process_group()
+    # process runs only this task, so it gets priorities of its group, limits are left for cli
+    apply_resources( context.resources, False )
+    if not context.resources or not context.resources.cpus:
+        apply_cpus( context.cpus )
     _downloader = Downloader(
         request  = request,
         context  = context,
@@ -30,12 +39,58 @@ def start_downloader(
         results  = results
     )
     _downloader.StartDownload()
+    sys.exit( 0 )
+
+def start_worker(
+        connection: Connection,
+        statuses:   Queue,
+        results:    Queue
+    ):
+    # Warm worker of pool, runs tasks received from connection one by one
+    set_process_group()
+    while True:
+        try:
+            request, context = connection.recv()
+        except ( EOFError, OSError ):
+            break
+
+        _downloader = Downloader(
+            request  = request,
+            context  = context,
+            statuses = statuses,
+            results  = results
+        )
+        _downloader.StartDownload()
+
+        # signal between tasks stops worker
+        signal.signal( signal.SIGINT, signal.SIG_DFL )
+        signal.signal( signal.SIGTERM, signal.SIG_DFL )
+
+        try:
+            connection.send( request.task_id )
+        except ( EOFError, OSError ):
+            break
+
+        # cancelled task could leave child processes and open files, worker is replaced by pool
+        if _downloader.__is_status__( variables.DownloaderStatus.CANCELLED ):
+            break
+
+    sys.exit( 0 )
+
+def set_process_group():
+    # downloader and its cli are stopped together by signal to group
+    try:
+        os.setpgid( 0, 0 )
+    except OSError:
+        pass
 
 class Downloader(
     DownloaderTools,
     DownloaderInterconnect,
     DownloaderStepDownload,
     DownloaderStepProcess,
+    DownloaderStepSplit,
+    DownloaderTempCache,
 ):
 
     def __init__(
@@ -61,6 +116,11 @@ class Downloader(
         self.dbg_config   = ''
 
         self.proc         = None
+        self.temp_lock    = None
+        self.activity     = 0
+        self.stalled      = ''
+        self.inline       = False
+        self.extra_downloaders = []
         self.temp         = variables.DownloadTempData()
         self.result       = variables.DownloadResultData()
         self.folders      = variables.DownloadFolders(
@@ -69,9 +129,6 @@ class Downloader(
             archive = os.path.join( self.context.arch_folder, str( self.request.task_id ) )
         )
 
-        signal.signal( signal.SIGINT, self.CancelDownload )
-        signal.signal( signal.SIGTERM, self.CancelDownload )
-
     ###
 
     def StartDownload( self ) -> None:
@@ -81,11 +138,25 @@ class Downloader(
             level=logging.INFO
         )
         logger.info( 'Downloader: Start' )
+        signal.signal( signal.SIGINT, self.CancelDownload )
+        signal.signal( signal.SIGTERM, self.CancelDownload )
         self.SetStatus( variables.DownloaderStatus.WAIT )
         self.SetMessage( 'Загрузка начата' )
         asyncio.get_event_loop().run_until_complete( self.Run() )
 
 
+    # Run inside event loop of queue, without own process and signal handlers
+    async def StartInline( self ) -> None:
+        logger.info( 'Downloader: Start inline' )
+        self.inline = True
+        self.SetStatus( variables.DownloaderStatus.WAIT )
+        self.SetMessage( 'Загрузка начата' )
+        try:
+            await self.Run()
+        except:
+            traceback.print_exc()
+
+
     def CancelDownload( self, *args, **kwargs ):
 
         if self.__is_status__( variables.DownloaderStatus.CANCELLED ):
@@ -115,6 +186,9 @@ class Downloader(
             if not self.__is_status__( variables.DownloaderStatus.CANCELLED ):
                 await self.Download() # can raise error
 
+            if not self.__is_status__( variables.DownloaderStatus.CANCELLED ):
+                await self.SplitFormats() # can raise error
+
             if not self.__is_status__( variables.DownloaderStatus.CANCELLED ):
                 await self.Process() # can raise error
 
@@ -125,10 +199,9 @@ class Downloader(
 
         finally:
             self.monitor = False
+            await self.SendExtraResults()
             await self.SendResult()
 
-            sys.exit( 0 )
-
     #
 
     async def statusMonitor( self ) -> None:
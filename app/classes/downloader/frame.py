@@ -2,7 +2,7 @@ import asyncio
 import ujson
 import logging
 from multiprocessing import Queue
-from typing import Any
+from typing import List, Any
 
 from app import dto
 from app import variables
@@ -29,6 +29,11 @@ class DownloaderFrame:
     result:          variables.DownloadResultData
     folders:         variables.DownloadFolders
     proc:            asyncio.subprocess.Process
+    temp_lock:       Any = None # lock of shared temp folder
+    activity:        float = 0 # monotonic time of last downloader output
+    stalled:         str = '' # reason of stop by watchdog
+    inline:          bool = False # runs in event loop of queue process
+    extra_downloaders: List[ Any ] # processors of other formats of launch
 
     def __repr__( self ) -> str:
         return str( {
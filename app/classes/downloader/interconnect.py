@@ -1,5 +1,6 @@
 import os
 import shutil
+import asyncio
 
 from app import variables
 from app import dto
@@ -30,20 +31,15 @@ class DownloaderInterconnect( DownloaderFrame ):
 
     async def SendResult( self ) -> None:
 
-        if self.folders.temp and os.path.exists( self.folders.temp ):
-            try:
-                shutil.rmtree( self.folders.temp )
-            except:
-                pass
+        # shared temp folder is kept for next downloads of same book
+        if not self.UnlockTemp() and self.folders.temp and os.path.exists( self.folders.temp ):
+            await asyncio.to_thread( shutil.rmtree, self.folders.temp, ignore_errors=True )
 
         if self.__is_status__( variables.DownloaderStatus.ERROR ) or self.__is_status__( variables.DownloaderStatus.CANCELLED ):
             self.result.cover = ''
             self.temp.files = []
             if self.folders.result and os.path.exists( self.folders.result ):
-                try:
-                    shutil.rmtree( self.folders.result )
-                except:
-                    pass
+                await asyncio.to_thread( shutil.rmtree, self.folders.result, ignore_errors=True )
 
         if self.__is_status__( variables.DownloaderStatus.CANCELLED ):
             return
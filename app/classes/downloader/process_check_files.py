@@ -1,5 +1,6 @@
 import os
 import shutil
+import asyncio
 
 from .frame import DownloaderFrame
 
@@ -27,7 +28,7 @@ class DownloaderProcessCheckFiles( DownloaderFrame ):
 
         for file in trash:
             if os.path.isdir( file ):
-                shutil.rmtree( file )
+                await asyncio.to_thread( shutil.rmtree, file )
             else:
                 os.remove( file )
 
@@ -7,6 +7,7 @@ import traceback
 from PIL import Image, ImageFilter
 
 from .frame import DownloaderFrame
+from .resources import spawn_options, apply_spawned
 
 logger = logging.getLogger('downloader-process')
 
@@ -57,8 +58,10 @@ class DownloaderProcessFiles( DownloaderFrame ):
                             cwd    = self.context.compression[ preselected_archiver ][ 'cwd' ],
                             env    = dict( os.environ ),
                             stdout = subprocess.PIPE,
-                            stderr = subprocess.PIPE
+                            stderr = subprocess.PIPE,
+                            **spawn_options( self.context, self.inline )
                         )
+                        apply_spawned( self.proc.pid, self.context, self.inline )
                         await self.proc.wait()
 
                         if self.proc.returncode == 0:
@@ -96,53 +99,62 @@ class DownloaderProcessFiles( DownloaderFrame ):
                 self.result.cover = self.temp.cover
             if use_thumb:
                 thumb_path = self.temp.cover.replace('cover','thumb')
-                thumb_dimension = 320
                 try:
-                    with Image.open( self.temp.cover ) as img_src:
-                        # create result image
-                        img_result = Image.new('RGB', ( thumb_dimension, thumb_dimension ) )
-
-                        # resize original image
-                        img_src.thumbnail( ( thumb_dimension, thumb_dimension ) )
-
-                        # copy thumb to bg layer
-                        img_bg = img_src.copy()
-
-                        # find maximal resize scale coefficient
-                        resize_coef = max( thumb_dimension / img_src.width, thumb_dimension / img_src.height )
-                        
-                        # calculate resize dimension
-                        resize_dimension = math.ceil( thumb_dimension * resize_coef )
-                        
-                        # upscale to fill
-                        img_bg = img_bg.resize( ( resize_dimension, resize_dimension ), Image.Resampling.LANCZOS )
-
-                        # blur bg layer
-                        img_bg = img_bg.filter( ImageFilter.GaussianBlur( 20 ) )
-                        
-                        # paste bg to result image
-                        img_result.paste(
-                            img_bg,
-                            (
-                                ( thumb_dimension - img_bg.width ) // 2,
-                                ( thumb_dimension - img_bg.height ) // 2
-                            )
-                        )
-
-                        # paste thumb to result image
-                        img_result.paste(
-                            img_src,
-                            (
-                                ( thumb_dimension - img_src.width ) // 2,
-                                ( thumb_dimension - img_src.height ) // 2
-                            )
-                        )
-
-                        img_result.save( thumb_path, format="JPEG", optimize=True )
-                        self.result.thumb = thumb_path
+                    # image processing blocks, downloader can run inside queue loop
+                    await asyncio.to_thread( self.createThumb, self.temp.cover, thumb_path )
+                    self.result.thumb = thumb_path
                 except Exception as e:
                     logger.info( 'failed create thumb' )
                     traceback.print_exc()
                     pass
         logger.info( str( self.result ) )
+
+
+    def createThumb(
+        self,
+        cover_path: str,
+        thumb_path: str
+    ) -> None:
+        thumb_dimension = 320
+        with Image.open( cover_path ) as img_src:
+            # create result image
+            img_result = Image.new('RGB', ( thumb_dimension, thumb_dimension ) )
+
+            # resize original image
+            img_src.thumbnail( ( thumb_dimension, thumb_dimension ) )
+
+            # copy thumb to bg layer
+            img_bg = img_src.copy()
+
+            # find maximal resize scale coefficient
+            resize_coef = max( thumb_dimension / img_src.width, thumb_dimension / img_src.height )
+            
+            # calculate resize dimension
+            resize_dimension = math.ceil( thumb_dimension * resize_coef )
+            
+            # upscale to fill
+            img_bg = img_bg.resize( ( resize_dimension, resize_dimension ), Image.Resampling.LANCZOS )
+
+            # blur bg layer
+            img_bg = img_bg.filter( ImageFilter.GaussianBlur( 20 ) )
+            
+            # paste bg to result image
+            img_result.paste(
+                img_bg,
+                (
+                    ( thumb_dimension - img_bg.width ) // 2,
+                    ( thumb_dimension - img_bg.height ) // 2
+                )
+            )
+
+            # paste thumb to result image
+            img_result.paste(
+                img_src,
+                (
+                    ( thumb_dimension - img_src.width ) // 2,
+                    ( thumb_dimension - img_src.height ) // 2
+                )
+            )
+
+            img_result.save( thumb_path, format="JPEG", optimize=True )
                 
\ No newline at end of file
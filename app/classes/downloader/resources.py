@@ -0,0 +1,138 @@
+import os
+import ctypes
+import ctypes.util
+import platform
+import resource
+import functools
+from typing import List, Dict, Any
+
+from app import variables
+
+# ioprio_set syscall numbers, python has no wrapper for it
+IOPRIO_SET_SYSCALLS = {
+    'x86_64':  251,
+    'aarch64': 30,
+    'i386':    289,
+    'i686':    289,
+    'armv7l':  314,
+    'ppc64le': 273,
+}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+
+# loaded before fork, resources are applied in child right before exec
+try:
+    LIBC = ctypes.CDLL( ctypes.util.find_library( 'c' ), use_errno=True )
+except OSError:
+    LIBC = None
+
+def set_io_priority(
+        io_class: int,
+        io_level: int,
+        pid:      int = 0
+    ) -> None:
+    syscall_number = IOPRIO_SET_SYSCALLS.get( platform.machine() )
+    if syscall_number is None or LIBC is None:
+        return
+    LIBC.syscall( syscall_number, IOPRIO_WHO_PROCESS, pid, ( io_class << IOPRIO_CLASS_SHIFT ) | max( min( io_level, 7 ), 0 ) )
+
+def set_soft_limit(
+        limit: int,
+        value: int,
+        pid:   int = 0
+    ) -> None:
+    _, hard = resource.prlimit( pid, limit ) if pid else resource.getrlimit( limit )
+    if hard != resource.RLIM_INFINITY:
+        value = min( value, hard )
+    if pid:
+        resource.prlimit( pid, limit, ( value, hard ) )
+    else:
+        resource.setrlimit( limit, ( value, hard ) )
+
+def has_resources(
+        resources: variables.QueueConfigResources | None
+    ) -> bool:
+    # Check profile of group sets anything
+    if resources is None:
+        return False
+    return resources.nice > 0 \
+        or resources.ionice_class > 0 \
+        or resources.max_memory > 0 \
+        or resources.max_file_size > 0 \
+        or len( resources.cpus ) > 0
+
+def apply_resources(
+        resources: variables.QueueConfigResources | None,
+        limits:    bool = True,
+        pid:       int = 0
+    ) -> None:
+    # Apply resources profile of group to process ( current by default ), limits are applied only to downloader cli
+    if resources is None:
+        return
+
+    if resources.nice > 0:
+        try:
+            # absolute value, process can be already niced by same profile
+            os.setpriority( os.PRIO_PROCESS, pid, resources.nice )
+        except OSError:
+            pass
+
+    if resources.ionice_class > 0:
+        try:
+            set_io_priority( resources.ionice_class, resources.ionice_level, pid )
+        except:
+            pass
+
+    if resources.cpus:
+        try:
+            os.sched_setaffinity( pid, resources.cpus )
+        except OSError:
+            pass
+
+    if not limits:
+        return
+
+    if resources.max_memory > 0:
+        try:
+            set_soft_limit( resource.RLIMIT_AS, resources.max_memory * 1024 * 1024, pid )
+        except ( OSError, ValueError ):
+            pass
+
+    if resources.max_file_size > 0:
+        try:
+            set_soft_limit( resource.RLIMIT_FSIZE, resources.max_file_size * 1024 * 1024, pid )
+        except ( OSError, ValueError ):
+            pass
+
+def apply_cpus(
+        cpus: List[ int ],
+        pid:  int = 0
+    ) -> None:
+    # Keep process on cpus which are not reserved for queue
+    if not cpus:
+        return
+    try:
+        os.sched_setaffinity( pid, cpus )
+    except OSError:
+        pass
+
+def spawn_options(
+        context: variables.DownloaderContext,
+        inline:  bool
+    ) -> Dict[ str, Any ]:
+    # Profile set by group is applied between fork and exec of cli, but queue process of inline mode has threads,
+    # where preexec_fn is unsafe, so there profile is applied after start
+    if inline or not has_resources( context.resources ):
+        return {}
+    return { 'preexec_fn': functools.partial( apply_resources, context.resources ) }
+
+def apply_spawned(
+        pid:     int,
+        context: variables.DownloaderContext,
+        inline:  bool
+    ) -> None:
+    # Apply profile to started cli, when it was not applied by preexec_fn
+    if inline and has_resources( context.resources ):
+        apply_resources( context.resources, True, pid )
+    if not context.resources or not context.resources.cpus:
+        apply_cpus( context.cpus, pid )
@@ -1,4 +1,6 @@
 import os
+import copy
+import time
 import shutil
 import asyncio
 import subprocess
@@ -8,18 +10,24 @@ from typing import List, Dict, Any
 from app import variables
 
 from .frame import DownloaderFrame
+from .resources import spawn_options, apply_spawned
 
 logger = logging.getLogger('downloader-process')
 
+# Seconds between watchdog checks
+WATCHDOG_INTERVAL = 5
+
+# Seconds from terminate to kill of stopped cli
+WATCHDOG_KILL_DELAY = 10
+
 class DownloaderStepDownload( DownloaderFrame ):
 
     async def Download( self ) -> None:
-        try:
-            shutil.rmtree( self.folders.result )
-        except:
-            pass
+        await asyncio.to_thread( shutil.rmtree, self.folders.result, ignore_errors=True )
         os.makedirs( self.folders.result, exist_ok=True)
 
+        self.LockTemp()
+
         args = await self.prepareDownloadArgs()
 
         self.PrintLog( '#'*20 )
@@ -34,11 +42,16 @@ class DownloaderStepDownload( DownloaderFrame ):
             cwd    = os.path.join( self.context.exec_folder, self.context.downloader.folder ),
             env    = dict(os.environ),
             stdout = subprocess.PIPE,
-            stderr = subprocess.PIPE
+            stderr = subprocess.PIPE,
+            **spawn_options( self.context, self.inline )
         )
+        apply_spawned( self.proc.pid, self.context, self.inline )
 
         self.SetStatus( variables.DownloaderStatus.RUNNING )
 
+        self.activity = time.monotonic()
+        watchdog = asyncio.create_task( self.watchdog() )
+
         while \
             self.proc.returncode is None \
             and \
@@ -48,6 +61,7 @@ class DownloaderStepDownload( DownloaderFrame ):
             new_line = await self.proc.stdout.readline()
 
             if new_line:
+                self.activity = time.monotonic()
                 message = new_line.strip().decode( 'utf-8', errors='replace' )
                 self.dbg_log += '\n' + message
 
@@ -72,6 +86,8 @@ class DownloaderStepDownload( DownloaderFrame ):
             await asyncio.sleep(0.1)
 
 
+        watchdog.cancel()
+
         _trace = ( await self.proc.stdout.read() ).decode( 'utf-8', errors='replace' )
         self.dbg_log += _trace
 
@@ -80,6 +96,10 @@ class DownloaderStepDownload( DownloaderFrame ):
             return
 
 
+        if self.stalled:
+            raise variables.DownloaderStallException( self.stalled )
+
+
         if self.proc.returncode != 0:
             error = ( await self.proc.stderr.read() ).decode( 'utf-8', errors='replace' )
             if error:
@@ -98,6 +118,28 @@ class DownloaderStepDownload( DownloaderFrame ):
                 raise FileExistsError( 'Ошибка загрузки файлов' )
 
 
+    # Stop cli which prints nothing for stall_timeout or runs longer than timeout
+    async def watchdog( self ) -> None:
+        started = time.monotonic()
+        while self.proc.returncode is None:
+            await asyncio.sleep( WATCHDOG_INTERVAL )
+            now = time.monotonic()
+
+            if self.context.stall_timeout > 0 and now - self.activity > self.context.stall_timeout:
+                self.stalled = f'Загрузка зависла: нет ответа {int( now - self.activity )} сек.'
+            elif self.context.timeout > 0 and now - started > self.context.timeout:
+                self.stalled = f'Превышено время загрузки: {self.context.timeout} сек.'
+
+            if self.stalled:
+                self.PrintLog( self.stalled )
+                if self.proc.returncode is None:
+                    self.proc.terminate()
+                await asyncio.sleep( WATCHDOG_KILL_DELAY )
+                if self.proc.returncode is None:
+                    self.proc.kill()
+                return
+
+
     async def prepareDownloadArgs( self ) -> List[ str ]:
         prepared_args: List[str] = []
 
@@ -106,7 +148,7 @@ class DownloaderStepDownload( DownloaderFrame ):
             "result_folder": self.folders.result,
             "temp_folder": self.folders.temp,
             "url": self.request.url,
-            "format": self.request.format,
+            "format": ','.join( [ self.request.format ] + [ request.format for request in self.context.extra ] ),
             "start": self.request.start if self.request.start and self.request.start != 0 else None,
             "end": self.request.end if self.request.end and self.request.end != 0 else None,
             "login": self.request.login if self.request.login and self.request.password else None,
@@ -118,7 +160,8 @@ class DownloaderStepDownload( DownloaderFrame ):
         }
 
 
-        source_args = self.context.downloader.args
+        # config of downloader is shared with other tasks when downloader runs inside queue loop
+        source_args = copy.deepcopy( self.context.downloader.args )
         format_args = self.context.downloader.format_args.get( self.request.format, {} )
 
 
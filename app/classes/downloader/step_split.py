@@ -0,0 +1,83 @@
+import os
+import shutil
+import asyncio
+import logging
+import traceback
+import dataclasses
+
+from app import variables
+
+from .frame import DownloaderFrame
+
+logger = logging.getLogger('downloader-process')
+
+class DownloaderStepSplit( DownloaderFrame ):
+
+    # Move files of other formats of launch into folders of their tasks
+    async def SplitFormats( self ) -> None:
+        self.extra_downloaders = []
+
+        for request in self.context.extra:
+            downloader = type( self )(
+                request  = request,
+                context  = dataclasses.replace( self.context, extra=[] ),
+                statuses = self.statuses,
+                results  = self.results
+            )
+            downloader.dbg_log = self.dbg_log
+            downloader.inline  = self.inline
+
+            # files of book can be big, so they are moved out of event loop
+            await asyncio.to_thread( self.splitFiles, downloader.folders.result, request.format )
+
+            self.extra_downloaders.append( downloader )
+
+
+    # Process other formats of launch, their results are sent before result of launch
+    async def SendExtraResults( self ) -> None:
+        for downloader in self.extra_downloaders:
+
+            if self.__is_status__( variables.DownloaderStatus.CANCELLED ):
+                return
+
+            try:
+                await downloader.Process()
+            except Exception as e:
+                traceback.print_exc()
+                await downloader.ProcessError( e )
+
+            await downloader.SendResult()
+
+        self.extra_downloaders = []
+
+
+    # Move files of format into folder of other task, shared files are linked
+    def splitFiles(
+        self,
+        folder: str,
+        format: str
+    ) -> None:
+        try:
+            shutil.rmtree( folder )
+        except:
+            pass
+        os.makedirs( folder, exist_ok=True )
+
+        for file in os.listdir( self.folders.result ):
+            file_path = os.path.join( self.folders.result, file )
+            if not os.path.isfile( file_path ):
+                continue
+
+            file_name, extension = os.path.splitext( file )
+            extension = extension[1:]
+            target_path = os.path.join( folder, file )
+
+            if extension == format:
+                shutil.move( file_path, target_path )
+
+            # book description and cover are shared by all formats
+            elif extension == 'json' or ( extension in [ 'jpg','jpeg','png','gif' ] and file_name.endswith( '_cover' ) ):
+                try:
+                    os.link( file_path, target_path )
+                except OSError:
+                    shutil.copy2( file_path, target_path )
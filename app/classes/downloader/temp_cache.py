@@ -0,0 +1,126 @@
+import os
+import time
+import fcntl
+import shutil
+import hashlib
+import logging
+from typing import List, Tuple
+
+from app import dto
+from .frame import DownloaderFrame
+
+logger = logging.getLogger('downloader-process')
+
+# Subfolder of temp_folder with temp folders shared by tasks of same book
+TEMP_CACHE_FOLDER = 'cache'
+
+# Key of shared temp folder, computed by queue from same canonical url as its indexes keys
+def temp_cache_key(
+        request: dto.DownloadRequest
+    ) -> str:
+    key = request.site + '\n' + request.key_url
+    # pages loaded with user auth must not be shared with other users
+    if request.login:
+        key += '\n' + request.login
+    return hashlib.sha1( key.encode( 'utf-8' ) ).hexdigest()
+
+def sweep_temp_cache(
+        temp_folder: str,
+        max_size:    int,
+        max_age:     int
+    ) -> None:
+    cache_folder = os.path.join( temp_folder, TEMP_CACHE_FOLDER )
+    if not os.path.isdir( cache_folder ):
+        return
+
+    entries: List[ Tuple[ float, int, str ] ] = []
+    now = time.time()
+    for name in os.listdir( cache_folder ):
+        if name.endswith( '.lock' ):
+            continue
+        folder = os.path.join( cache_folder, name )
+        lock_path = folder + '.lock'
+
+        with open( lock_path, 'a' ) as lock_file:
+            # folder is used by running download
+            try:
+                fcntl.flock( lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB )
+            except OSError:
+                continue
+
+            used = os.path.getmtime( lock_path )
+            size = 0
+            for root, _, files in os.walk( folder ):
+                for file in files:
+                    try:
+                        size += os.path.getsize( os.path.join( root, file ) )
+                    except OSError:
+                        pass
+
+            if max_age > 0 and used + max_age < now:
+                shutil.rmtree( folder, ignore_errors=True )
+                os.unlink( lock_path )
+                continue
+
+            entries.append( ( used, size, name ) )
+
+    if max_size <= 0:
+        return
+
+    # least recently used folders first
+    entries.sort()
+    total = sum( size for _, size, _ in entries )
+    for _, size, name in entries:
+        if total <= max_size:
+            break
+        folder = os.path.join( cache_folder, name )
+        with open( folder + '.lock', 'a' ) as lock_file:
+            try:
+                fcntl.flock( lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB )
+            except OSError:
+                continue
+            shutil.rmtree( folder, ignore_errors=True )
+            os.unlink( folder + '.lock' )
+        total -= size
+
+class DownloaderTempCache( DownloaderFrame ):
+
+    # Use shared temp folder of book if it is free, otherwise task keeps own temp folder
+    def LockTemp( self ) -> None:
+        if not self.context.temp_cache or not self.context.temp_cache_key:
+            return
+
+        cache_folder = os.path.join( self.context.temp_folder, TEMP_CACHE_FOLDER )
+        os.makedirs( cache_folder, exist_ok=True )
+
+        folder = os.path.join( cache_folder, self.context.temp_cache_key )
+        lock_file = open( folder + '.lock', 'a' )
+        try:
+            fcntl.flock( lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB )
+            # lock file could be removed by sweeper between open and lock
+            if os.fstat( lock_file.fileno() ).st_ino != os.stat( folder + '.lock' ).st_ino:
+                raise OSError( 'stale lock file' )
+        except OSError:
+            lock_file.close()
+            self.PrintLog( 'temp cache is locked by other task: ' + folder )
+            return
+
+        # lock file time is last usage time for sweeper
+        os.utime( folder + '.lock' )
+        os.makedirs( folder, exist_ok=True )
+
+        self.temp_lock = lock_file
+        self.folders.temp = folder
+
+    # Release shared temp folder, returns False when task used own temp folder
+    def UnlockTemp( self ) -> bool:
+        if self.temp_lock is None:
+            return False
+        try:
+            os.utime( self.folders.temp + '.lock' )
+            fcntl.flock( self.temp_lock, fcntl.LOCK_UN )
+            self.temp_lock.close()
+        except:
+            pass
+        self.temp_lock = None
+        return True
@@ -18,7 +18,10 @@ class DownloaderTools( DownloaderFrame ):
 
         extended_log = True
 
-        if 'Получен бан. Попробуйте позже' in self.dbg_log:
+        if isinstance( err, variables.DownloaderStallException ):
+            message += str( err )
+            extended_log = False
+        elif 'Получен бан. Попробуйте позже' in self.dbg_log:
             message += 'Получен бан. Попробуйте позднее.'
             extended_log = False
         elif 'Не удалось авторизоваться.' in self.dbg_log:
@@ -0,0 +1,419 @@
+from __future__ import annotations
+import os
+import signal
+import asyncio
+import logging
+import traceback
+import multiprocessing
+from multiprocessing.connection import Connection
+from multiprocessing.context import BaseContext
+from multiprocessing import Queue
+from typing import List, Callable
+from app import dto, variables
+from app.configs import GC, QC
+from app.classes.downloader import Downloader, start_downloader, start_worker
+from app.classes.supervisor import SUPERVISOR
+
+logger = logging.getLogger( __name__ )
+
+# Modules imported once by fork server, workers are forked from it already warm,
+# they must not create objects of queue process ( database, redis, interconnect )
+PRELOAD_MODULES = [ 'app.classes.downloader' ]
+
+class DownloaderPool():
+    context:  BaseContext
+    workers:  List[ DownloaderWorker ]
+    statuses: Queue
+    results:  Queue
+    lost:     Callable[ [ int ], None ] | None # called with task of worker died during task
+
+    def __init__( self ) -> None:
+        try:
+            self.context = multiprocessing.get_context( 'forkserver' )
+            self.context.set_forkserver_preload( PRELOAD_MODULES )
+        except ValueError:
+            self.context = multiprocessing.get_context()
+        self.workers  = []
+        self.statuses = None
+        self.results  = None
+        self.lost     = None
+
+    def __repr__( self ) -> str:
+        return '<DownloaderPool '+str( {
+            'size':    self.Size(),
+            'workers': len( self.workers ),
+            'idle':    len( self.idleWorkers() ),
+        } )+'>'
+
+    #
+
+    # Check tasks are started in pool workers
+    def Enabled( self ) -> bool:
+        return GC.executor.mode == 'pool'
+
+    # Maximum of workers, follows configured concurrency and host limit of governor,
+    # group without max_one_time is unbounded, then pool keeps workers it has grown to
+    def Size( self ) -> int:
+        if GC.executor.pool_size > 0:
+            return GC.executor.pool_size
+        size = 0
+        unbounded = False
+        if QC.groups:
+            for group_config in QC.groups.values():
+                if group_config.max_one_time <= 0:
+                    unbounded = True
+                    break
+                size += group_config.max_one_time
+        max_running = variables.QueueGovernor.MaxRunning( GC.governor, GC.executor.reserved_cpus )
+        if unbounded:
+            size = max_running if max_running > 0 else len( self.workers )
+        elif max_running > 0:
+            size = min( size, max_running )
+        return max( size, GC.executor.spare )
+
+    # Start spare workers, queues are passed to workers on start
+    async def Start(
+        self,
+        statuses: Queue,
+        results:  Queue,
+        lost:     Callable[ [ int ], None ] | None = None
+    ) -> None:
+        self.statuses = statuses
+        self.results  = results
+        self.lost     = lost
+        if not self.Enabled():
+            return
+        self.Maintain()
+        logger.info( 'DownloaderPool: started ' + str( self ) )
+
+    # Stop all workers
+    async def Stop( self ) -> None:
+        for worker in self.workers:
+            worker.Shutdown()
+        self.workers = []
+
+    # Drop dead workers, keep spare idle workers and stop idle workers over size
+    def Maintain( self ) -> None:
+        # workers get queues on spawn, so they are not spawned before start
+        if not self.Enabled() or self.statuses is None:
+            return
+        self.workers = [ worker for worker in self.workers if worker.Poll() ]
+
+        size = self.Size()
+        idle = self.idleWorkers()
+        while len( idle ) > 0 and len( self.workers ) > size:
+            worker = idle.pop()
+            worker.Shutdown()
+            self.workers.remove( worker )
+
+        while len( idle ) < GC.executor.spare and len( self.workers ) < size:
+            worker = self.spawnWorker()
+            if worker is None:
+                break
+            idle.append( worker )
+
+    # Send task to idle worker, new worker is started when all are busy
+    def Run(
+        self,
+        request: dto.DownloadRequest,
+        context: variables.DownloaderContext
+    ) -> DownloaderWorker:
+        self.workers = [ worker for worker in self.workers if worker.Poll() ]
+
+        for worker in self.idleWorkers():
+            if worker.Send( request, context ):
+                return worker
+
+        worker = self.spawnWorker()
+        if worker is None or not worker.Send( request, context ):
+            raise Exception( 'DownloaderPool: worker is not available' )
+        return worker
+
+    #
+
+    def idleWorkers( self ) -> List[ DownloaderWorker ]:
+        return [ worker for worker in self.workers if worker.task_id is None ]
+
+    def spawnWorker( self ) -> DownloaderWorker | None:
+        if self.statuses is None or self.results is None:
+            return None
+        try:
+            worker = DownloaderWorker( self.context, self.statuses, self.results )
+            self.workers.append( worker )
+            SUPERVISOR.Watch( worker.proc.sentinel, lambda: self.workerExited( worker ) )
+            return worker
+        except:
+            traceback.print_exc()
+            return None
+
+    # Worker process ended, task of worker will not send result
+    def workerExited(
+        self,
+        worker: DownloaderWorker
+    ) -> None:
+        # task could be finished right before exit
+        worker.Receive()
+        task_id = worker.task_id
+        worker.Poll()
+        if worker in self.workers:
+            self.workers.remove( worker )
+        logger.info( 'DownloaderPool: worker exited ' + str( worker ) )
+        if task_id is not None and self.lost:
+            self.lost( task_id )
+
+
+class DownloaderWorker():
+    proc:       multiprocessing.Process
+    connection: Connection
+    task_id:    int | None = None # running task, None - worker is idle
+
+    def __init__(
+        self,
+        context:  BaseContext,
+        statuses: Queue,
+        results:  Queue
+    ) -> None:
+        self.connection, child_connection = context.Pipe( duplex=True )
+        self.proc = context.Process(
+            target = start_worker,
+            name   = 'Downloader worker',
+            kwargs = {
+                'connection': child_connection,
+                'statuses':   statuses,
+                'results':    results,
+            },
+            daemon = True
+        )
+        self.proc.start()
+        child_connection.close()
+        self.task_id = None
+
+    def __repr__( self ) -> str:
+        return '<DownloaderWorker '+str( {
+            'pid':     self.proc.pid,
+            'task_id': self.task_id,
+        } )+'>'
+
+    # Give task to worker
+    def Send(
+        self,
+        request: dto.DownloadRequest,
+        context: variables.DownloaderContext
+    ) -> bool:
+        try:
+            self.connection.send( ( request, context ) )
+        except:
+            traceback.print_exc()
+            return False
+        self.task_id = request.task_id
+        return True
+
+    # Read finished tasks from worker, returns False when connection is closed
+    def Receive( self ) -> bool:
+        if self.connection.closed:
+            return False
+        try:
+            while self.connection.poll():
+                if self.connection.recv() == self.task_id:
+                    self.task_id = None
+        except ( EOFError, OSError ):
+            return False
+        return True
+
+    # Read finished tasks and check worker, returns False when worker is dead
+    def Poll( self ) -> bool:
+        if not self.Receive() or not self.proc.is_alive():
+            self.task_id = None
+            return False
+        return True
+
+    # Stop worker process with its children
+    def Shutdown( self ) -> None:
+        SUPERVISOR.Unwatch( self.proc.sentinel )
+        try:
+            self.connection.close()
+            if self.proc.is_alive():
+                kill_group( self.proc.pid, signal.SIGTERM )
+        except:
+            pass
+
+    # Supervised handle of running task, worker exits after task is cancelled
+
+    def Signal(
+        self,
+        sig: int
+    ) -> None:
+        if not self.Poll() or self.task_id is None:
+            return
+        kill_group( self.proc.pid, sig )
+
+    async def Wait(
+        self,
+        timeout: float
+    ) -> bool:
+        if self.connection.closed:
+            return True
+        return await SUPERVISOR.Wait( [ self.proc.sentinel, self.connection.fileno() ], timeout )
+
+    async def Stop( self, terminate: bool = True ) -> None:
+        await SUPERVISOR.Stop( self, terminate )
+
+    def Pid( self ) -> int | None:
+        return self.proc.pid
+
+    # Check task is still running in worker
+    def is_alive( self ) -> bool:
+        alive = self.Poll()
+        return alive and self.task_id is not None
+
+    def close( self ) -> None:
+        pass
+
+
+class DownloaderProcess():
+    task_id: int
+    proc:    multiprocessing.Process
+
+    def __init__(
+        self,
+        name:     str,
+        request:  dto.DownloadRequest,
+        context:  variables.DownloaderContext,
+        statuses: Queue,
+        results:  Queue
+    ) -> None:
+        self.task_id = request.task_id
+        self.proc = multiprocessing.Process(
+            target = start_downloader,
+            name   = name,
+            kwargs = {
+                'request':  request,
+                'context':  context,
+                'statuses': statuses,
+                'results':  results,
+            },
+            daemon = True
+        )
+
+    def __repr__( self ) -> str:
+        return str( self.proc )
+
+    # Start process, lost is called when process ends, result could be not sent
+    def start(
+        self,
+        lost: Callable[ [ int ], None ] | None = None
+    ) -> None:
+        self.proc.start()
+        if lost:
+            SUPERVISOR.Watch( self.proc.sentinel, lambda: lost( self.task_id ) )
+
+    # Supervised handle of running task
+
+    def Signal(
+        self,
+        sig: int
+    ) -> None:
+        if self.proc.is_alive():
+            kill_group( self.proc.pid, sig )
+
+    async def Wait(
+        self,
+        timeout: float
+    ) -> bool:
+        return await SUPERVISOR.Wait( [ self.proc.sentinel ], timeout )
+
+    async def Stop( self, terminate: bool = True ) -> None:
+        await SUPERVISOR.Stop( self, terminate )
+
+    def Pid( self ) -> int | None:
+        return self.proc.pid
+
+    def is_alive( self ) -> bool:
+        return self.proc.is_alive()
+
+    def close( self ) -> None:
+        SUPERVISOR.Unwatch( self.proc.sentinel )
+        self.proc.join( 0 )
+        if not self.proc.is_alive():
+            self.proc.close()
+
+
+# Signal process group of downloader, it includes downloader cli started by process
+def kill_group(
+        pid: int,
+        sig: int
+    ) -> None:
+    try:
+        os.killpg( pid, sig )
+    except ( ProcessLookupError, PermissionError ):
+        try:
+            os.kill( pid, sig )
+        except OSError:
+            pass
+
+
+class DownloaderInline():
+    downloader: Downloader
+    task:       asyncio.Task | None = None
+
+    def __init__(
+        self,
+        request:  dto.DownloadRequest,
+        context:  variables.DownloaderContext,
+        statuses: Queue,
+        results:  Queue
+    ) -> None:
+        self.downloader = Downloader(
+            request  = request,
+            context  = context,
+            statuses = statuses,
+            results  = results
+        )
+        self.task = None
+
+    def __repr__( self ) -> str:
+        return '<DownloaderInline '+str( {
+            'task_id': self.downloader.request.task_id,
+            'status':  self.downloader.status,
+        } )+'>'
+
+    def start( self ) -> None:
+        self.task = asyncio.create_task( self.downloader.StartInline() )
+
+    # Supervised handle of running task, cli runs in process group of queue, so only cli is signalled
+
+    def Signal(
+        self,
+        sig: int
+    ) -> None:
+        if sig == signal.SIGKILL:
+            if self.downloader.proc and self.downloader.proc.returncode is None:
+                self.downloader.proc.kill()
+            if self.task:
+                self.task.cancel()
+        else:
+            self.downloader.CancelDownload()
+
+    async def Wait(
+        self,
+        timeout: float
+    ) -> bool:
+        if self.task is None:
+            return True
+        done, _ = await asyncio.wait( { self.task }, timeout=timeout )
+        return len( done ) > 0
+
+    async def Stop( self, terminate: bool = True ) -> None:
+        await SUPERVISOR.Stop( self, terminate )
+
+    # Only cli has own process
+    def Pid( self ) -> int | None:
+        if self.downloader.proc:
+            return self.downloader.proc.pid
+        return None
+
+    def is_alive( self ) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def close( self ) -> None:
+        pass
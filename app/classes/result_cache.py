@@ -0,0 +1,306 @@
+from __future__ import annotations
+import os
+import time
+import ujson
+import shutil
+import hashlib
+import asyncio
+import logging
+import traceback
+from collections import OrderedDict
+from typing import List, Dict, Any
+from app import dto, variables
+from app.configs import DC
+
+logger = logging.getLogger( __name__ )
+
+# File with cached result description inside entry folder
+CACHE_META = 'meta.json'
+
+class ResultCache():
+    entries: OrderedDict[ str, Dict[ str, Any ] ] # key hash -> entry, least recently used first
+    size:    int = 0 # bytes of all entries
+    hits:    int = 0
+    misses:  int = 0
+
+    def __init__( self ) -> None:
+        self.entries = OrderedDict()
+        self.size    = 0
+        self.hits    = 0
+        self.misses  = 0
+
+    def __repr__( self ) -> str:
+        return '<ResultCache '+str( {
+            'entries': len( self.entries ),
+            'size':    self.size,
+            'hits':    self.hits,
+            'misses':  self.misses,
+        } )+'>'
+
+    #
+
+    # Check cache is configured
+    def Enabled( self ) -> bool:
+        return bool( DC.cache.folder ) and DC.cache.ttl > 0
+
+    # Load stored entries
+    async def Start( self ) -> None:
+        if not self.Enabled():
+            return
+        try:
+            await asyncio.to_thread( self.load )
+            logger.info( 'ResultCache: loaded ' + str( self ) )
+        except:
+            traceback.print_exc()
+
+    # Drop expired entries and entries over size limit
+    async def Flush( self ) -> None:
+        if not self.Enabled():
+            return
+        keys = self.evict()
+        if len( keys ) > 0:
+            await asyncio.to_thread( self.remove, keys )
+
+    async def Export( self ) -> Dict[ str, int ]:
+        return {
+            'entries': len( self.entries ),
+            'size':    self.size,
+            'hits':    self.hits,
+            'misses':  self.misses,
+        }
+
+    #
+
+    # Build result for request from cached files, files are linked into request folders
+    async def Get(
+        self,
+        request: dto.DownloadRequest
+    ) -> dto.DownloadResult | None:
+        if not self.Enabled():
+            return None
+
+        key = self.hashKey( request )
+        if key is None:
+            return None
+
+        entry = self.entries.get( key )
+        if entry is None or entry[ 'created' ] + DC.cache.ttl < time.time():
+            self.misses += 1
+            return None
+
+        try:
+            meta = entry[ 'meta' ]
+            paths = [ meta[ 'cover' ], meta[ 'thumb' ] ] + meta[ 'files' ]
+            paths = await asyncio.to_thread( self.linkFrom, key, request.task_id, paths )
+        except:
+            traceback.print_exc()
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end( key )
+        self.hits += 1
+
+        return dto.DownloadResult(
+            task_id    = request.task_id,
+            user_id    = request.user_id,
+            web_id     = request.web_id,
+            chat_id    = request.chat_id,
+            message_id = request.message_id,
+            site       = request.site,
+            url        = request.url,
+            format     = request.format,
+            start      = request.start,
+            end        = request.end,
+            status     = variables.DownloaderStatus.DONE,
+            text       = meta[ 'text' ],
+            cover      = paths[ 0 ],
+            thumb      = paths[ 1 ],
+            files      = paths[ 2: ],
+            orig_size  = meta[ 'orig_size' ],
+            oper_size  = meta[ 'oper_size' ],
+        )
+
+    # Store successful result of request
+    async def Put(
+        self,
+        request: dto.DownloadRequest,
+        result:  dto.DownloadResult
+    ) -> None:
+        if not self.Enabled():
+            return
+        if result.status != variables.DownloaderStatus.DONE or len( result.files ) == 0:
+            return
+
+        key = self.hashKey( request )
+        if key is None or key in self.entries:
+            return
+
+        try:
+            entry = await asyncio.to_thread( self.store, key, result )
+        except:
+            traceback.print_exc()
+            return
+
+        self.entries[ key ] = entry
+        self.size += entry[ 'size' ]
+
+        if DC.cache.max_size > 0 and self.size > DC.cache.max_size:
+            await self.Flush()
+
+    #
+
+    def hashKey(
+        self,
+        request: dto.DownloadRequest
+    ) -> str | None:
+        key = variables.QueueSubscribers.ContentKey( request )
+        if key is None:
+            return None
+        return hashlib.sha1( ujson.dumps( key ).encode( 'utf-8' ) ).hexdigest()
+
+    def entryFolder(
+        self,
+        key: str
+    ) -> str:
+        return os.path.join( DC.cache.folder, key )
+
+    # Map cached path ( "save/..." or "arch/..." ) to task folder
+    def taskPath(
+        self,
+        path:    str,
+        task_id: int
+    ) -> str:
+        root, _, relative = path.partition( '/' )
+        folder = DC.save_folder if root == 'save' else DC.arch_folder
+        return os.path.join( folder, str( task_id ), relative )
+
+    def link(
+        self,
+        src: str,
+        dst: str
+    ) -> None:
+        os.makedirs( os.path.dirname( dst ), exist_ok=True )
+        if os.path.exists( dst ):
+            return
+        try:
+            os.link( src, dst )
+        except OSError:
+            shutil.copy2( src, dst )
+
+    def linkFrom(
+        self,
+        key:     str,
+        task_id: int,
+        paths:   List[ str ]
+    ) -> List[ str ]:
+        folder = self.entryFolder( key )
+        linked: List[ str ] = []
+        for path in paths:
+            if not path:
+                linked.append( '' )
+                continue
+            task_path = self.taskPath( path, task_id )
+            self.link( os.path.join( folder, path ), task_path )
+            linked.append( task_path )
+        return linked
+
+    def store(
+        self,
+        key:    str,
+        result: dto.DownloadResult
+    ) -> Dict[ str, Any ]:
+        folder = self.entryFolder( key )
+        temp_folder = folder + '.tmp'
+        shutil.rmtree( temp_folder, ignore_errors=True )
+
+        roots = {
+            'save': os.path.join( DC.save_folder, str( result.task_id ) ),
+            'arch': os.path.join( DC.arch_folder, str( result.task_id ) ),
+        }
+
+        size = 0
+        paths: List[ str ] = []
+        for path in [ result.cover, result.thumb ] + list( result.files ):
+            cached_path = ''
+            for root, root_folder in roots.items():
+                if path and str( path ).startswith( root_folder + os.sep ):
+                    cached_path = root + '/' + os.path.relpath( path, root_folder )
+                    self.link( path, os.path.join( temp_folder, cached_path ) )
+                    size += os.path.getsize( path )
+                    break
+            if path and not cached_path:
+                # file outside of task folders can not be linked for other tasks
+                shutil.rmtree( temp_folder, ignore_errors=True )
+                raise Exception( f'ResultCache: unexpected result path {path}' )
+            paths.append( cached_path )
+
+        meta = {
+            'created':   time.time(),
+            'text':      result.text,
+            'cover':     paths[ 0 ],
+            'thumb':     paths[ 1 ],
+            'files':     paths[ 2: ],
+            'orig_size': result.orig_size,
+            'oper_size': result.oper_size,
+            'size':      size,
+        }
+        with open( os.path.join( temp_folder, CACHE_META ), 'w', encoding='utf-8' ) as _meta_file:
+            _meta_file.write( ujson.dumps( meta ) )
+
+        shutil.rmtree( folder, ignore_errors=True )
+        os.rename( temp_folder, folder )
+
+        return {
+            'created': meta[ 'created' ],
+            'size':    size,
+            'meta':    meta,
+        }
+
+    def load( self ) -> None:
+        os.makedirs( DC.cache.folder, exist_ok=True )
+
+        entries: List[ tuple[ str, Dict[ str, Any ] ] ] = []
+        for key in os.listdir( DC.cache.folder ):
+            folder = self.entryFolder( key )
+            meta_file = os.path.join( folder, CACHE_META )
+            if key.endswith( '.tmp' ) or not os.path.isfile( meta_file ):
+                # unfinished store
+                shutil.rmtree( folder, ignore_errors=True )
+                continue
+            try:
+                with open( meta_file, 'r', encoding='utf-8' ) as _meta_file:
+                    meta = ujson.loads( _meta_file.read() )
+                entries.append( ( key, {
+                    'created': meta[ 'created' ],
+                    'size':    meta[ 'size' ],
+                    'meta':    meta,
+                } ) )
+            except:
+                shutil.rmtree( folder, ignore_errors=True )
+
+        # without access history, oldest entries are evicted first
+        entries.sort( key=lambda entry: entry[ 1 ][ 'created' ] )
+        self.entries = OrderedDict( entries )
+        self.size = sum( entry[ 'size' ] for _, entry in entries )
+
+        self.remove( self.evict() )
+
+    # Forget expired and least recently used entries, returns keys to remove from disk
+    def evict( self ) -> List[ str ]:
+        keys: List[ str ] = []
+        expired = time.time() - DC.cache.ttl
+        for key in list( self.entries.keys() ):
+            over_size = DC.cache.max_size > 0 and self.size > DC.cache.max_size
+            if self.entries[ key ][ 'created' ] >= expired and not over_size:
+                continue
+            entry = self.entries.pop( key )
+            self.size -= entry[ 'size' ]
+            keys.append( key )
+        return keys
+
+    def remove(
+        self,
+        keys: List[ str ]
+    ) -> None:
+        for key in keys:
+            shutil.rmtree( self.entryFolder( key ), ignore_errors=True )
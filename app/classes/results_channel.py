@@ -0,0 +1,119 @@
+from __future__ import annotations
+import asyncio
+import logging
+import threading
+import traceback
+from multiprocessing import Queue
+from typing import List, Dict, Any, Type
+from app import dto
+
+logger = logging.getLogger( __name__ )
+
+class ResultsChannel():
+    statuses: Queue
+    results:  Queue
+    channel:  asyncio.Queue
+    readers:  List[ threading.Thread ]
+    pending:  Dict[ int, int ] # task_id -> results received and not handled yet
+
+    def __init__(
+        self,
+        statuses: Queue,
+        results:  Queue
+    ) -> None:
+        self.statuses = statuses
+        self.results  = results
+        self.channel  = asyncio.Queue()
+        self.readers  = []
+        self.pending  = {}
+
+    def __repr__( self ) -> str:
+        return '<ResultsChannel '+str( {
+            'pending': self.channel.qsize(),
+            'readers': len( [ reader for reader in self.readers if reader.is_alive() ] ),
+        } )+'>'
+
+    #
+
+    # Start reader threads, items are unpickled and parsed outside of event loop
+    async def Start( self ) -> None:
+        loop = asyncio.get_running_loop()
+        self.readers = [ reader for reader in self.readers if reader.is_alive() ]
+        if len( self.readers ) > 0:
+            return
+        for source, model in [ ( self.results, dto.DownloadResult ), ( self.statuses, dto.DownloadStatus ) ]:
+            reader = threading.Thread(
+                target = self.reader,
+                name   = 'ResultsChannel ' + model.__name__,
+                args   = ( loop, source, model ),
+                daemon = True
+            )
+            reader.start()
+            self.readers.append( reader )
+
+    # Stop reader threads and wake waiting consumer
+    async def Stop( self ) -> None:
+        for source in [ self.results, self.statuses ]:
+            try:
+                source.put( None )
+            except:
+                pass
+        self.channel.put_nowait( None )
+
+    # Wait next result or status, None when channel is stopped
+    async def Get( self ) -> dto.DownloadResult | dto.DownloadStatus | None:
+        return await self.channel.get()
+
+    # Mark item as handled
+    def Done(
+        self,
+        item: dto.DownloadResult | dto.DownloadStatus | None
+    ) -> None:
+        if isinstance( item, dto.DownloadResult ):
+            ok: bool = item.task_id in self.pending
+            if ok:
+                self.pending[ item.task_id ] -= 1
+                if self.pending[ item.task_id ] <= 0:
+                    del self.pending[ item.task_id ]
+
+    # Check result of task is received and not handled yet
+    def HasResult(
+        self,
+        task_id: int
+    ) -> bool:
+        return task_id in self.pending
+
+    #
+
+    def push(
+        self,
+        item: dto.DownloadResult | dto.DownloadStatus
+    ) -> None:
+        if isinstance( item, dto.DownloadResult ):
+            self.pending[ item.task_id ] = self.pending.get( item.task_id, 0 ) + 1
+        self.channel.put_nowait( item )
+
+    def reader(
+        self,
+        loop:   asyncio.AbstractEventLoop,
+        source: Queue,
+        model:  Type[ dto.DownloadResult ] | Type[ dto.DownloadStatus ]
+    ) -> None:
+        while True:
+            try:
+                data: Dict[ str, Any ] | None = source.get()
+            except ( EOFError, OSError, ValueError ):
+                break
+            if data is None:
+                break
+            try:
+                item = model( **data )
+            except:
+                traceback.print_exc()
+                continue
+            try:
+                loop.call_soon_threadsafe( self.push, item )
+            except RuntimeError:
+                # event loop is closed
+                break
+        logger.info( 'ResultsChannel: reader ' + model.__name__ + ' stopped' )
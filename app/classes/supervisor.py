@@ -0,0 +1,142 @@
+from __future__ import annotations
+import time
+import signal
+import asyncio
+import logging
+import traceback
+from typing import List, Dict, Callable, Protocol
+from app.configs import GC
+
+logger = logging.getLogger( __name__ )
+
+class SupervisedHandle( Protocol ):
+    # Process-like handle of running task
+    def is_alive( self ) -> bool: ...
+    def close( self ) -> None: ...
+    # Send signal to task processes
+    def Signal( self, sig: int ) -> None: ...
+    # Wait for possible end of task, returns False on timeout
+    async def Wait( self, timeout: float ) -> bool: ...
+
+class ProcessSupervisor():
+    readers: Dict[ int, List[ Callable[ [], None ] ] ] # file descriptor -> one-shot callbacks
+
+    def __init__( self ) -> None:
+        self.readers = {}
+
+    def __repr__( self ) -> str:
+        return '<ProcessSupervisor '+str( {
+            'readers': len( self.readers ),
+        } )+'>'
+
+    #
+
+    # Call callback once, when file descriptor ( process sentinel or pipe ) becomes readable
+    def Watch(
+        self,
+        fd:       int,
+        callback: Callable[ [], None ]
+    ) -> None:
+        ok: bool = fd in self.readers
+        if not ok:
+            self.readers[ fd ] = []
+            asyncio.get_running_loop().add_reader( fd, self.ready, fd )
+        self.readers[ fd ].append( callback )
+
+    # Forget callbacks of file descriptor, must be called before descriptor is closed
+    def Unwatch(
+        self,
+        fd: int
+    ) -> None:
+        ok: bool = fd in self.readers
+        if ok:
+            del self.readers[ fd ]
+            try:
+                asyncio.get_running_loop().remove_reader( fd )
+            except:
+                pass
+
+    # Wait until one of file descriptors becomes readable, returns False on timeout
+    async def Wait(
+        self,
+        fds:     List[ int ],
+        timeout: float
+    ) -> bool:
+        future = asyncio.get_running_loop().create_future()
+
+        def _ready() -> None:
+            if not future.done():
+                future.set_result( True )
+
+        for fd in fds:
+            self.Watch( fd, _ready )
+        try:
+            return await asyncio.wait_for( future, timeout )
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            for fd in fds:
+                self.unwatchCallback( fd, _ready )
+
+    # Stop task: SIGTERM, then SIGKILL after grace period, handle is closed after processes are reaped
+    async def Stop(
+        self,
+        handle:    SupervisedHandle,
+        terminate: bool = True
+    ) -> None:
+        if terminate and handle.is_alive():
+            handle.Signal( signal.SIGTERM )
+
+        if not await self.waitStopped( handle, GC.executor.kill_timeout ):
+            logger.warning( 'ProcessSupervisor: killing ' + str( handle ) )
+            handle.Signal( signal.SIGKILL )
+            if not await self.waitStopped( handle, GC.executor.kill_timeout ):
+                logger.error( 'ProcessSupervisor: not stopped ' + str( handle ) )
+
+        try:
+            handle.close()
+        except:
+            traceback.print_exc()
+
+    #
+
+    def ready(
+        self,
+        fd: int
+    ) -> None:
+        callbacks = self.readers.get( fd, [] )
+        # process sentinel stays readable, so callbacks are one-shot
+        self.Unwatch( fd )
+        for callback in callbacks:
+            try:
+                callback()
+            except:
+                traceback.print_exc()
+
+    def unwatchCallback(
+        self,
+        fd:       int,
+        callback: Callable[ [], None ]
+    ) -> None:
+        ok: bool = fd in self.readers
+        if ok:
+            if callback in self.readers[ fd ]:
+                self.readers[ fd ].remove( callback )
+            if len( self.readers[ fd ] ) == 0:
+                self.Unwatch( fd )
+
+    async def waitStopped(
+        self,
+        handle:  SupervisedHandle,
+        timeout: float
+    ) -> bool:
+        deadline = time.monotonic() + timeout
+        while handle.is_alive():
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return False
+            await handle.Wait( left )
+        return True
+
+
+SUPERVISOR = ProcessSupervisor()
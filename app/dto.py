@@ -26,10 +26,17 @@ class DownloadRequest(BaseModel):
     proxy:      str | None = ""
     hashtags:   str | None = ""
     filename:   str | None = None
+    priority:   int | None = 0
+    canonical_url: str | None = Field( default=None, exclude=True ) # set by queue, original url is downloaded
 
     class Config:
         from_attributes = True
 
+    # Url of request in keys of duplicates, coalescing and caches
+    @property
+    def key_url(self) -> str:
+        return self.canonical_url or self.url.strip()
+
     def __export__(self) -> Dict:
         return {
             'task_id':    self.task_id,
@@ -49,8 +56,19 @@ class DownloadRequest(BaseModel):
             'thumb':      self.thumb,
             'hashtags':   self.hashtags,
             'proxy':      self.proxy,
+            'priority':   self.priority,
         }
 
+    # Normalized key of request to find duplicate downloads of same user
+    def __fingerprint__(self) -> tuple:
+        return (
+            self.user_id,
+            self.key_url,
+            self.start or 0,
+            self.end or 0,
+            bool( self.images ),
+        )
+
 class DownloadCancelRequest(BaseModel):
     task_id:    int
 
@@ -60,6 +78,15 @@ class DownloadClearRequest(BaseModel):
 class DownloadLogRequest(BaseModel):
     task_id:    int
 
+class DownloadUserRequest(BaseModel):
+    user_id:    int
+
+class DownloadBatchRequest(BaseModel):
+    requests:   List[ DownloadRequest ]
+
+class DownloadPositionRequest(BaseModel):
+    task_id:    int
+
 #
 
 class SiteCheckResponse(BaseModel):
@@ -78,12 +105,42 @@ class DownloadResponse(BaseModel):
     message: str = ""
     task_id: int | None = None
 
+class DownloadBatchResponse(BaseModel):
+    results:     List[ DownloadResponse ] = []
+    retry_after: int | None = None
+
+class DownloadPositionResponse(BaseModel):
+    task_id:        int
+    status:         str = "unknown" # waiting / running / unknown
+    group:          str = ""
+    site:           str = ""
+    group_position: int = 0
+    group_total:    int = 0
+    site_position:  int = 0
+    site_total:     int = 0
+    starts_in:      int = 0 # estimated seconds to start
+    eta:            int = 0 # estimated seconds to finish
+
 class DownloadCancelResponse(BaseModel):
     user_id:    int
     web_id:     str | None = None
     chat_id:    int
     message_id: int
 
+class DownloadUserCancelResponse(BaseModel):
+    tasks: List[ DownloadCancelResponse ] = []
+
+class DownloadUserTask(BaseModel):
+    task_id: int
+    status:  str # waiting / running
+    site:    str
+    group:   str
+    url:     str
+    message: str = "" # last status of running task
+
+class DownloadUserTasksResponse(BaseModel):
+    tasks: List[ DownloadUserTask ] = []
+
 class ExportStatsResponse(BaseModel):
     current_day:    ExportStatsResponseGroup
     previous_day:   ExportStatsResponseGroup
@@ -92,6 +149,7 @@ class ExportStatsResponse(BaseModel):
     current_year:   ExportStatsResponseGroup
     previous_year:  ExportStatsResponseGroup
     total:          ExportStatsResponseGroup
+    cache:          ExportStatsResponseCache | None = None
 
     class Config:
         from_attributes = True
@@ -135,6 +193,12 @@ class ExportStatsResponseGroup(BaseModel):
     class Config:
         from_attributes = True
 
+class ExportStatsResponseCache(BaseModel):
+    entries: int = 0
+    size:    int = 0
+    hits:    int = 0
+    misses:  int = 0
+
 class ExportStatsResponseElement(BaseModel):
     site:      str = ""
     success:   int = 0
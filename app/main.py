@@ -99,6 +99,7 @@ async def export_queue():
 @app.get('/export/stats')
 async def export_stats():
     data = await DB.GetStats()
+    data[ 'cache' ] = await DQ.ExportCache()
     resp = dto.ExportStatsResponse(**data)
     return resp
 
@@ -136,6 +137,18 @@ async def download_new( request: dto.DownloadRequest ):
             status_code = 200 if resp.status else 500,
             content =     resp.message
         )
+    except variables.QueueAdmissionException as e:
+        return JSONResponse(
+            status_code = 429,
+            content =     str(e),
+            headers =     { 'Retry-After': str( e.retry_after ) }
+        )
+    except asyncio.TimeoutError:
+        # request could be already saved, so retry is not invited
+        return JSONResponse(
+            status_code = 503,
+            content =     'Очередь не ответила вовремя, загрузка могла быть добавлена'
+        )
     except variables.QueueCheckException as e:
         return JSONResponse(
             status_code = 500,
@@ -175,6 +188,75 @@ async def download_cancel( request: dto.DownloadCancelRequest ):
         )
 
 
+@app.post('/download/user/list')
+async def download_user_list( request: dto.DownloadUserRequest ):
+    try:
+        resp = await DQ.GetUserTasks( request )
+        return resp
+    except Exception as e:
+        return JSONResponse(
+            status_code = 500,
+            content =     "Произошла ошибка: "+str(e)
+        )
+
+
+@app.post('/download/user/cancel')
+async def download_user_cancel( request: dto.DownloadUserRequest ):
+    try:
+        # tasks are removed from memory before their rows, so cancel is finished in background when client stops waiting
+        resp = await asyncio.wait_for( asyncio.shield( DQ.CancelUserTasks( request ) ), 30 )
+        return resp
+    except asyncio.TimeoutError:
+        return JSONResponse(
+            status_code = 503,
+            content =     'Очередь не ответила вовремя, загрузки могли быть отменены'
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code = 500,
+            content =     "Произошла ошибка: "+str(e)
+        )
+
+
+@app.post('/download/batch')
+async def download_batch( request: dto.DownloadBatchRequest ):
+
+    try:
+        # batch is not cancelled midway, it is finished in background when client stops waiting
+        resp = await asyncio.wait_for( asyncio.shield( DQ.AddTasks( request ) ), 30 )
+
+        return resp
+    except asyncio.TimeoutError:
+        # part of batch could be already added, so retry is not invited
+        return JSONResponse(
+            status_code = 503,
+            content =     'Очередь не ответила вовремя, загрузки могли быть добавлены'
+        )
+    except variables.QueueCheckException as e:
+        return JSONResponse(
+            status_code = 500,
+            content =     str(e)
+        )
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(
+            status_code = 500,
+            content =     "Произошла ошибка: "+str(e)
+        )
+
+
+@app.post('/download/position')
+async def download_position( request: dto.DownloadPositionRequest ):
+    try:
+        resp = await DQ.GetPosition( request )
+        return resp
+    except Exception as e:
+        return JSONResponse(
+            status_code = 500,
+            content =     "Произошла ошибка: "+str(e)
+        )
+
+
 @app.post('/download/get_log')
 async def download_cancel( request: dto.DownloadLogRequest ):
     try:
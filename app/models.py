@@ -47,6 +47,7 @@ class DownloadRequest(Base):
     hashtags: Mapped[str] =     mapped_column('hashtags', String(5), default="no")
     filename: Mapped[str] =     mapped_column('filename', Text, nullable=True)
     proxy: Mapped[str | None] = mapped_column('proxy', Text, nullable=True)
+    priority: Mapped[int] =     mapped_column('priority', Integer, default=0, server_default='0')
 
     def __export__(self) -> dict:
         return {
@@ -67,6 +68,7 @@ class DownloadRequest(Base):
             'thumb':      self.thumb,
             'hashtags':   self.hashtags,
             'proxy':      self.proxy,
+            'priority':   self.priority,
         }
 
     def __repr__(self) -> str:
@@ -94,6 +96,7 @@ class DownloadRequest(Base):
         request.hashtags   = dto.hashtags
         request.filename   = dto.filename
         request.proxy      = dto.proxy
+        request.priority   = dto.priority or 0
 
         return request
     
@@ -176,6 +179,7 @@ class DownloadHistory(Base):
     site: Mapped[str] =       mapped_column('site', String(100), default="")
     format: Mapped[str] =     mapped_column('format', String(10), default="")
     status: Mapped[int] =     mapped_column('status', Integer, nullable=True)
+    started: Mapped[datetime | None] = mapped_column('started', DateTime, nullable=True)
     ended: Mapped[datetime] = mapped_column('ended', DateTime, default=datetime.now)
     orig_size: Mapped[int] =  mapped_column('orig_size', BigInteger, default=0)
     oper_size: Mapped[int] =  mapped_column('oper_size', BigInteger, default=0)
@@ -183,7 +187,7 @@ class DownloadHistory(Base):
     dbg_config: Mapped[str] = mapped_column('dbg_config', Text, nullable=True)
 
     @classmethod
-    def from_dto( cls, dto: dto.DownloadResult ) -> Self:
+    def from_dto( cls, dto: dto.DownloadResult, started: datetime | None = None ) -> Self:
         history = cls()
         history.task_id    = dto.task_id
         history.user_id    = dto.user_id
@@ -193,6 +197,7 @@ class DownloadHistory(Base):
         history.site       = dto.site
         history.format     = dto.format
         history.status     = dto.status
+        history.started    = started
         history.ended      = datetime.now()
         history.orig_size  = dto.orig_size
         history.oper_size  = dto.oper_size
@@ -8,7 +8,11 @@ from .queue_config import *
 from .queue_stats import *
 from .queue_waiting import *
 from .queue_running import *
+from .queue_subscribers import *
 from .queue_sites_groups import *
+from .queue_proxy_pool import *
+from .queue_admission import *
+from .queue_governor import *
 
 @dataclass(frozen=True)
 class DownloaderStatus():
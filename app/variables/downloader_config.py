@@ -1,9 +1,11 @@
 from __future__ import annotations
 import os
 import ujson
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, asdict
 from dacite import from_dict, Config
 from typing import List, Dict, Any
+from app import dto
+from .queue_config import QueueConfigResources
 
 class DownloaderConfig():
     save_folder: str | os.PathLike
@@ -12,6 +14,8 @@ class DownloaderConfig():
     arch_folder: str | os.PathLike
     compression: Dict[ str, str | os.PathLike ]
     downloaders: Dict[ str, DownloaderConfigExec ]
+    cache:       DownloaderConfigCache
+    temp_cache:  DownloaderConfigTempCache
     file_limit:  int = 1_549_000_000
     inited:      bool = False
 
@@ -22,6 +26,8 @@ class DownloaderConfig():
             'temp_folder': self.temp_folder,
             'arch_folder': self.arch_folder,
             'compression': self.compression,
+            'cache':       self.cache,
+            'temp_cache':  self.temp_cache,
         } ) + '>'
 
     async def UpdateConfig( self ) -> None:
@@ -69,6 +75,14 @@ class DownloaderConfig():
         self.compression = config[ 'compression' ] if 'compression' in config else {}
 
 
+        _cache = config[ 'cache' ] if 'cache' in config else {}
+        self.cache = from_dict( data_class=DownloaderConfigCache, data=_cache, config=Config( check_types=False ) )
+
+
+        _temp_cache = config[ 'temp_cache' ] if 'temp_cache' in config else {}
+        self.temp_cache = from_dict( data_class=DownloaderConfigTempCache, data=_temp_cache, config=Config( check_types=False ) )
+
+
         self.file_limit = config[ 'file_limit' ] if 'file_limit' in config else 1_549_000_000
 
         if not os.environ.get('LOCAL_SERVER'):
@@ -122,6 +136,20 @@ class DownloaderConfigFArg(DownloaderConfigArg):
     tag: str | None = None
 
 
+@dataclass
+class DownloaderConfigCache():
+    folder:   str | os.PathLike = '' # empty folder disables cache
+    ttl:      int = 0 # seconds, 0 disables cache
+    max_size: int = 0 # bytes, 0 is unlimited
+
+
+@dataclass
+class DownloaderConfigTempCache():
+    enabled:  bool = False # keep temp folders by book url instead of task
+    max_size: int = 0 # bytes, 0 is unlimited
+    max_age:  int = 0 # seconds since last usage, 0 is unlimited
+
+
 @dataclass
 class DownloaderConfigClean():
     folder: str = ''
@@ -141,6 +169,13 @@ class DownloaderContext():
     flaresolverr:  str = ""
     pattern:       str = "{Book.Title}"
     page_delay:    int = 0
+    stall_timeout: int = 0 # seconds without downloader output to stop it, 0 - disabled
+    timeout:       int = 0 # seconds of download to stop it, 0 - disabled
+    temp_cache:    bool = False
+    temp_cache_key: str = "" # shared temp folder of book, empty - task uses own temp folder
+    resources:     QueueConfigResources | None = None # profile set by group, None - nothing is set
+    cpus:          List[ int ] = field( default_factory=list ) # cpus not reserved for queue, used when profile has no cpus
+    extra:         List[ dto.DownloadRequest ] = field( default_factory=list ) # other formats downloaded in same launch
 
 
     def __export__( self ) -> Dict[ str, Any ]:
@@ -154,7 +189,14 @@ class DownloaderContext():
             'flaresolverr': self.flaresolverr,
             'pattern':      self.pattern,
             'page_delay':   self.page_delay,
+            'stall_timeout': self.stall_timeout,
+            'timeout':      self.timeout,
             'file_limit':   self.file_limit,
+            'temp_cache':   self.temp_cache,
+            'temp_cache_key': self.temp_cache_key,
+            'resources':    asdict( self.resources ) if self.resources else None,
+            'cpus':         self.cpus,
+            'extra':        [ request.task_id for request in self.extra ],
         }
 
 
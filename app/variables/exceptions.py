@@ -2,4 +2,14 @@ class QueueCheckException(Exception):
     pass
 
 class DownloaderException(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class DownloaderStallException(DownloaderException):
+    pass
+
+class QueueAdmissionException(Exception):
+    retry_after: int = 0
+
+    def __init__( self, message: str, retry_after: int ) -> None:
+        super().__init__( message )
+        self.retry_after = retry_after
\ No newline at end of file
@@ -2,6 +2,8 @@ from __future__ import annotations
 import os
 import ujson
 import traceback
+from dataclasses import dataclass
+from dacite import from_dict, Config
 from typing import Dict, Any
 
 
@@ -11,6 +13,10 @@ class GlobalConfig():
     redis_server:  str = 'redis://redis:6379/1'
     flaresolverr:  str
     restore_tasks: bool = True
+    admission:     GlobalConfigAdmission
+    executor:      GlobalConfigExecutor
+    watchdog:      GlobalConfigWatchdog
+    governor:      GlobalConfigGovernor
 
     def __init__( self ) -> None:
         config_file = '/app/configs/global.json'
@@ -32,6 +38,98 @@ class GlobalConfig():
         else:
             self.restore_tasks = True
 
+        if 'admission' in config:
+            self.admission = from_dict( data_class=GlobalConfigAdmission, data=config['admission'], config=Config( check_types=False ) )
+        else:
+            self.admission = GlobalConfigAdmission()
+
+        if 'executor' in config:
+            self.executor = from_dict( data_class=GlobalConfigExecutor, data=config['executor'], config=Config( check_types=False ) )
+        else:
+            self.executor = GlobalConfigExecutor()
+
+        if 'watchdog' in config:
+            self.watchdog = from_dict( data_class=GlobalConfigWatchdog, data=config['watchdog'], config=Config( check_types=False ) )
+        else:
+            self.watchdog = GlobalConfigWatchdog()
+
+        if 'governor' in config:
+            self.governor = from_dict( data_class=GlobalConfigGovernor, data=config['governor'], config=Config( check_types=False ) )
+        else:
+            self.governor = GlobalConfigGovernor()
+
 
     async def UpdateConfig( self ) -> None:
-        self.__init__()
\ No newline at end of file
+        self.__init__()
+
+
+@dataclass
+class GlobalConfigAdmission():
+    max_wait_time:  int = 0     # expected waiting time of group to reject new tasks, 0 - disabled
+    max_loop_lag:   float = 0.5 # event loop lag to reject new tasks, 0 - disabled
+    max_db_latency: float = 2.0 # database latency to reject new tasks, 0 - disabled
+    retry_after:    int = 5     # minimal Retry-After, in seconds
+
+    def __repr__(self) -> str:
+        return str( {
+            'max_wait_time':  self.max_wait_time,
+            'max_loop_lag':   self.max_loop_lag,
+            'max_db_latency': self.max_db_latency,
+            'retry_after':    self.retry_after,
+        } )
+
+
+@dataclass
+class GlobalConfigExecutor():
+    mode:          str = 'pool' # pool - warm worker processes, process - new process for every task, inline - inside queue loop
+    pool_size:     int = 0      # maximum of worker processes, 0 - sum of max_one_time of groups
+    spare:         int = 2      # idle workers kept started for next tasks
+    kill_timeout:  int = 10     # seconds from SIGTERM to SIGKILL of stopped task
+    reserved_cpus: int = 1      # first cpus kept for queue, downloaders run on other cpus
+
+    def __repr__(self) -> str:
+        return str( {
+            'mode':          self.mode,
+            'pool_size':     self.pool_size,
+            'spare':         self.spare,
+            'kill_timeout':  self.kill_timeout,
+            'reserved_cpus': self.reserved_cpus,
+        } )
+
+
+@dataclass
+class GlobalConfigWatchdog():
+    stall_timeout:  int = 300    # seconds without downloader output to stop it, 0 - disabled
+    timeout_factor: float = 3.0  # hard timeout of site is p99 of its durations multiplied by factor
+    min_samples:    int = 20     # minimal downloads of site in history to use its p99
+    min_timeout:    int = 600
+    max_timeout:    int = 7200   # also used for sites without history, 0 - disabled
+
+    def __repr__(self) -> str:
+        return str( {
+            'stall_timeout':  self.stall_timeout,
+            'timeout_factor': self.timeout_factor,
+            'min_samples':    self.min_samples,
+            'min_timeout':    self.min_timeout,
+            'max_timeout':    self.max_timeout,
+        } )
+
+
+@dataclass
+class GlobalConfigGovernor():
+    max_running:         int = 0      # running downloaders on host, 0 - by cores
+    tasks_per_core:      int = 4      # running downloaders per core not reserved for queue, 0 - not limited
+    min_free_memory:     int = 512    # megabytes of available memory kept after next start, 0 - disabled
+    task_memory:         int = 300    # megabytes expected for task while running downloaders are not measured
+    max_memory_pressure: float = 10.0 # memory pressure ( PSI some avg10 ) to hold starts, 0 - disabled
+    max_cpu_pressure:    float = 0    # cpu pressure ( PSI some avg10 ) to hold starts, 0 - disabled
+
+    def __repr__(self) -> str:
+        return str( {
+            'max_running':         self.max_running,
+            'tasks_per_core':      self.tasks_per_core,
+            'min_free_memory':     self.min_free_memory,
+            'task_memory':         self.task_memory,
+            'max_memory_pressure': self.max_memory_pressure,
+            'max_cpu_pressure':    self.max_cpu_pressure,
+        } )
\ No newline at end of file
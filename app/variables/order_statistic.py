@@ -0,0 +1,115 @@
+from __future__ import annotations
+import random
+from typing import Any
+
+class OrderStatisticTree():
+    root: OrderStatisticNode | None = None
+
+    def __init__( self ) -> None:
+        self.root = None
+
+    def __repr__( self ) -> str:
+        return '<OrderStatisticTree '+str( self.Len() )+'>'
+
+    def __len__( self ) -> int:
+        return self.Len()
+
+    # Count of keys in tree
+    def Len( self ) -> int:
+        return _size( self.root )
+
+    # Add key to tree
+    def Insert(
+        self,
+        key: Any
+    ) -> None:
+        left, right = _split( self.root, key, False )
+        self.root = _merge( _merge( left, OrderStatisticNode( key ) ), right )
+
+    # Remove key from tree
+    def Remove(
+        self,
+        key: Any
+    ) -> None:
+        left, right = _split( self.root, key, False )
+        middle, right = _split( right, key, True )
+        if middle is not None:
+            middle = _merge( middle.left, middle.right )
+        self.root = _merge( _merge( left, middle ), right )
+
+    # Count of keys less than key ( zero-based position of key )
+    def Rank(
+        self,
+        key: Any
+    ) -> int:
+        rank = 0
+        node = self.root
+        while node is not None:
+            if node.key < key:
+                rank += _size( node.left ) + 1
+                node = node.right
+            else:
+                node = node.left
+        return rank
+
+class OrderStatisticNode():
+    key:      Any
+    priority: float
+    size:     int = 1
+    left:     OrderStatisticNode | None = None
+    right:    OrderStatisticNode | None = None
+
+    def __init__(
+        self,
+        key: Any
+    ) -> None:
+        self.key      = key
+        self.priority = random.random()
+        self.size     = 1
+        self.left     = None
+        self.right    = None
+
+#
+
+def _size( node: OrderStatisticNode | None ) -> int:
+    return node.size if node is not None else 0
+
+def _update( node: OrderStatisticNode ) -> None:
+    node.size = _size( node.left ) + _size( node.right ) + 1
+
+# Split tree to keys less than key ( or equal if inclusive ) and the rest
+def _split(
+    node:      OrderStatisticNode | None,
+    key:       Any,
+    inclusive: bool
+) -> tuple[ OrderStatisticNode | None, OrderStatisticNode | None ]:
+    if node is None:
+        return None, None
+    if node.key < key or ( inclusive and node.key == key ):
+        left, right = _split( node.right, key, inclusive )
+        node.right = left
+        _update( node )
+        return node, right
+    else:
+        left, right = _split( node.left, key, inclusive )
+        node.left = right
+        _update( node )
+        return left, node
+
+# Merge trees, all keys of left are less than keys of right
+def _merge(
+    left:  OrderStatisticNode | None,
+    right: OrderStatisticNode | None
+) -> OrderStatisticNode | None:
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge( left.right, right )
+        _update( left )
+        return left
+    else:
+        right.left = _merge( left, right.left )
+        _update( right )
+        return right
@@ -0,0 +1,96 @@
+from __future__ import annotations
+import math
+import time
+from collections import deque
+from typing import Deque, Dict
+
+# Weight of new sample in moving averages
+EWMA_WEIGHT = 0.2
+
+# Starts remembered per group to estimate start rate
+RATE_SAMPLES = 50
+
+# Starts older than this are not used to estimate start rate, in seconds
+RATE_WINDOW = 1800
+
+class QueueAdmission():
+    starts:   Dict[ str, Deque[ float ] ] = {} # group -> monotonic times of last starts
+    loop_lag: float = 0 # event loop lag moving average, in seconds
+
+    def __init__( self ) -> None:
+        self.starts   = {}
+        self.loop_lag = 0
+
+    def __repr__( self ) -> str:
+        return '<QueueAdmission '+str( {
+            'loop_lag':    self.loop_lag,
+            'start_rates': { group_name: self.startRate( group_name ) for group_name in self.starts },
+        } )+'>'
+
+    #
+
+    # Remember task start in group
+    async def AddStart(
+        self,
+        group_name: str
+    ) -> None:
+        if group_name not in self.starts:
+            self.starts[ group_name ] = deque( maxlen=RATE_SAMPLES )
+        self.starts[ group_name ].append( time.monotonic() )
+
+    # Update event loop lag average
+    async def UpdateLoopLag(
+        self,
+        lag: float
+    ) -> None:
+        self.loop_lag += ( max( lag, 0 ) - self.loop_lag ) * EWMA_WEIGHT
+
+    #
+
+    # Check queue can accept new task, return seconds to retry after or None if accepted
+    async def Check(
+        self,
+        group_name: str,
+        waiting:    int,
+        db_latency: float,
+        config:     GlobalConfigAdmission
+    ) -> int | None:
+        retry_after: float = 0
+
+        # event loop is overloaded
+        if config.max_loop_lag > 0 and self.loop_lag > config.max_loop_lag:
+            retry_after = max( retry_after, config.retry_after * self.loop_lag / config.max_loop_lag )
+
+        # database is overloaded
+        if config.max_db_latency > 0 and db_latency > config.max_db_latency:
+            retry_after = max( retry_after, config.retry_after * db_latency / config.max_db_latency )
+
+        # waiting tasks will not start in acceptable time
+        rate = self.startRate( group_name )
+        if config.max_wait_time > 0 and rate > 0:
+            wait_time = waiting / rate
+            if wait_time > config.max_wait_time:
+                retry_after = max( retry_after, wait_time - config.max_wait_time )
+
+        if retry_after <= 0:
+            return None
+
+        return max( config.retry_after, math.ceil( retry_after ) )
+
+    #
+
+    # Get observed tasks start rate of group, starts per second
+    def startRate(
+        self,
+        group_name: str
+    ) -> float:
+        ok: bool = group_name in self.starts
+        if not ok:
+            return 0
+
+        now = time.monotonic()
+        starts = [ started for started in self.starts[ group_name ] if now - started < RATE_WINDOW ]
+        if len( starts ) < 2:
+            return 0
+
+        return len( starts ) / max( now - starts[ 0 ], 1 )
@@ -1,8 +1,10 @@
 from __future__ import annotations
 import os
 import ujson
+import fnmatch
 import traceback
 from enum import StrEnum
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 from dataclasses import dataclass, field
 from dacite import from_dict, Config
 from typing import TypeVar
@@ -144,6 +146,12 @@ class QueueConfigGroup():
     max_one_time:      int = 0
     max_waiting:       int = 0
     page_delay:        int = 0
+    stall_timeout:     int = 0 # seconds without downloader output, 0 - global default
+    timeout:           int = 0 # hard timeout of download, 0 - by sites durations
+    fair_share:        bool = False
+    fair_aging:        int = 0
+    priority_aging:    int = 0
+    resources:         QueueConfigResources = field( default_factory=lambda: QueueConfigResources() )
 
     def __repr__(self) -> str:
         return str( {
@@ -159,6 +167,31 @@ class QueueConfigGroup():
             'max_one_time':      self.max_one_time,
             'max_waiting':       self.max_waiting,
             'page_delay':        self.page_delay,
+            'stall_timeout':     self.stall_timeout,
+            'timeout':           self.timeout,
+            'fair_share':        self.fair_share,
+            'fair_aging':        self.fair_aging,
+            'priority_aging':    self.priority_aging,
+            'resources':         self.resources,
+        } )
+
+@dataclass
+class QueueConfigResources():
+    nice:          int = 0 # cpu priority of downloader, 0 - not changed
+    ionice_class:  int = 0 # io priority class: 1 - realtime, 2 - best effort, 3 - idle, 0 - not changed
+    ionice_level:  int = 4 # io priority level in class, 0 - highest, 7 - lowest
+    max_memory:    int = 0 # RLIMIT_AS of downloader cli in megabytes, 0 - not limited
+    max_file_size: int = 0 # RLIMIT_FSIZE of downloader cli in megabytes, 0 - not limited
+    cpus:          List[ int ] = field( default_factory=list ) # cpus of downloader, empty - all except reserved for queue
+
+    def __repr__(self) -> str:
+        return str( {
+            'nice':          self.nice,
+            'ionice_class':  self.ionice_class,
+            'ionice_level':  self.ionice_level,
+            'max_memory':    self.max_memory,
+            'max_file_size': self.max_file_size,
+            'cpus':          self.cpus,
         } )
 
 @dataclass
@@ -181,7 +214,10 @@ class QueueConfigSite():
     max_one_time:      int = 0
     max_waiting:       int = 0
     page_delay:        int = 0
+    stall_timeout:     int = 0
+    timeout:           int = 0
     excluded_proxy:    List[ str ] = field( default_factory=list )
+    url:               QueueConfigSiteUrl = field( default_factory=lambda: QueueConfigSiteUrl() )
 
     def __repr__(self) -> str:
         return str( {
@@ -203,9 +239,68 @@ class QueueConfigSite():
             'max_one_time':      self.max_one_time,
             'max_waiting':       self.max_waiting,
             'page_delay':        self.page_delay,
+            'stall_timeout':     self.stall_timeout,
+            'timeout':           self.timeout,
             'excluded_proxy':    self.excluded_proxy,
+            'url':               self.url,
         } )
 
+@dataclass
+class QueueConfigSiteUrl():
+    site:           str = "" # canonical site of requests to this site ( mirror or other host spelling )
+    scheme:         str = "https" # empty keeps scheme of request
+    host:           str = "" # canonical host, empty keeps host of request
+    strip_www:      bool = True
+    strip_mobile:   bool = True # "m." and "mobile." subdomains
+    trailing_slash: bool = False # keep trailing slash of path
+    lower_path:     bool = False
+    keep_query:     List[ str ] = field( default_factory=list ) # kept query params, empty keeps all except dropped
+    drop_query:     List[ str ] = field( default_factory=lambda: [ 'utm_*', 'fbclid', 'gclid', 'yclid', 'from', 'ref' ] )
+
+    # Rewrite url to canonical form, so same books have same urls
+    def Canonicalize(
+        self,
+        url: str
+    ) -> str:
+        url = url.strip()
+        try:
+            parts = urlsplit( url if '://' in url else 'https://' + url )
+
+            scheme = self.scheme or parts.scheme.lower()
+
+            host = self.host or parts.hostname or ''
+            # punycode and national spelling of host are same host
+            host = host.encode( 'idna' ).decode( 'ascii' ).lower()
+            if self.strip_www and host.startswith( 'www.' ):
+                host = host[ 4: ]
+            if self.strip_mobile:
+                for prefix in [ 'm.', 'mobile.' ]:
+                    if host.startswith( prefix ):
+                        host = host[ len( prefix ): ]
+            if not self.host and parts.port and parts.port not in [ 80, 443 ]:
+                host += ':' + str( parts.port )
+
+            path = parts.path or '/'
+            if self.lower_path:
+                path = path.lower()
+            if not self.trailing_slash and path != '/':
+                path = path.rstrip( '/' )
+
+            query = []
+            for key, value in parse_qsl( parts.query, keep_blank_values=True ):
+                if self.keep_query and key not in self.keep_query:
+                    continue
+                if any( fnmatch.fnmatch( key, pattern ) for pattern in self.drop_query ):
+                    continue
+                query.append( ( key, value ) )
+            query.sort()
+
+            # fragment never reaches site
+            return urlunsplit( ( scheme, host, path, urlencode( query ), '' ) )
+        except:
+            traceback.print_exc()
+            return url
+
 class QueueConfigProxies():
     instances: List[ str ] = []
 
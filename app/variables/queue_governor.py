@@ -0,0 +1,235 @@
+from __future__ import annotations
+import os
+import asyncio
+from typing import List, Dict, Tuple
+
+# Size of memory page for rss from /proc/<pid>/stat
+PAGE_SIZE = os.sysconf( 'SC_PAGE_SIZE' ) if hasattr( os, 'sysconf' ) else 4096
+
+MEGABYTE = 1024 * 1024
+
+# Cgroup of service, in container it has own memory limit and pressure
+CGROUP_FOLDER = '/sys/fs/cgroup'
+
+class QueueGovernor():
+    workers_rss: int = 0 # bytes used by running downloaders with their children
+    workers:     int = 0 # measured running downloaders
+    available:   int = -1 # bytes of MemAvailable, -1 - unknown
+    memory_psi:  float = 0 # memory pressure "some avg10"
+    cpu_psi:     float = 0 # cpu pressure "some avg10"
+    started:     int = 0 # tasks started after last measure
+    held:        bool = False # start was refused, queue has to be woken after next measure
+
+    def __init__( self ) -> None:
+        self.workers_rss = 0
+        self.workers     = 0
+        self.available   = -1
+        self.memory_psi  = 0
+        self.cpu_psi     = 0
+        self.started     = 0
+        self.held        = False
+
+    def __repr__( self ) -> str:
+        return '<QueueGovernor '+str( self.__export__() )+'>'
+
+    def __export__( self ) -> Dict[ str, int | float | bool ]:
+        return {
+            'workers_rss': self.workers_rss,
+            'workers':     self.workers,
+            'available':   self.available,
+            'memory_psi':  self.memory_psi,
+            'cpu_psi':     self.cpu_psi,
+            'held':        self.held,
+        }
+
+    #
+
+    # Maximum of running downloaders on host, by config or by cores not reserved for queue
+    @staticmethod
+    def MaxRunning(
+        config:        GlobalConfigGovernor,
+        reserved_cpus: int = 0
+    ) -> int:
+        if config.max_running > 0:
+            return config.max_running
+        if config.tasks_per_core <= 0:
+            return 0
+        try:
+            cores = len( os.sched_getaffinity( 0 ) )
+        except AttributeError:
+            cores = os.cpu_count() or 1
+        return max( cores - reserved_cpus, 1 ) * config.tasks_per_core
+
+    # Read memory of running downloaders and host pressure
+    async def Measure(
+        self,
+        pids: List[ int ]
+    ) -> None:
+        workers_rss, available, memory_psi, cpu_psi = await asyncio.to_thread( self.measure, pids )
+        self.workers_rss = workers_rss
+        self.workers     = len( pids )
+        self.available   = available
+        self.memory_psi  = memory_psi
+        self.cpu_psi     = cpu_psi
+        self.started     = 0
+
+    # Remember start, it is counted in memory estimate until next measure
+    async def AddStart( self ) -> None:
+        self.started += 1
+
+    # Check one more downloader can be started
+    async def CanStart(
+        self,
+        running:       int,
+        config:        GlobalConfigGovernor,
+        reserved_cpus: int = 0
+    ) -> bool:
+        can_start = self.canStart( running, config, reserved_cpus )
+        if not can_start:
+            self.held = True
+        return can_start
+
+    # Take and reset held flag
+    async def PopHeld( self ) -> bool:
+        held = self.held
+        self.held = False
+        return held
+
+    #
+
+    def canStart(
+        self,
+        running:       int,
+        config:        GlobalConfigGovernor,
+        reserved_cpus: int
+    ) -> bool:
+        max_running = self.MaxRunning( config, reserved_cpus )
+        if max_running > 0 and running >= max_running:
+            return False
+
+        if config.max_memory_pressure > 0 and self.memory_psi > config.max_memory_pressure:
+            return False
+
+        if config.max_cpu_pressure > 0 and self.cpu_psi > config.max_cpu_pressure:
+            return False
+
+        if config.min_free_memory > 0 and self.available >= 0:
+            # next task is expected to use as much as running ones on average
+            task_memory = config.task_memory * MEGABYTE
+            if self.workers > 0 and self.workers_rss > 0:
+                task_memory = self.workers_rss // self.workers
+            expected = self.available - task_memory * ( self.started + 1 )
+            if expected < config.min_free_memory * MEGABYTE:
+                return False
+
+        return True
+
+    def measure(
+        self,
+        pids: List[ int ]
+    ) -> Tuple[ int, int, float, float ]:
+        return self.treesRss( pids ), self.memAvailable(), self.pressure( 'memory' ), self.pressure( 'cpu' )
+
+    # Sum rss of processes with all their descendants
+    def treesRss(
+        self,
+        pids: List[ int ]
+    ) -> int:
+        if len( pids ) == 0:
+            return 0
+
+        children: Dict[ int, List[ int ] ] = {}
+        rss: Dict[ int, int ] = {}
+        try:
+            entries = os.listdir( '/proc' )
+        except OSError:
+            return 0
+        for entry in entries:
+            if not entry.isdigit():
+                continue
+            try:
+                with open( f'/proc/{entry}/stat', 'r' ) as _stat_file:
+                    stat = _stat_file.read()
+            except OSError:
+                continue
+            # command name can contain spaces, fields follow last ")"
+            fields = stat[ stat.rfind( ')' ) + 2: ].split()
+            pid = int( entry )
+            ppid = int( fields[ 1 ] )
+            rss[ pid ] = int( fields[ 21 ] ) * PAGE_SIZE
+            children.setdefault( ppid, [] ).append( pid )
+
+        total = 0
+        stack = list( pids )
+        seen = set()
+        while stack:
+            pid = stack.pop()
+            if pid in seen:
+                continue
+            seen.add( pid )
+            total += rss.get( pid, 0 )
+            stack.extend( children.get( pid, [] ) )
+        return total
+
+    # Memory left to limit of cgroup ( container ), host MemAvailable when cgroup is not limited
+    def memAvailable( self ) -> int:
+        available = self.cgroupAvailable()
+        if available >= 0:
+            return available
+        try:
+            with open( '/proc/meminfo', 'r' ) as _meminfo_file:
+                for line in _meminfo_file:
+                    if line.startswith( 'MemAvailable:' ):
+                        return int( line.split()[ 1 ] ) * 1024
+        except OSError:
+            pass
+        return -1
+
+    # Limit minus usage of cgroup v2 ( or v1 ), inactive page cache is reclaimable, -1 when not limited
+    def cgroupAvailable( self ) -> int:
+        for limit_file, usage_file, stat_file in [
+            ( 'memory.max', 'memory.current', 'memory.stat' ),
+            ( 'memory/memory.limit_in_bytes', 'memory/memory.usage_in_bytes', 'memory/memory.stat' ),
+        ]:
+            try:
+                with open( os.path.join( CGROUP_FOLDER, limit_file ), 'r' ) as _limit_file:
+                    limit = _limit_file.read().strip()
+                with open( os.path.join( CGROUP_FOLDER, usage_file ), 'r' ) as _usage_file:
+                    usage = int( _usage_file.read().strip() )
+            except ( OSError, ValueError ):
+                continue
+            # v1 reports huge number instead of "max"
+            if not limit.isdigit() or int( limit ) >= 1 << 60:
+                return -1
+
+            inactive = 0
+            try:
+                with open( os.path.join( CGROUP_FOLDER, stat_file ), 'r' ) as _stat_file:
+                    for line in _stat_file:
+                        key, _, value = line.partition( ' ' )
+                        if key in [ 'inactive_file', 'total_inactive_file' ]:
+                            inactive = int( value )
+                            break
+            except ( OSError, ValueError ):
+                pass
+            return max( int( limit ) - usage + inactive, 0 )
+        return -1
+
+    # Pressure stall information "some avg10" of cgroup or host, 0 when kernel has no PSI
+    def pressure(
+        self,
+        resource: str
+    ) -> float:
+        pressure_file = os.path.join( CGROUP_FOLDER, f'{resource}.pressure' )
+        if not os.path.exists( pressure_file ):
+            pressure_file = f'/proc/pressure/{resource}'
+        try:
+            with open( pressure_file, 'r' ) as _pressure_file:
+                for line in _pressure_file:
+                    if line.startswith( 'some' ):
+                        for field in line.split():
+                            if field.startswith( 'avg10=' ):
+                                return float( field[ 6: ] )
+        except ( OSError, ValueError ):
+            pass
+        return 0
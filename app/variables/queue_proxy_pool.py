@@ -0,0 +1,99 @@
+from __future__ import annotations
+import time
+from typing import List, Dict
+
+class QueueProxyPool():
+    sites:     Dict[ str, List[ str ] ] = {} # site -> allowed proxies, '' is direct connection
+    usage:     Dict[ str, int ] = {} # proxy -> running tasks over all sites
+    last_used: Dict[ str, float ] = {} # proxy -> monotonic time of last start
+
+    def __init__( self ) -> None:
+        self.sites     = {}
+        self.usage     = {}
+        self.last_used = {}
+
+    def __repr__( self ) -> str:
+        return '<QueueProxyPool '+str( {
+            'sites': self.sites,
+            'usage': self.usage,
+        } )+'>'
+
+    #
+
+    # Precompute allowed proxies of site
+    async def SiteInit(
+        self,
+        site_name:   str,
+        proxies:     List[ str ],
+        use_proxy:   bool,
+        force_proxy: bool
+    ) -> bool:
+        allowed: List[ str ] = []
+        if use_proxy or force_proxy:
+            allowed = sorted( proxies )
+            if not force_proxy:
+                allowed.append( '' )
+        else:
+            allowed = ['']
+        self.sites[ site_name ] = allowed
+        return True
+
+    # Remove site from pool
+    async def SiteDestroy(
+        self,
+        site_name: str
+    ) -> bool:
+        ok: bool = site_name in self.sites
+        if ok:
+            del self.sites[ site_name ]
+        return True
+
+    # Get allowed proxies of site
+    async def GetSiteProxies(
+        self,
+        site_name: str
+    ) -> List[ str ]:
+        ok: bool = site_name in self.sites
+        if ok:
+            return list( self.sites[ site_name ] )
+        return []
+
+    #
+
+    # Order proxies from least loaded and longest cooled to most busy
+    async def Order(
+        self,
+        proxies:    List[ str ],
+        site_load:  Dict[ str, int ],
+        group_load: Dict[ str, int ]
+    ) -> List[ str ]:
+        return sorted(
+            proxies,
+            key = lambda proxy: (
+                site_load.get( proxy, 0 ),
+                group_load.get( proxy, 0 ),
+                self.usage.get( proxy, 0 ),
+                self.last_used.get( proxy, 0 ),
+            )
+        )
+
+    #
+
+    # Increase proxy usage
+    async def AddRun(
+        self,
+        proxy: str = ''
+    ) -> None:
+        self.usage[ proxy ] = self.usage.get( proxy, 0 ) + 1
+        self.last_used[ proxy ] = time.monotonic()
+
+    # Decrease proxy usage
+    async def RemoveRun(
+        self,
+        proxy: str = ''
+    ) -> None:
+        usage = self.usage.get( proxy, 0 ) - 1
+        if usage > 0:
+            self.usage[ proxy ] = usage
+        else:
+            self.usage.pop( proxy, None )
@@ -1,17 +1,23 @@
 from __future__ import annotations
 import asyncio
-from typing import List, Dict
-from multiprocessing import Process
+from datetime import datetime
+from typing import List, Dict, Set, Any
 from app import dto
 
 class QueueRunning():
-    tasks: Dict[ int, QueueRunningTask ] = {}
+    tasks:        Dict[ int, QueueRunningTask ] = {}
+    fingerprints: Dict[ tuple, Set[ int ] ] = {}
+    users:        Dict[ int, Set[ int ] ] = {} # user_id -> task_ids
+    stopping:     Set[ asyncio.Task ] = set() # stops of removed tasks processes
     
     def __init__(
         self,
         tasks: Dict[ int, QueueRunningTask ] = {}
     ) -> None:
-        self.tasks = tasks
+        self.tasks        = tasks
+        self.fingerprints = {}
+        self.users        = {}
+        self.stopping     = set()
 
     def __repr__( self ) -> str:
         return '<QueueRunning>'
@@ -39,14 +45,7 @@ class QueueRunning():
         self,
         request: dto.DownloadRequest
     ) -> bool:
-        for _, task in self.tasks.items():
-            if task.request.user_id == request.user_id and task.request.url == request.url \
-                and \
-               task.request.start == request.start and task.request.end == request.end \
-                and \
-               task.request.images == request.images:
-                return True
-        return False
+        return request.__fingerprint__() in self.fingerprints
     
     #
     
@@ -84,28 +83,71 @@ class QueueRunning():
             )
             self.tasks[ task.task_id ] = task
 
+            fingerprint = request.__fingerprint__()
+            if fingerprint not in self.fingerprints:
+                self.fingerprints[ fingerprint ] = set()
+            self.fingerprints[ fingerprint ].add( task.task_id )
+
+            if task.user_id not in self.users:
+                self.users[ task.user_id ] = set()
+            self.users[ task.user_id ].add( task.task_id )
+
         ok: bool = request.task_id in self.tasks
         if ok:
             task: QueueRunningTask = self.tasks[ request.task_id ]
             return task
         return None
 
-    # Remove task from queue
+    # Remove task from queue and stop its process in background, finished task is not terminated and its process exits by itself
     async def RemoveTask(
         self,
-        task_id: int
+        task_id:   int,
+        terminate: bool = True
     ) -> QueueRunningTask | None:
         task: QueueRunningTask = await self.GetTask( task_id )
         if task:
-            if task.proc:
-                task.proc.terminate()
-                while task.proc.is_alive():
-                    await asyncio.sleep( 0.1 )
-                task.proc.close()
+            # task is removed before stopping, so exit of its process is not handled as crash
             del self.tasks[ task_id ]
+
+            fingerprint = task.request.__fingerprint__()
+            fingerprint_ok: bool = fingerprint in self.fingerprints
+            if fingerprint_ok:
+                self.fingerprints[ fingerprint ].discard( task_id )
+                if len( self.fingerprints[ fingerprint ] ) == 0:
+                    del self.fingerprints[ fingerprint ]
+
+            user_ok: bool = task.user_id in self.users
+            if user_ok:
+                self.users[ task.user_id ].discard( task_id )
+                if len( self.users[ task.user_id ] ) == 0:
+                    del self.users[ task.user_id ]
+
+            if task.proc:
+                # slow exit of process must not hold results and other callers
+                stop = asyncio.create_task( task.proc.Stop( terminate ) )
+                self.stopping.add( stop )
+                stop.add_done_callback( self.stopping.discard )
             return task
         return None
 
+    # Remove tasks from queue, processes are terminated in background
+    async def RemoveTasks(
+        self,
+        task_ids: List[ int ]
+    ) -> List[ QueueRunningTask ]:
+        tasks = await asyncio.gather( *[ self.RemoveTask( task_id ) for task_id in task_ids ] )
+        return [ task for task in tasks if task is not None ]
+
+    # Get running tasks of user
+    async def UserGetTasks(
+        self,
+        user_id: int
+    ) -> List[ QueueRunningTask ]:
+        ok: bool = user_id in self.users
+        if ok:
+            return [ self.tasks[ task_id ] for task_id in self.users[ user_id ] if task_id in self.tasks ]
+        return []
+
     # Update running task last status for queue monitoring
     async def UpdateStatus(
         self,
@@ -127,7 +169,9 @@ class QueueRunningTask():
     proxy:   str = ""
     request: dto.DownloadRequest
     status:  str = ""
-    proc:    Process
+    started: datetime
+    timeout: int = 0 # hard timeout of task in seconds, 0 - disabled
+    proc:    Any = None # handle of downloader: process, pool worker or inline task
 
     def __init__(
         self,
@@ -143,6 +187,9 @@ class QueueRunningTask():
         self.proxy   = proxy
         self.request = request
         self.status  = "Ожидает запуска"
+        self.started = datetime.now()
+        self.timeout = 0
+        self.proc    = None
 
     def __repr__( self ) -> str:
         return '<QueueRunningTask '+str( {
@@ -5,6 +5,7 @@ from typing import overload
 
 from .queue_stats_user import QueueStatsUser
 from .queue_stats_root import QueueStatsRoot, NONE_USER
+from .queue_stats_calendar import CALENDAR
 
 class QueueStats( QueueStatsRoot ):
     users: Dict[ int, QueueStatsUser ] = {}
@@ -65,6 +66,16 @@ class QueueStats( QueueStatsRoot ):
     async def GetActiveSites( self ) -> List[ str ]:
         return list( self.sites.keys() )
 
+    # Get seconds left until nearest group/site/user delay expires
+    async def GetCooldown( self ) -> float | None:
+        return CALENDAR.Next()
+
+    # Recalculate group/site/user cooldowns with current delays
+    async def Reschedule( self ) -> None:
+        await super().Reschedule()
+        for user in self.users.values():
+            await user.Reschedule()
+
     #
 
     # Add user to statistic
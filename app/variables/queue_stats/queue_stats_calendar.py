@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import time
+import heapq
+from typing import List, Dict, Tuple
+
+class QueueStatsCalendar():
+    ready: Dict[ tuple, float ] = {} # cooldown key -> monotonic time of expire
+    heap:  List[ Tuple[ float, tuple ] ] = [] # min-heap of ( expire, cooldown key )
+
+    def __init__( self ) -> None:
+        self.ready = {}
+        self.heap  = []
+
+    def __repr__( self ) -> str:
+        return '<QueueStatsCalendar '+str( self.ready )+'>'
+
+    # Set cooldown for key, ends after `delay` seconds
+    def Set(
+        self,
+        key:   tuple,
+        delay: float
+    ) -> None:
+        if delay <= 0:
+            self.ready.pop( key, None )
+            return
+
+        expire = time.monotonic() + delay
+        self.ready[ key ] = expire
+        heapq.heappush( self.heap, ( expire, key ) )
+
+    # Remove cooldown for key
+    def Remove(
+        self,
+        key: tuple
+    ) -> None:
+        self.ready.pop( key, None )
+
+    # Check cooldown for key expired
+    def Ready(
+        self,
+        key: tuple
+    ) -> bool:
+        expire = self.ready.get( key, None )
+        if expire is None:
+            return True
+        if expire <= time.monotonic():
+            del self.ready[ key ]
+            return True
+        return False
+
+    # Get seconds left until nearest cooldown expires ( None if nothing cools down )
+    def Next( self ) -> float | None:
+        now = time.monotonic()
+        while self.heap:
+            expire, key = self.heap[ 0 ]
+            actual: bool = self.ready.get( key, None ) == expire
+            if actual and expire > now:
+                return expire - now
+            heapq.heappop( self.heap )
+            if actual:
+                del self.ready[ key ]
+        return None
+
+
+CALENDAR = QueueStatsCalendar()
@@ -1,14 +1,16 @@
 from __future__ import annotations
 
+import time
 import ujson
 from enum import Enum
 from typing import List, Dict, Any
 from datetime import datetime
 
-from app.objects import RD
 from app.configs import QC
 from app.variables.queue_config import NONE_USER, MAX_WAIT, MAX_ONETIME, DELAY, WAIT, ONETIME
 
+from .queue_stats_calendar import CALENDAR
+
 class QueueStatsObj():
     __type__:  str
     __name__:  str
@@ -49,13 +51,43 @@ class QueueStatsObj():
 
     # Save last_run states
     async def Save( self ) -> None:
+        from app.objects import RD
         await RD.setex( f"{self.__type__}_{self.__name__}_{self.__user__}", 3600, ujson.dumps(self.last_run) )
 
     # Restore saved last_run states
     async def Restore( self ) -> None:
+        from app.objects import RD
         last_run = await RD.get( f"{self.__type__}_{self.__name__}_{self.__user__}" )
         if last_run:
             self.last_run = ujson.loads( last_run )
+            await self.Reschedule()
+
+    # Put last_run states to cooldown calendar with current delay
+    async def Reschedule( self ) -> None:
+        delay = self.getDelay()
+        now = time.time()
+        for proxy, last_run in self.last_run.items():
+            CALENDAR.Set( self.cooldownKey( proxy ), last_run + delay - now )
+
+    #
+
+    def getConfig( self ) -> Any:
+        try:
+            return QC.groups[ self.__name__ ] if 'group' == self.__type__ else QC.sites[ self.__name__ ]
+        except:
+            return None
+
+    def getDelay( self ) -> int:
+        config = self.getConfig()
+        if config is None:
+            return 0
+        return getattr( config, getattr( DELAY, self.__user__ ) )
+
+    def cooldownKey(
+        self,
+        proxy: str = ''
+    ) -> tuple:
+        return ( self.__type__, self.__name__, self.__user__, proxy )
 
     #
 
@@ -65,12 +97,16 @@ class QueueStatsObj():
     async def GetWaiting( self ) -> int:
         return self.waiting
 
+    async def GetRunningByProxy( self ) -> Dict[ str, int ]:
+        return self.running_r
+
     #
 
     # Check site/group can start task by running tasks limit and last run time
+    # ( proxy None checks only limits not bound to proxy )
     async def CanStart(
         self,
-        proxy: str = ''
+        proxy: str | None = ''
     ) -> bool:
         try:
             config = QC.groups[ self.__name__ ] if 'group' == self.__type__ else QC.sites[ self.__name__ ]
@@ -79,7 +115,6 @@ class QueueStatsObj():
 
         one_time_max = getattr( config, MAX_ONETIME ) # get maximum simultaneously running tasks by site/group limit
         one_time_base = getattr( config, getattr( ONETIME, self.__user__ ) ) # get maximum simultaneously running tasks by user limit
-        delay = getattr( config, getattr( DELAY, self.__user__ ) ) # get maximum simultaneously running tasks by site/group/user limit
 
         by_max = True
         by_base = True
@@ -88,14 +123,24 @@ class QueueStatsObj():
         if one_time_max > 0:
             by_max: bool = ( self.running < one_time_max )
 
+        if proxy is None:
+            return by_max
+
         if one_time_base > 0 and proxy in self.running_r:
             by_base = ( self.running_r[ proxy ] < one_time_base )
 
-        if proxy in self.last_run:
-            by_last_run = self.last_run[ proxy ] < ( datetime.now().timestamp() - delay )
+        # delay after last run is tracked by cooldown calendar
+        by_last_run = CALENDAR.Ready( self.cooldownKey( proxy ) )
 
         return by_max and by_base and by_last_run
 
+    # Filter proxies which cooldown already expired
+    async def CooledProxies(
+        self,
+        proxies: List[ str ]
+    ) -> List[ str ]:
+        return [ proxy for proxy in proxies if CALENDAR.Ready( self.cooldownKey( proxy ) ) ]
+
     #
 
     # Check site/group can add task by user/site/group limit
@@ -133,6 +178,7 @@ class QueueStatsObj():
 
         self.running += 1
         self.last_run[ proxy ] = datetime.now().timestamp()
+        CALENDAR.Set( self.cooldownKey( proxy ), self.getDelay() )
 
     # Decrease running tasks count
     async def RemoveRun(
@@ -149,6 +195,7 @@ class QueueStatsObj():
 
         self.running = self.running-1 if self.running > 1 else 0
         self.last_run[ proxy ] = datetime.now().timestamp()
+        CALENDAR.Set( self.cooldownKey( proxy ), self.getDelay() )
 
     #
 
@@ -131,7 +131,7 @@ class QueueStatsRoot():
     async def GroupCanStart(
         self,
         group_name: str,
-        proxy: str = ''
+        proxy: str | None = ''
     ) -> bool:
         ok: bool = group_name in self.groups
         if ok:
@@ -142,13 +142,59 @@ class QueueStatsRoot():
     async def SiteCanStart(
         self,
         site_name: str,
-        proxy: str = ''
+        proxy: str | None = ''
     ) -> bool:
         ok: bool = site_name in self.sites
         if ok:
             return await self.sites[ site_name ].CanStart( proxy )
         return self.default_can_run
 
+    # Recalculate group/site cooldowns with current delays
+    async def Reschedule( self ) -> None:
+        for stats_obj in [ *self.groups.values(), *self.sites.values() ]:
+            await stats_obj.Reschedule()
+
+    # Get group waiting tasks count
+    async def GroupWaiting(
+        self,
+        group_name: str
+    ) -> int:
+        ok: bool = group_name in self.groups
+        if ok:
+            return await self.groups[ group_name ].GetWaiting()
+        return 0
+
+    # Get group running tasks count per proxy
+    async def GroupRunningByProxy(
+        self,
+        group_name: str
+    ) -> Dict[ str, int ]:
+        ok: bool = group_name in self.groups
+        if ok:
+            return await self.groups[ group_name ].GetRunningByProxy()
+        return {}
+
+    # Get site running tasks count per proxy
+    async def SiteRunningByProxy(
+        self,
+        site_name: str
+    ) -> Dict[ str, int ]:
+        ok: bool = site_name in self.sites
+        if ok:
+            return await self.sites[ site_name ].GetRunningByProxy()
+        return {}
+
+    # Filter proxies which site cooldown already expired
+    async def SiteCooledProxies(
+        self,
+        site_name: str,
+        proxies: List[ str ]
+    ) -> List[ str ]:
+        ok: bool = site_name in self.sites
+        if ok:
+            return await self.sites[ site_name ].CooledProxies( proxies )
+        return proxies
+
     #
 
     # Increase running tasks count
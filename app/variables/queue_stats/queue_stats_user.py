@@ -3,8 +3,6 @@ from __future__ import annotations
 import ujson
 from typing import Dict
 
-from app.objects import RD
-
 from .queue_stats_obj import QueueStatsObj
 from .queue_stats_root import QueueStatsRoot
 
@@ -56,6 +54,7 @@ class QueueStatsUser( QueueStatsRoot ):
 
     # Save last_run states
     async def Save( self ) -> None:
+        from app.objects import RD
         await RD.setex( f"{self.__type__}_{self.__user__}_sites", 3600, ujson.dumps( list( self.sites.keys() ) ) )
         await RD.setex( f"{self.__type__}_{self.__user__}_groups", 3600, ujson.dumps( list( self.groups.keys() ) ) )
 
@@ -67,6 +66,7 @@ class QueueStatsUser( QueueStatsRoot ):
 
     # Restore saved last_run states
     async def Restore( self ) -> None:
+        from app.objects import RD
         sites = await RD.get( f"{self.__type__}_{self.__user__}_sites" )
         groups = await RD.get( f"{self.__type__}_{self.__user__}_groups" )
 
@@ -0,0 +1,431 @@
+from __future__ import annotations
+from typing import List, Dict, Set
+from app import dto
+
+class QueueSubscribers():
+    primaries:    Dict[ tuple, int ] = {} # content key -> primary task_id
+    keys:         Dict[ int, tuple ] = {} # primary task_id -> content key
+    subscribers:  Dict[ int, Dict[ int, dto.DownloadRequest ] ] = {} # primary task_id -> subscribers requests
+    parents:      Dict[ int, int ] = {} # subscriber task_id -> primary task_id
+    fingerprints: Dict[ tuple, Set[ int ] ] = {} # subscribers and extra formats requests fingerprints
+    users:        Dict[ int, Set[ int ] ] = {} # user_id -> subscriber and extra format task_ids
+    detached:     Set[ int ] = set() # cancelled primaries, still running for subscribers
+    sources:      Dict[ tuple, int ] = {} # source key -> waiting primary task_id, other formats can join it
+    formats:      Dict[ int, Set[ str ] ] = {} # waiting primary task_id -> formats of its launch
+    extras:       Dict[ int, Dict[ int, dto.DownloadRequest ] ] = {} # primary task_id -> other formats requests
+    owners:       Dict[ int, int ] = {} # extra format task_id -> primary task_id
+    dropped:      Set[ int ] = set() # cancelled extra formats, results are discarded
+
+    def __init__( self ) -> None:
+        self.primaries    = {}
+        self.keys         = {}
+        self.subscribers  = {}
+        self.parents      = {}
+        self.fingerprints = {}
+        self.users        = {}
+        self.detached     = set()
+        self.sources      = {}
+        self.formats      = {}
+        self.extras       = {}
+        self.owners       = {}
+        self.dropped      = set()
+
+    def __repr__( self ) -> str:
+        return '<QueueSubscribers '+str( {
+            'primaries':   len( self.primaries ),
+            'subscribers': len( self.parents ),
+        } )+'>'
+
+    #
+
+    async def Export( self ) -> Dict[ int, List[ int ] ]:
+        return { primary_id: list( subscribers.keys() ) for primary_id, subscribers in self.subscribers.items() if len( subscribers ) > 0 }
+
+    #
+
+    # Key of downloaded content, requests with same key produce same files
+    @staticmethod
+    def ContentKey(
+        request: dto.DownloadRequest
+    ) -> tuple | None:
+        # content behind auth belongs only to its user
+        if request.login:
+            return None
+        return (
+            request.site,
+            request.key_url,
+            request.start or 0,
+            request.end or 0,
+            request.format or '',
+            bool( request.images ),
+            bool( request.cover ),
+            bool( request.thumb ),
+            request.hashtags or '',
+            request.filename or '',
+        )
+
+    # Key of fetched source, requests with same key differ only by output format
+    @staticmethod
+    def SourceKey(
+        request: dto.DownloadRequest
+    ) -> tuple | None:
+        if request.login:
+            return None
+        return (
+            request.site,
+            request.key_url,
+            request.start or 0,
+            request.end or 0,
+            bool( request.images ),
+        )
+
+    # Check that user already subscribed to same download
+    async def CheckDuplicate(
+        self,
+        request: dto.DownloadRequest
+    ) -> bool:
+        return request.__fingerprint__() in self.fingerprints
+
+    #
+
+    # Get primary task with same content
+    async def Find(
+        self,
+        request: dto.DownloadRequest
+    ) -> int | None:
+        key = self.ContentKey( request )
+        if key is None:
+            return None
+        ok: bool = key in self.primaries
+        if ok:
+            return self.primaries[ key ]
+        return None
+
+    # Register task as primary of its content
+    async def AddPrimary(
+        self,
+        request: dto.DownloadRequest
+    ) -> bool:
+        key = self.ContentKey( request )
+        if key is None or key in self.primaries:
+            return False
+        self.primaries[ key ] = request.task_id
+        self.keys[ request.task_id ] = key
+        self.subscribers[ request.task_id ] = {}
+        return True
+
+    # Unregister primary task, returns its subscribers
+    async def RemovePrimary(
+        self,
+        task_id: int
+    ) -> List[ dto.DownloadRequest ]:
+        self.detached.discard( task_id )
+        ok: bool = task_id in self.keys
+        if not ok:
+            return []
+        key = self.keys.pop( task_id )
+        if self.primaries.get( key ) == task_id:
+            del self.primaries[ key ]
+        requests = list( self.subscribers.pop( task_id, {} ).values() )
+        for request in requests:
+            self.unindex( request )
+        return requests
+
+    # Check task is primary with subscribers
+    async def HasSubscribers(
+        self,
+        task_id: int
+    ) -> bool:
+        ok: bool = task_id in self.subscribers
+        if ok:
+            return len( self.subscribers[ task_id ] ) > 0
+        return False
+
+    # Make first subscriber primary instead of cancelled waiting primary
+    async def Promote(
+        self,
+        task_id: int
+    ) -> dto.DownloadRequest | None:
+        ok: bool = task_id in self.keys
+        if not ok:
+            return None
+        key = self.keys[ task_id ]
+        requests = await self.RemovePrimary( task_id )
+        if len( requests ) == 0:
+            return None
+
+        requests.sort( key=lambda request: request.task_id )
+        primary = requests.pop( 0 )
+        self.primaries[ key ] = primary.task_id
+        self.keys[ primary.task_id ] = key
+        self.subscribers[ primary.task_id ] = {}
+        for request in requests:
+            await self.Subscribe( primary.task_id, request )
+        return primary
+
+    # Keep cancelled running primary for subscribers, new requests do not join it
+    async def Detach(
+        self,
+        task_id: int
+    ) -> None:
+        ok: bool = task_id in self.keys
+        if ok:
+            key = self.keys[ task_id ]
+            if self.primaries.get( key ) == task_id:
+                del self.primaries[ key ]
+            self.detached.add( task_id )
+
+    # Check primary was cancelled by its user
+    async def IsDetached(
+        self,
+        task_id: int
+    ) -> bool:
+        ok: bool = task_id in self.detached
+        return ok
+
+    #
+
+    # Attach request to primary task
+    async def Subscribe(
+        self,
+        primary_id: int,
+        request:    dto.DownloadRequest
+    ) -> bool:
+        ok: bool = primary_id in self.subscribers
+        if not ok:
+            return False
+        self.subscribers[ primary_id ][ request.task_id ] = request
+        self.parents[ request.task_id ] = primary_id
+
+        fingerprint = request.__fingerprint__()
+        if fingerprint not in self.fingerprints:
+            self.fingerprints[ fingerprint ] = set()
+        self.fingerprints[ fingerprint ].add( request.task_id )
+
+        if request.user_id not in self.users:
+            self.users[ request.user_id ] = set()
+        self.users[ request.user_id ].add( request.task_id )
+        return True
+
+    # Detach request from primary task
+    async def Unsubscribe(
+        self,
+        task_id: int
+    ) -> dto.DownloadRequest | None:
+        ok: bool = task_id in self.parents
+        if not ok:
+            return None
+        primary_id = self.parents[ task_id ]
+        request = self.subscribers[ primary_id ].pop( task_id )
+        self.unindex( request )
+        return request
+
+    # Check task is subscriber
+    async def IsSubscriber(
+        self,
+        task_id: int
+    ) -> bool:
+        ok: bool = task_id in self.parents
+        return ok
+
+    # Get primary task of subscriber or extra format
+    async def GetPrimary(
+        self,
+        task_id: int
+    ) -> int | None:
+        ok: bool = task_id in self.parents
+        if ok:
+            return self.parents[ task_id ]
+        ok = task_id in self.owners
+        if ok:
+            return self.owners[ task_id ]
+        return None
+
+    # Get subscriber or extra format request
+    async def GetRequest(
+        self,
+        task_id: int
+    ) -> dto.DownloadRequest | None:
+        ok: bool = task_id in self.parents
+        if ok:
+            return self.subscribers[ self.parents[ task_id ] ][ task_id ]
+        ok = task_id in self.owners
+        if ok:
+            return self.extras[ self.owners[ task_id ] ][ task_id ]
+        return None
+
+    # Get subscribers requests of primary task
+    async def GetSubscribers(
+        self,
+        primary_id: int
+    ) -> List[ dto.DownloadRequest ]:
+        ok: bool = primary_id in self.subscribers
+        if ok:
+            return list( self.subscribers[ primary_id ].values() )
+        return []
+
+    # Get subscriptions of user
+    async def UserGetRequests(
+        self,
+        user_id: int
+    ) -> List[ dto.DownloadRequest ]:
+        ok: bool = user_id in self.users
+        if ok:
+            return [ await self.GetRequest( task_id ) for task_id in self.users[ user_id ] ]
+        return []
+
+    #
+
+    # Register waiting primary task, other formats of same source can join its launch
+    async def AddSource(
+        self,
+        request: dto.DownloadRequest
+    ) -> bool:
+        key = self.SourceKey( request )
+        if key is None or key in self.sources:
+            return False
+        self.sources[ key ] = request.task_id
+        self.formats[ request.task_id ] = set( [ request.format ] + [ extra.format for extra in self.extras.get( request.task_id, {} ).values() ] )
+        return True
+
+    # Close launch of primary task for other formats ( started or removed )
+    async def RemoveSource(
+        self,
+        task_id: int
+    ) -> None:
+        ok: bool = task_id in self.formats
+        if ok:
+            del self.formats[ task_id ]
+            for key, primary_id in list( self.sources.items() ):
+                if primary_id == task_id:
+                    del self.sources[ key ]
+
+    # Get waiting primary task with same source and without format of request
+    async def FindSource(
+        self,
+        request: dto.DownloadRequest
+    ) -> int | None:
+        key = self.SourceKey( request )
+        if key is None:
+            return None
+        ok: bool = key in self.sources
+        if ok:
+            primary_id = self.sources[ key ]
+            if request.format not in self.formats.get( primary_id, set() ):
+                return primary_id
+        return None
+
+    # Attach other format request to launch of primary task
+    async def AddExtra(
+        self,
+        primary_id: int,
+        request:    dto.DownloadRequest
+    ) -> bool:
+        if primary_id not in self.extras:
+            self.extras[ primary_id ] = {}
+        self.extras[ primary_id ][ request.task_id ] = request
+        self.owners[ request.task_id ] = primary_id
+        if primary_id in self.formats:
+            self.formats[ primary_id ].add( request.format )
+
+        fingerprint = request.__fingerprint__()
+        if fingerprint not in self.fingerprints:
+            self.fingerprints[ fingerprint ] = set()
+        self.fingerprints[ fingerprint ].add( request.task_id )
+
+        if request.user_id not in self.users:
+            self.users[ request.user_id ] = set()
+        self.users[ request.user_id ].add( request.task_id )
+        return True
+
+    # Detach other format request from launch
+    async def RemoveExtra(
+        self,
+        task_id: int
+    ) -> dto.DownloadRequest | None:
+        ok: bool = task_id in self.owners
+        if not ok:
+            return None
+        primary_id = self.owners.pop( task_id )
+        request = self.extras[ primary_id ].pop( task_id )
+        if len( self.extras[ primary_id ] ) == 0:
+            del self.extras[ primary_id ]
+        if primary_id in self.formats:
+            self.formats[ primary_id ].discard( request.format )
+        self.unindex( request )
+        return request
+
+    # Detach all other format requests from launch
+    async def PopExtras(
+        self,
+        primary_id: int
+    ) -> List[ dto.DownloadRequest ]:
+        requests: List[ dto.DownloadRequest ] = []
+        for task_id in list( self.extras.get( primary_id, {} ).keys() ):
+            requests.append( await self.RemoveExtra( task_id ) )
+        requests.sort( key=lambda request: request.task_id )
+        return requests
+
+    # Check task is other format of launch
+    async def IsExtra(
+        self,
+        task_id: int
+    ) -> bool:
+        ok: bool = task_id in self.owners
+        return ok
+
+    # Check launch of primary task has other formats
+    async def HasExtras(
+        self,
+        primary_id: int
+    ) -> bool:
+        ok: bool = primary_id in self.extras
+        return ok
+
+    # Get other format requests of launch
+    async def GetExtras(
+        self,
+        primary_id: int
+    ) -> List[ dto.DownloadRequest ]:
+        ok: bool = primary_id in self.extras
+        if ok:
+            return list( self.extras[ primary_id ].values() )
+        return []
+
+    # Discard result of cancelled extra format
+    async def Drop(
+        self,
+        task_id: int
+    ) -> None:
+        self.dropped.add( task_id )
+
+    # Check result of task has to be discarded, returns True once for dropped task
+    async def IsDropped(
+        self,
+        task_id: int
+    ) -> bool:
+        ok: bool = task_id in self.dropped
+        if ok:
+            self.dropped.discard( task_id )
+        return ok
+
+    #
+
+    def unindex(
+        self,
+        request: dto.DownloadRequest
+    ) -> None:
+        self.parents.pop( request.task_id, None )
+
+        fingerprint = request.__fingerprint__()
+        fingerprint_ok: bool = fingerprint in self.fingerprints
+        if fingerprint_ok:
+            self.fingerprints[ fingerprint ].discard( request.task_id )
+            if len( self.fingerprints[ fingerprint ] ) == 0:
+                del self.fingerprints[ fingerprint ]
+
+        user_ok: bool = request.user_id in self.users
+        if user_ok:
+            self.users[ request.user_id ].discard( request.task_id )
+            if len( self.users[ request.user_id ] ) == 0:
+                del self.users[ request.user_id ]
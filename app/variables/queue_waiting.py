@@ -1,15 +1,30 @@
 from __future__ import annotations
-from typing import List, Dict
+import math
+import time
+from collections import OrderedDict
+from typing import List, Dict, Set
 from app import dto
 
+from .order_statistic import OrderStatisticTree
+
+# Deficit round robin quantum given to waiting user with runnable first task on scheduling round
+FAIR_QUANTUM = 1
+
+# Maximum deficit user can save up while blocked by limits
+FAIR_DEFICIT_LIMIT = 10
+
 class QueueWaiting():
     groups: Dict[ str, QueueWaitingGroup ] = {}
+    index:  Dict[ int, QueueWaitingTask ] = {} # task_id -> task ( with group, site and user )
+    users:  Dict[ int, Set[ int ] ] = {} # user_id -> task_ids
 
     def __init__(
         self,
         groups: Dict[ str, QueueWaitingGroup ] = {},
     ) -> None:
         self.groups = groups
+        self.index  = {}
+        self.users  = {}
 
     def __repr__( self ) -> str:
         return '<QueueWaiting>'
@@ -36,13 +51,9 @@ class QueueWaiting():
         group_name: str,
         request:    dto.DownloadRequest
     ) -> bool:
-        for _, task in self.groups[ group_name ].tasks.items():
-            if task.request.user_id == request.user_id and task.request.url == request.url \
-                and \
-               task.request.start == request.start and task.request.end == request.end \
-                and \
-               task.request.images == request.images:
-                return True
+        ok: bool = group_name in self.groups
+        if ok:
+            return request.__fingerprint__() in self.groups[ group_name ].fingerprints
         return False
 
     #
@@ -63,6 +74,9 @@ class QueueWaiting():
     ) -> bool:
         ok: bool = group_name in self.groups
         if ok:
+            for task_id, task in self.groups[ group_name ].tasks.items():
+                self.index.pop( task_id, None )
+                self.userRemoveTask( task.user_id, task_id )
             del self.groups[ group_name ]
         return True
 
@@ -76,6 +90,72 @@ class QueueWaiting():
     
     #
     
+    # Check group has waiting tasks
+    async def GroupHasTasks(
+        self,
+        group_name: str
+    ) -> bool:
+        ok: bool = group_name in self.groups
+        if ok:
+            return await self.groups[ group_name ].HasTasks()
+        return False
+
+    # Get sites with waiting tasks in group
+    async def GroupGetSites(
+        self,
+        group_name: str
+    ) -> List[ str ]:
+        ok: bool = group_name in self.groups
+        if ok:
+            return await self.groups[ group_name ].GetSites()
+        return []
+
+    # Get first waiting task of every user by site in group
+    async def GroupGetSiteHeads(
+        self,
+        group_name:     str,
+        site_name:      str,
+        priority_aging: int = 0
+    ) -> List[ QueueWaitingTask ]:
+        ok: bool = group_name in self.groups
+        if ok:
+            return await self.groups[ group_name ].GetSiteHeads( site_name, priority_aging )
+        return []
+
+    # Order first tasks of users queues by priority and fair share of group
+    async def GroupOrder(
+        self,
+        group_name:     str,
+        tasks:          List[ QueueWaitingTask ],
+        fair_share:     bool = False,
+        fair_aging:     int = 0,
+        priority_aging: int = 0
+    ) -> List[ QueueWaitingTask ]:
+        ok: bool = group_name in self.groups
+        if ok:
+            return await self.groups[ group_name ].Order( tasks, fair_share, fair_aging, priority_aging )
+        return tasks
+
+    # Give round quantum to users of group
+    async def GroupCredit(
+        self,
+        group_name: str,
+        user_ids:   Set[ int ]
+    ) -> None:
+        ok: bool = group_name in self.groups
+        if ok:
+            await self.groups[ group_name ].Credit( user_ids )
+
+    # Charge user for started task in group
+    async def GroupCharge(
+        self,
+        group_name: str,
+        user_id:    int
+    ) -> None:
+        ok: bool = group_name in self.groups
+        if ok:
+            await self.groups[ group_name ].Charge( user_id )
+
     # Get waiting tasks from group
     async def GroupGetTasks(
         self,
@@ -110,26 +190,99 @@ class QueueWaiting():
     ) -> QueueWaitingTask | None:
         ok: bool = group_name in self.groups
         if ok:
-            return await self.groups[ group_name ].AddTask( group_name, request )
+            task = await self.groups[ group_name ].AddTask( group_name, request )
+            if task is not None:
+                self.index[ task.task_id ] = task
+                if task.user_id not in self.users:
+                    self.users[ task.user_id ] = set()
+                self.users[ task.user_id ].add( task.task_id )
+            return task
         return None
 
-    # Get waiting task from group
+    # Check that task exists in queue
+    async def Exists(
+        self,
+        task_id: int
+    ) -> bool:
+        ok: bool = task_id in self.index
+        return ok
+
+    # Get waiting task from queue
+    async def GetTask(
+        self,
+        task_id: int
+    ) -> QueueWaitingTask | None:
+        ok: bool = task_id in self.index
+        if ok:
+            task: QueueWaitingTask = self.index[ task_id ]
+            return task
+        return None
+
+    # Get waiting tasks of user
+    async def UserGetTasks(
+        self,
+        user_id: int
+    ) -> List[ QueueWaitingTask ]:
+        ok: bool = user_id in self.users
+        if ok:
+            return [ self.index[ task_id ] for task_id in self.users[ user_id ] if task_id in self.index ]
+        return []
+
+    # Get task position in group and site ( by aged priority lane, then by adding order )
+    async def GetPosition(
+        self,
+        task_id:        int,
+        priority_aging: int = 0
+    ) -> Dict[ str, int ] | None:
+        task = await self.GetTask( task_id )
+        if task is None or task.group not in self.groups:
+            return None
+        return await self.groups[ task.group ].GetPosition( task, priority_aging )
+
+    # Remove waiting task from queue
     async def RemoveTask(
         self,
         task_id: int
     ) -> QueueWaitingTask | None:
-        for group_name in self.groups.keys():
-            task = await self.groups[ group_name ].GetTask( task_id )
-            if task is not None:
-                await self.groups[ group_name ].RemoveTask( task_id )
-                return task
+        ok: bool = task_id in self.index
+        if ok:
+            task: QueueWaitingTask = self.index.pop( task_id )
+            self.userRemoveTask( task.user_id, task_id )
+            group_ok: bool = task.group in self.groups
+            if group_ok:
+                await self.groups[ task.group ].RemoveTask( task_id )
+            return task
         return None
 
+    # Remove task from user tasks index
+    def userRemoveTask(
+        self,
+        user_id: int,
+        task_id: int
+    ) -> None:
+        ok: bool = user_id in self.users
+        if ok:
+            self.users[ user_id ].discard( task_id )
+            if len( self.users[ user_id ] ) == 0:
+                del self.users[ user_id ]
+
 class QueueWaitingGroup():
-    tasks: Dict[ int, QueueWaitingTask ] = {}
+    tasks:        Dict[ int, QueueWaitingTask ] = {}
+    sites:        Dict[ str, QueueWaitingSite ] = {}
+    fingerprints: Dict[ tuple, Set[ int ] ] = {}
+    users:        Dict[ int, int ] = {} # user_id -> waiting tasks count
+    deficit:      Dict[ int, float ] = {} # user_id -> deficit round robin counter
+    order:        OrderStatisticTree # tasks order keys for positions
+    priorities:   Dict[ int, int ] = {} # priority -> waiting tasks count
     
     def __init__( self ) -> None:
-        self.tasks = {}
+        self.tasks        = {}
+        self.sites        = {}
+        self.fingerprints = {}
+        self.users        = {}
+        self.deficit      = {}
+        self.order        = OrderStatisticTree()
+        self.priorities   = {}
 
     def __repr__( self ) -> str:
         return '<QueueWaitingGroup>'
@@ -137,6 +290,89 @@ class QueueWaitingGroup():
     # Return list of tasks
     async def GetTasks( self ) -> List[ QueueWaitingTask ]:
         return [ task for _, task in self.tasks.items() ]
+
+    # Check group has tasks
+    async def HasTasks( self ) -> bool:
+        return len( self.tasks ) > 0
+
+    # Return list of sites with tasks
+    async def GetSites( self ) -> List[ str ]:
+        return list( self.sites.keys() )
+
+    # Return first task of every user queue by site
+    async def GetSiteHeads(
+        self,
+        site_name:      str,
+        priority_aging: int = 0
+    ) -> List[ QueueWaitingTask ]:
+        ok: bool = site_name in self.sites
+        if ok:
+            return self.sites[ site_name ].GetHeads( priority_aging )
+        return []
+
+    # Order tasks by priority lane, then by users deficit ( deficit round robin with aging by waiting time ) or by adding time
+    async def Order(
+        self,
+        tasks:          List[ QueueWaitingTask ],
+        fair_share:     bool = False,
+        fair_aging:     int = 0,
+        priority_aging: int = 0
+    ) -> List[ QueueWaitingTask ]:
+        now = time.monotonic()
+
+        if not fair_share:
+            return sorted( tasks, key=lambda task: ( -task.Lane( priority_aging, now ), task.added ) )
+
+        def weight( task: QueueWaitingTask ) -> float:
+            _weight = self.deficit.get( task.user_id, 0 )
+            if fair_aging > 0:
+                _weight += ( now - task.added ) / fair_aging
+            return _weight
+
+        return sorted( tasks, key=lambda task: ( -task.Lane( priority_aging, now ), -weight( task ), task.added ) )
+
+    # Get task position in group and site, users deficits of fair share are not taken into account
+    async def GetPosition(
+        self,
+        task:           QueueWaitingTask,
+        priority_aging: int = 0
+    ) -> Dict[ str, int ]:
+        now = time.monotonic()
+        site_position = 0
+        site_total = 0
+        site_ok: bool = task.site in self.sites
+        if site_ok:
+            site = self.sites[ task.site ]
+            site_position = _aged_rank( site.order, site.priorities, task, priority_aging, now )
+            site_total = site.order.Len()
+        return {
+            'group_position': _aged_rank( self.order, self.priorities, task, priority_aging, now ),
+            'group_total':    self.order.Len(),
+            'site_position':  site_position,
+            'site_total':     site_total,
+        }
+
+    # Give quantum to users visited by scheduling round, users without waiting tasks have no deficit
+    async def Credit(
+        self,
+        user_ids: Set[ int ]
+    ) -> None:
+        for user_id in user_ids:
+            if user_id not in self.users:
+                continue
+            deficit = self.deficit.get( user_id, 0 ) + FAIR_QUANTUM
+            self.deficit[ user_id ] = min( deficit, FAIR_DEFICIT_LIMIT )
+
+    # Charge user deficit for started task
+    async def Charge(
+        self,
+        user_id: int
+    ) -> None:
+        if user_id not in self.users:
+            self.deficit.pop( user_id, None )
+            return
+        deficit = self.deficit.get( user_id, 0 ) - FAIR_QUANTUM
+        self.deficit[ user_id ] = max( deficit, -FAIR_DEFICIT_LIMIT )
     
     # Get task from group
     async def GetTask(
@@ -161,6 +397,20 @@ class QueueWaitingGroup():
                 request = request
             )
             self.tasks[ task.task_id ] = task
+
+            if task.site not in self.sites:
+                self.sites[ task.site ] = QueueWaitingSite()
+            self.sites[ task.site ].AddTask( task )
+
+            fingerprint = request.__fingerprint__()
+            if fingerprint not in self.fingerprints:
+                self.fingerprints[ fingerprint ] = set()
+            self.fingerprints[ fingerprint ].add( task.task_id )
+
+            self.users[ task.user_id ] = self.users.get( task.user_id, 0 ) + 1
+
+            self.order.Insert( task.order_key )
+            _count_priority( self.priorities, task.priority, 1 )
         
         ok: bool = request.task_id in self.tasks
         if ok:
@@ -175,34 +425,177 @@ class QueueWaitingGroup():
     ) -> bool:
         ok: bool = task_id in self.tasks
         if ok:
+            task: QueueWaitingTask = self.tasks[ task_id ]
             del self.tasks[ task_id ]
+
+            self.order.Remove( task.order_key )
+            _count_priority( self.priorities, task.priority, -1 )
+
+            site_ok: bool = task.site in self.sites
+            if site_ok:
+                self.sites[ task.site ].RemoveTask( task )
+                if self.sites[ task.site ].Empty():
+                    del self.sites[ task.site ]
+
+            fingerprint = task.request.__fingerprint__()
+            fingerprint_ok: bool = fingerprint in self.fingerprints
+            if fingerprint_ok:
+                self.fingerprints[ fingerprint ].discard( task_id )
+                if len( self.fingerprints[ fingerprint ] ) == 0:
+                    del self.fingerprints[ fingerprint ]
+
+            # forget user deficit when user has no more waiting tasks
+            user_tasks = self.users.get( task.user_id, 0 ) - 1
+            if user_tasks > 0:
+                self.users[ task.user_id ] = user_tasks
+            else:
+                self.users.pop( task.user_id, None )
+                self.deficit.pop( task.user_id, None )
         return True
 
+class QueueWaitingSite():
+    users:      Dict[ int, Dict[ int, OrderedDict[ int, QueueWaitingTask ] ] ] = {} # user_id -> priority -> FIFO of lane
+    order:      OrderStatisticTree # tasks order keys for positions
+    priorities: Dict[ int, int ] = {} # priority -> waiting tasks count
+
+    def __init__( self ) -> None:
+        self.users      = {}
+        self.order      = OrderStatisticTree()
+        self.priorities = {}
+
+    def __repr__( self ) -> str:
+        return '<QueueWaitingSite>'
+
+    # Check site has no tasks
+    def Empty( self ) -> bool:
+        return len( self.users ) == 0
+
+    # Return first task of every user queue ( highest priority lane, then oldest ),
+    # oldest task of lane ages fastest, so only lanes heads are compared
+    def GetHeads(
+        self,
+        priority_aging: int = 0
+    ) -> List[ QueueWaitingTask ]:
+        now = time.monotonic()
+        return [
+            max(
+                [ next( iter( lane.values() ) ) for lane in lanes.values() ],
+                key=lambda task: ( task.Lane( priority_aging, now ), -task.added )
+            )
+            for lanes in self.users.values()
+        ]
+
+    # Add task to the end of user queue lane
+    def AddTask(
+        self,
+        task: QueueWaitingTask
+    ) -> None:
+        if task.user_id not in self.users:
+            self.users[ task.user_id ] = {}
+        lanes = self.users[ task.user_id ]
+        if task.priority not in lanes:
+            lanes[ task.priority ] = OrderedDict()
+        lanes[ task.priority ][ task.task_id ] = task
+        self.order.Insert( task.order_key )
+        _count_priority( self.priorities, task.priority, 1 )
+
+    # Remove task from user queue lane
+    def RemoveTask(
+        self,
+        task: QueueWaitingTask
+    ) -> None:
+        lanes = self.users.get( task.user_id, {} )
+        ok: bool = task.priority in lanes and task.task_id in lanes[ task.priority ]
+        if ok:
+            del lanes[ task.priority ][ task.task_id ]
+            self.order.Remove( task.order_key )
+            _count_priority( self.priorities, task.priority, -1 )
+            if len( lanes[ task.priority ] ) == 0:
+                del lanes[ task.priority ]
+            if len( lanes ) == 0:
+                del self.users[ task.user_id ]
+
 class QueueWaitingTask():
-    task_id: int = 0
-    user_id: int = 0
-    site:    str = ""
-    group:   str = ""
-    url:     str = ""
-    request: dto.DownloadRequest
+    task_id:  int = 0
+    user_id:  int = 0
+    site:     str = ""
+    group:    str = ""
+    url:      str = ""
+    priority: int = 0
+    added:    float = 0 # monotonic time of adding to queue
+    request:  dto.DownloadRequest
 
     def __init__(
         self,
         group:   str,
         request: dto.DownloadRequest,
     ) -> None:
-        self.task_id = request.task_id
-        self.user_id = request.user_id
-        self.site    = request.site
-        self.group   = group
-        self.url     = request.url
-        self.request = request
+        self.task_id  = request.task_id
+        self.user_id  = request.user_id
+        self.site     = request.site
+        self.group    = group
+        self.url      = request.url
+        self.priority = request.priority or 0
+        self.added    = time.monotonic()
+        self.request  = request
+
+    # Key of task in queue order, higher priority first, then older
+    @property
+    def order_key( self ) -> tuple:
+        return ( -self.priority, self.added, self.task_id )
+
+    # Get priority lane, lower priorities raise by one lane every `aging` seconds of waiting
+    def Lane(
+        self,
+        aging: int = 0,
+        now:   float | None = None
+    ) -> int:
+        if aging <= 0:
+            return self.priority
+        if now is None:
+            now = time.monotonic()
+        return self.priority + int( ( now - self.added ) / aging )
 
     def __repr__( self ) -> str:
         return '<QueueWaitingTask '+str( {
-            'task_id': self.task_id,
-            'request': self.request,
-            'site':    self.site,
-            'url':     self.url,
-            'group':   self.group,
-        } )+'>'
\ No newline at end of file
+            'task_id':  self.task_id,
+            'request':  self.request,
+            'site':     self.site,
+            'url':      self.url,
+            'group':    self.group,
+            'priority': self.priority,
+        } )+'>'
+
+
+# Change waiting tasks count of priority
+def _count_priority(
+        priorities: Dict[ int, int ],
+        priority:   int,
+        change:     int
+    ) -> None:
+    count = priorities.get( priority, 0 ) + change
+    if count > 0:
+        priorities[ priority ] = count
+    else:
+        priorities.pop( priority, None )
+
+# Count of tasks started before task, lower priorities raise by one lane every `aging` seconds like in scheduler
+def _aged_rank(
+        order:      OrderStatisticTree,
+        priorities: Dict[ int, int ],
+        task:       QueueWaitingTask,
+        aging:      int,
+        now:        float
+    ) -> int:
+    if aging <= 0:
+        return order.Rank( task.order_key )
+
+    lane = task.Lane( aging, now )
+    rank = 0
+    for priority in priorities:
+        # lane of tasks with same priority only grows with age, so tasks before are the oldest ones
+        higher_lane = now - ( lane - priority + 1 ) * aging # added before this are in higher lane
+        same_lane = now - ( lane - priority ) * aging # added before this are in same lane at least
+        added = max( higher_lane, min( same_lane, task.added ) )
+        rank += order.Rank( ( -priority, added, -1 ) ) - order.Rank( ( -priority, -math.inf, -1 ) )
+    return rank